@@ -2,14 +2,21 @@ import os
 import uuid
 import duckdb
 import chromadb
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import CSVLoader
-from rapidfuzz import process, fuzz
+from rapidfuzz import process, fuzz, utils
+
+from DatabaseEngine.embeddings import EMBED_MODEL, RegistryEmbeddings
+from DatabaseEngine.entity_index import ENTITY_KINDS, entity_documents, scope_entity_ids, scope_filter, scope_where
+from DatabaseEngine.index_jobs import ensure_index, index_status
+from DatabaseEngine.value_dictionary import build_session_dictionary, fuzzy_lookup
+from DatabaseEngine.vector_store import MmapVectorStore
 
 
 BASE_PATH = "Data/sessions"
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "chroma" or "mmap" (DatabaseEngine.vector_store: memory-mapped matrix,
+# opens in milliseconds, no server process)
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
 
 
 def create_session():
@@ -25,15 +32,26 @@ def get_paths(session_id):
     return {
         "root": path,
         "duckdb": f"{path}/duckdb.duckdb",
-        "chroma": f"{path}/chroma"
+        "chroma": f"{path}/chroma",
+        "vectors": f"{path}/vectors"
     }
 
 
+def _index_dir(session_id):
+    paths = get_paths(session_id)
+    return paths["vectors"] if VECTOR_STORE == "mmap" else paths["chroma"]
+
+
 # ---------------------------------------------------------
 #                CREATE DUCKDB + CHROMA
 # ---------------------------------------------------------
 
-def create_databases(session_id, csv_path):
+def create_databases(session_id, csv_path, build_index=False):
+    """
+    Creates the session's DuckDB table. The Chroma index is built lazily
+    in the background on the first semantic_search (or right here, and
+    synchronously, with build_index=True); vector_db is None otherwise.
+    """
     paths = get_paths(session_id)
 
     # 1. Create DuckDB
@@ -42,20 +60,65 @@ def create_databases(session_id, csv_path):
         CREATE TABLE IF NOT EXISTS sample_table AS
         SELECT * FROM read_csv_auto('{csv_path}')
     """)
+    conn.execute("CHECKPOINT")
+    build_session_dictionary(session_id, BASE_PATH)
 
-    # 2. Create Chroma
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-    loader = CSVLoader(file_path=csv_path)
-    documents = loader.load()
+    # 2. Create Chroma (optional)
+    vector_db = None
+    if build_index:
+        build_vector_index(session_id)
+        vector_db = get_vector_store(session_id)
 
-    vector_db = Chroma.from_documents(
-        documents,
+    return conn, vector_db
+
+
+def build_vector_index(session_id):
+    """
+    (Re)build the session's vector index: one document per distinct
+    resource / project / manager / task, aggregated in DuckDB, instead of
+    one per CSV row. Returns the number of documents.
+    """
+    paths = get_paths(session_id)
+
+    conn = duckdb.connect(paths["duckdb"])
+    try:
+        ids, texts, metadatas = entity_documents(conn)
+    finally:
+        conn.close()
+
+    embeddings = RegistryEmbeddings(EMBED_MODEL)  # shared, loaded once per process
+
+    if VECTOR_STORE == "mmap":
+        MmapVectorStore.from_texts(texts, embeddings, metadatas=metadatas, ids=ids,
+                                   persist_directory=paths["vectors"])
+        return len(ids)
+
+    # Start from an empty collection so entities gone from the data go too
+    Chroma(
+        embedding_function=embeddings,
+        persist_directory=paths["chroma"],
+        collection_name="info_collection"
+    ).delete_collection()
+
+    Chroma.from_texts(
+        texts,
         embeddings,
+        metadatas=metadatas,
+        ids=ids,
         persist_directory=paths["chroma"],
         collection_name="info_collection"
     )  # auto-persist
 
-    return conn, vector_db
+    return len(ids)
+
+
+def ensure_vector_index(session_id):
+    """Start a background index build if needed; returns the build status."""
+    return ensure_index(f"session:{session_id}", lambda: build_vector_index(session_id), _index_dir(session_id))
+
+
+def vector_index_status(session_id):
+    return index_status(f"session:{session_id}", _index_dir(session_id))
 
 
 # ---------------------------------------------------------
@@ -69,7 +132,7 @@ def get_duckdb(session_id):
 
 def get_chroma(session_id):
     paths = get_paths(session_id)
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    embeddings = RegistryEmbeddings(EMBED_MODEL)  # shared, loaded once per process
 
     return Chroma(
         embedding_function=embeddings,
@@ -78,30 +141,135 @@ def get_chroma(session_id):
     )
 
 
+def get_vector_store(session_id):
+    """The session's vector index in the VECTOR_STORE backend (same search methods)."""
+    if VECTOR_STORE == "mmap":
+        return MmapVectorStore(get_paths(session_id)["vectors"], RegistryEmbeddings(EMBED_MODEL))
+    return get_chroma(session_id)
+
+
 # ---------------------------------------------------------
 #                FUZZY MATCHING ENGINE
 # ---------------------------------------------------------
 
 def find_best_match(session_id, column_name, query):
     """
-    Returns the closest matching value from the CSV loaded into DuckDB.
+    Returns the closest matching value from the CSV loaded into DuckDB
+    (matched against the session's distinct values, not every row).
     """
-    conn = get_duckdb(session_id)
-
-    # fetch column values
-    result = conn.execute(f"SELECT \"{column_name}\" FROM sample_table").fetchall()
-    values = [r[0] for r in result]
+    matches = fuzzy_lookup(session_id, column_name, query, limit=1, base_path=BASE_PATH)
+    match, score = matches[0] if matches else (None, 0)
 
-    # fuzzy match
-    match, score, idx = process.extractOne(
-        query,
-        values,
-        scorer=fuzz.WRatio
-    )
-    
     # for debug purposes, we can return more info
     return {
         "input": query,
         "best_match": match,
         "score": score
     }
+
+
+# ---------------------------------------------------------
+#        SEMANTIC SEARCH (fuzzy until the index is ready)
+# ---------------------------------------------------------
+FUZZY_COLUMNS = ["Resource Name", "Resource ID", "Project Name", "Project ID",
+                 "Project Manager", "Project Task Name"]
+
+# Entity kind each fuzzy column identifies
+FUZZY_KINDS = {"Resource Name": "resource", "Resource ID": "resource", "Project Name": "project",
+               "Project ID": "project", "Project Manager": "manager", "Project Task Name": "task"}
+
+
+def _scoped_values(session_id, filters):
+    """Distinct FUZZY_COLUMNS values among the rows matching `filters`."""
+    conn = get_duckdb(session_id)
+    try:
+        where, params = scope_where(conn, filters)
+        return {
+            column: [v for v, in conn.execute(
+                f'SELECT DISTINCT "{column}"::VARCHAR FROM sample_table WHERE {where} AND "{column}" IS NOT NULL',
+                params).fetchall()]
+            for column in FUZZY_COLUMNS
+        }
+    finally:
+        conn.close()
+
+
+def fuzzy_entity_search(session_id, query, k=5, filters=None, kinds=None):
+    """Best rapidfuzz matches over the session's entity columns (optionally scoped)."""
+    scoped = _scoped_values(session_id, filters) if filters else None
+
+    hits = []
+    for column in FUZZY_COLUMNS:
+        if kinds and FUZZY_KINDS[column] not in kinds:
+            continue
+        if scoped is None:
+            matches = fuzzy_lookup(session_id, column, query, limit=k, base_path=BASE_PATH)
+        else:
+            matches = [(m, score) for m, score, _ in
+                       process.extract(query, scoped[column], scorer=fuzz.WRatio,
+                                       processor=utils.default_process, limit=k)]
+        for match, score in matches:
+            hits.append({"text": match, "meta": {"column": column, column: match}, "score": score})
+
+    return sorted(hits, key=lambda h: h["score"], reverse=True)[:k]
+
+
+def semantic_search(session_id, query, k=5, filters=None, kinds=None):
+    """
+    Vector search over the session's entities. The first call starts the
+    index build in the background; until it is ready the results come from
+    fuzzy matching.
+
+    filters: {timesheet column: value or list}, e.g. {"Project ID": "P1",
+             "Financial Period (Posted Date)": ["Apr-25"]}; only entities
+             with matching rows are searched (pushed into the vector
+             store's filter, not applied to the top-k afterwards).
+    kinds:   entity kinds to search ("resource", "project", "manager", "task").
+
+    Returns:
+        {
+            "source": "vector" or "fuzzy",
+            "status": index build status,
+            "hits": [{"text", "meta", "score"}]   vector: distance (lower is closer),
+                                                  fuzzy: 0-100 (higher is closer)
+        }
+    """
+    status = ensure_vector_index(session_id)
+
+    if status["state"] == "ready":
+        where = None
+        if filters:
+            conn = get_duckdb(session_id)
+            try:
+                ids = scope_entity_ids(conn, filters, kinds=kinds or ENTITY_KINDS)
+            finally:
+                conn.close()
+            if not ids:
+                return {"source": "vector", "status": status, "hits": []}
+            where = scope_filter(ids)
+        elif kinds:
+            where = {"kind": {"$in": list(kinds)}}
+
+        results = get_vector_store(session_id).similarity_search_with_score(query, k=k, filter=where)
+        hits = [{"text": doc.page_content, "meta": doc.metadata, "score": score} for doc, score in results]
+        return {"source": "vector", "status": status, "hits": hits}
+
+    return {"source": "fuzzy", "status": status,
+            "hits": fuzzy_entity_search(session_id, query, k, filters, kinds)}
+
+
+def best_entity_value(session_id, query, kind, column, filters=None):
+    """
+    The `column` value of the entity of `kind` closest to `query`, via
+    semantic_search (fuzzy until the index is ready), with a score label;
+    (None, None) when nothing matches.
+    """
+    found = semantic_search(session_id, query, k=5, filters=filters, kinds=(kind,))
+    for hit in found["hits"]:
+        # Fuzzy hits on an ID column don't carry the name column
+        value = hit["meta"].get(column)
+        if value:
+            if found["source"] == "vector":
+                return value, f"distance={hit['score']:.3f}"
+            return value, f"score={hit['score']:.0f}"
+    return None, None
@@ -0,0 +1,183 @@
+"""
+Content-addressed on-disk embedding cache, shared by every session.
+
+Per model, under EMBED_CACHE_DIR/<model>/:
+
+    vectors.f16   float16 matrix, one row per cached text (memory-mapped)
+    keys.txt      sha1 of the normalised text, line i = row i
+    meta.json     model name and vector dimension
+
+Rows are only ever appended, so a new session re-uploading mostly the same
+resources and projects encodes just the texts it hasn't seen before.
+Several processes (app workers) can share a cache: appends hold an
+exclusive lock on `lock` and first re-read what the others have written.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+EMBED_CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", os.path.join("Data", "embedding_cache"))
+
+
+def normalize_text(text):
+    """Whitespace differences don't change the cache key."""
+    return " ".join(str(text).split())
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock on `path` (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 s; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, dimension, cache_dir=EMBED_CACHE_DIR):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.path = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+
+        self.vectors_path = os.path.join(self.path, "vectors.f16")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+        self.lock_path = os.path.join(self.path, "lock")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dimension"] != dimension:
+                raise ValueError(
+                    f"Embedding cache at {self.path} holds {meta['dimension']}-d vectors, "
+                    f"model {model_name} produces {dimension}-d."
+                )
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"model": model_name, "dimension": dimension}, f)
+
+        self._load()
+
+    def _load(self):
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                keys = [line.strip() for line in f if line.strip()]
+
+        row_bytes = self.dimension * 2
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        # An interrupted append can leave vectors without keys (or the
+        # reverse); only rows present in both are trusted
+        self.rows = min(len(keys), rows)
+        self.keys_consistent = len(keys) == self.rows
+        self.index = {key: row for row, key in enumerate(keys[:self.rows])}
+        self._map()
+
+    def _map(self):
+        self.vectors = (
+            np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(self.rows, self.dimension))
+            if self.rows else np.zeros((0, self.dimension), dtype=np.float16)
+        )
+
+    def __len__(self):
+        return self.rows
+
+    def _append(self, keys, vectors):
+        """Append rows; the caller holds the file lock and has just called _load()."""
+        # Release the mapping first; Windows can't extend a mapped file
+        self.vectors = None
+
+        with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+            # Overwrite any partial rows left by an interrupted append
+            f.seek(self.rows * self.dimension * 2)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+            f.truncate()
+        for key in keys:
+            self.index[key] = self.rows
+            self.rows += 1
+
+        if self.keys_consistent:
+            with open(self.keys_path, "a") as f:
+                f.writelines(key + "\n" for key in keys)
+        else:
+            # Drop keys whose vectors never made it to disk
+            with open(self.keys_path, "w") as f:
+                f.writelines(key + "\n" for key in sorted(self.index, key=self.index.get))
+            self.keys_consistent = True
+        self._map()
+
+    def get_or_encode(self, texts, encode):
+        """
+        float32 (len(texts), dimension) vectors for `texts`; only the texts
+        not in the cache are passed to encode(list_of_texts).
+        """
+        texts = list(texts)
+        keys = [text_key(t) for t in texts]
+
+        with self.lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.index and key not in missing:
+                    missing[key] = text
+
+            if missing:
+                encoded = np.asarray(encode(list(missing.values())), dtype=np.float32)
+                with file_lock(self.lock_path):
+                    # Another process may have appended since we last read
+                    # the files: pick up its rows, append after them, and
+                    # skip texts it has already encoded
+                    self.vectors = None
+                    self._load()
+                    new = [i for i, key in enumerate(missing) if key not in self.index]
+                    if new:
+                        missing_keys = list(missing)
+                        self._append([missing_keys[i] for i in new], encoded[new])
+
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+            rows = [self.index[key] for key in keys]
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def stats(self):
+        return {
+            "cached_texts": self.rows,
+            "cache_mb": round(self.rows * self.dimension * 2 / 2**20, 1),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+        }
@@ -0,0 +1,240 @@
+"""
+Process-wide embedding model registry.
+
+Each model is loaded once per process, on first use, and shared by
+DB_Handler (LangChain/Chroma), main.ChromaWrapper and the prompt/intent
+features. Loading MiniLM takes seconds and ~90 MB; after the first
+session every later one reuses the loaded weights.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from DatabaseEngine.embedding_cache import EmbeddingCache, normalize_text
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    Embeddings = object
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime,
+# see onnx_embeddings.py)
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Texts per forward pass, and torch intra-op threads (process-wide; unset
+# keeps torch's default of one per core)
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+EMBED_THREADS = os.environ.get("EMBED_THREADS")
+
+# Recent query vectors kept in memory per model (typeahead repeats lookups)
+QUERY_CACHE_SIZE = int(os.environ.get("EMBED_QUERY_CACHE_SIZE", 1024))
+
+
+def canonical_name(model_name):
+    """"all-MiniLM-L6-v2" and "sentence-transformers/all-MiniLM-L6-v2" are one model."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+class EmbeddingModel:
+    """sentence-transformers (PyTorch) backend."""
+    backend = "torch"
+
+    def __init__(self, model_name, device=None):
+        self.name = model_name
+        start = time.perf_counter()
+        self._load(device)
+        self.load_s = time.perf_counter() - start
+
+        self.texts_encoded = 0
+        self.encode_s = 0.0
+        self.stats_lock = threading.Lock()
+        self._cache = None
+        self._query_cache = OrderedDict()
+        self.query_hits = 0
+        self.query_misses = 0
+
+    def _load(self, device):
+        """Load the weights; sets self.dimension and self.memory_bytes."""
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is required for embeddings.")
+
+        self.model = SentenceTransformer(self.name, device=device)
+        self.memory_bytes = sum(
+            t.numel() * t.element_size()
+            for t in list(self.model.parameters()) + list(self.model.buffers())
+        )
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _infer(self, texts, batch_size, normalize):
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    @property
+    def cache(self):
+        """The on-disk cache for this model, opened on first use."""
+        with self.stats_lock:
+            if self._cache is None:
+                # Other backends' vectors differ slightly; keep them apart
+                cache_name = self.name if self.backend == "torch" else f"{self.name}@{self.backend}"
+                self._cache = EmbeddingCache(cache_name, self.dimension)
+        return self._cache
+
+    def _encode(self, texts, batch_size, normalize):
+        start = time.perf_counter()
+        vectors = self._infer(texts, batch_size or EMBED_BATCH_SIZE, normalize)
+        with self.stats_lock:
+            self.texts_encoded += len(texts)
+            self.encode_s += time.perf_counter() - start
+        return vectors.astype(np.float32, copy=False)
+
+    def encode(self, texts, batch_size=None, normalize=True, cache=False):
+        """
+        float32 array of shape (len(texts), dimension).
+
+        cache=True serves texts seen before (by any session) from the
+        on-disk cache and encodes only the rest. Meant for documents;
+        one-off query texts would just grow the cache.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        if not cache:
+            return self._encode(texts, batch_size, normalize)
+
+        # The cache holds raw vectors; normalisation is applied on the way out
+        vectors = self.cache.get_or_encode(texts, lambda missing: self._encode(missing, batch_size, False))
+        if normalize:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def encode_queries(self, texts, normalize=True):
+        """
+        Like encode(), for search queries: recent queries are served from
+        an in-memory LRU cache and the rest are encoded in one batch.
+        """
+        keys = [(normalize_text(t), normalize) for t in texts]
+        found = {}
+        with self.stats_lock:
+            for key in keys:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                    found[key] = self._query_cache[key]
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+
+        if missing:
+            vectors = self._encode([text for text, _ in missing], None, normalize)
+            found.update(zip(missing, vectors))
+            with self.stats_lock:
+                for key, vector in zip(missing, vectors):
+                    self._query_cache[key] = vector
+                while len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        with self.stats_lock:
+            self.query_hits += len(keys) - len(missing)
+            self.query_misses += len(missing)
+
+        if not keys:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self):
+        cache_stats = self._cache.stats() if self._cache is not None else {}
+        with self.stats_lock:
+            return {
+                "model": self.name,
+                "backend": self.backend,
+                "dimension": self.dimension,
+                "load_s": round(self.load_s, 2),
+                "memory_mb": round(self.memory_bytes / 2**20, 1),
+                "texts_encoded": self.texts_encoded,
+                "texts_per_s": round(self.texts_encoded / self.encode_s, 1) if self.encode_s else None,
+                "query_cache_hits": self.query_hits,
+                "query_cache_misses": self.query_misses,
+                **cache_stats,
+            }
+
+
+# ---------------------------------------------------------
+#                       REGISTRY
+# ---------------------------------------------------------
+_models = {}
+_load_locks = {}
+_registry_lock = threading.Lock()
+_threads_set = False
+
+
+def get_model(model_name=EMBED_MODEL, backend=None):
+    """
+    The shared model for `model_name` on `backend` (default EMBED_BACKEND),
+    loaded on first call.
+    """
+    global _threads_set
+    backend = backend or EMBED_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Use one of {BACKENDS}.")
+    key = (canonical_name(model_name), backend)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # One loader per model; concurrent callers wait for it instead of
+    # loading a second copy
+    with load_lock:
+        if key not in _models:
+            if backend == "torch":
+                if EMBED_THREADS and not _threads_set:
+                    import torch
+                    torch.set_num_threads(int(EMBED_THREADS))
+                    _threads_set = True
+                _models[key] = EmbeddingModel(key[0])
+            else:
+                from DatabaseEngine.onnx_embeddings import OnnxEmbeddingModel
+                _models[key] = OnnxEmbeddingModel(key[0], quantized=backend == "onnx-int8")
+    return _models[key]
+
+
+def model_stats():
+    """Load time, memory and throughput of every loaded model."""
+    return [model.stats() for model in list(_models.values())]
+
+
+class RegistryEmbeddings(Embeddings):
+    """
+    LangChain Embeddings backed by the registry, for Chroma.from_documents
+    and Chroma(embedding_function=...). Unnormalised by default, like the
+    HuggingFaceEmbeddings it replaces, so existing indexes stay comparable.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, batch_size=None, normalize=False):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+    def embed_documents(self, texts):
+        model = get_model(self.model_name)
+        return model.encode(texts, batch_size=self.batch_size, normalize=self.normalize, cache=True).tolist()
+
+    def embed_query(self, text):
+        return get_model(self.model_name).encode_queries([text], normalize=self.normalize)[0].tolist()
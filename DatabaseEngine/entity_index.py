@@ -0,0 +1,176 @@
+"""
+Entity-level documents for the vector index.
+
+A timesheet export has one row per resource, task and day, so indexing
+rows stores thousands of near-identical vectors per person. Instead the
+distinct resources, projects, managers and tasks are derived in DuckDB,
+with aggregated metadata, and only those are embedded.
+"""
+
+# Key of each entity kind, as an expression over the timesheet columns
+ENTITY_KEYS = {
+    "resource": """concat_ws('|', "Resource ID", "Resource Name")""",
+    "project": """concat_ws('|', "Project ID", "Project Name")""",
+    "manager": '"Project Manager"',
+    "task": """concat_ws('|', "Project ID", "Project Task ID", "Project Task Name")""",
+}
+
+# Each query returns one row per entity: "entity_id", "text", then the
+# metadata columns. {table} is the timesheet table (or a registered view),
+# {key} the kind's ENTITY_KEYS expression.
+ENTITY_QUERIES = {
+    "resource": """
+        WITH pairs AS (
+            SELECT "Resource ID", "Resource Name", "Project ID", "Project Name",
+                   ANY_VALUE("Resource Primary Role") AS role,
+                   coalesce(SUM(TRY_CAST("Posted Hours" AS DOUBLE)), 0) AS hours
+            FROM {table}
+            GROUP BY "Resource ID", "Resource Name", "Project ID", "Project Name"
+        )
+        SELECT
+            {key} AS entity_id,
+            'Resource:' || coalesce("Resource Name"::VARCHAR, '') || ' | ResourceID:' || coalesce("Resource ID"::VARCHAR, '')
+                || ' | Role:' || coalesce(ANY_VALUE(role)::VARCHAR, '')
+                || ' | Projects:' || array_to_string(list_slice(list("Project Name" ORDER BY hours DESC), 1, 5), '; ')
+                AS text,
+            "Resource ID",
+            "Resource Name",
+            -- main project (most hours), for callers that need a single one
+            arg_max("Project ID", hours) AS "Project ID",
+            arg_max("Project Name", hours) AS "Project Name",
+            COUNT(*) AS project_count,
+            SUM(hours) AS total_hours
+        FROM pairs
+        GROUP BY "Resource ID", "Resource Name"
+    """,
+    "project": """
+        SELECT
+            {key} AS entity_id,
+            'Project:' || coalesce("Project Name"::VARCHAR, '') || ' | ProjectID:' || coalesce("Project ID"::VARCHAR, '')
+                || ' | Manager:' || coalesce(ANY_VALUE("Project Manager")::VARCHAR, '')
+                || ' | Class:' || coalesce(ANY_VALUE("Project Class")::VARCHAR, '')
+                AS text,
+            "Project ID",
+            "Project Name",
+            ANY_VALUE("Project Manager") AS "Project Manager",
+            COUNT(DISTINCT "Resource ID") AS resource_count,
+            coalesce(SUM(TRY_CAST("Posted Hours" AS DOUBLE)), 0) AS total_hours
+        FROM {table}
+        GROUP BY "Project ID", "Project Name"
+    """,
+    "manager": """
+        SELECT
+            {key} AS entity_id,
+            'Manager:' || "Project Manager"::VARCHAR
+                || ' | Projects:' || array_to_string(list_slice(list(DISTINCT "Project Name"), 1, 5), '; ')
+                AS text,
+            "Project Manager",
+            COUNT(DISTINCT "Project ID") AS project_count
+        FROM {table}
+        WHERE "Project Manager" IS NOT NULL
+        GROUP BY "Project Manager"
+    """,
+    "task": """
+        SELECT
+            {key} AS entity_id,
+            'Task:' || coalesce("Project Task Name"::VARCHAR, '') || ' | TaskID:' || coalesce("Project Task ID"::VARCHAR, '')
+                || ' | Project:' || coalesce("Project Name"::VARCHAR, '')
+                AS text,
+            "Project Task ID",
+            "Project Task Name",
+            "Project ID",
+            "Project Name",
+            coalesce(SUM(TRY_CAST("Posted Hours" AS DOUBLE)), 0) AS total_hours
+        FROM {table}
+        GROUP BY "Project ID", "Project Name", "Project Task ID", "Project Task Name"
+    """,
+}
+
+ENTITY_KINDS = tuple(ENTITY_QUERIES)
+
+
+def _metadata_value(value):
+    """Vector stores accept only str/int/float/bool metadata."""
+    if value is None:
+        return ""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return float(value) if hasattr(value, "__float__") else str(value)
+
+
+def entity_documents(conn, table="sample_table", kinds=ENTITY_KINDS):
+    """
+    One document per distinct entity.
+
+    Returns:
+        (ids, texts, metadatas) with ids like "resource:<Resource ID>|<Resource Name>"
+        and metadata holding the entity's columns, aggregates, "kind" and
+        "entity_id" (the document id, so vector stores can filter on it).
+    """
+    ids, texts, metadatas = [], [], []
+
+    for kind in kinds:
+        result = conn.execute(ENTITY_QUERIES[kind].format(table=table, key=ENTITY_KEYS[kind]))
+        columns = [col[0] for col in result.description]
+
+        for row in result.fetchall():
+            record = dict(zip(columns, row))
+            entity_id = record.pop("entity_id")
+            text = record.pop("text")
+            if not entity_id or not text:
+                continue
+
+            metadata = {name: _metadata_value(value) for name, value in record.items()}
+            metadata["kind"] = kind
+            metadata["entity_id"] = f"{kind}:{entity_id}"
+
+            ids.append(f"{kind}:{entity_id}")
+            texts.append(text)
+            metadatas.append(metadata)
+
+    return ids, texts, metadatas
+
+
+# ---------------------------------------------------------
+#                  SCOPED SEARCH FILTERS
+# ---------------------------------------------------------
+def scope_where(conn, filters, table="sample_table"):
+    """
+    SQL condition (and params) selecting the timesheet rows matching
+    `filters`, {column: value or list of values}; values compare as text.
+    """
+    columns = {col[0] for col in conn.execute(f"SELECT * FROM {table} LIMIT 0").description}
+
+    clauses, params = [], []
+    for column, value in filters.items():
+        if column not in columns:
+            raise ValueError(f"Unknown filter column '{column}'.")
+        values = [value] if isinstance(value, (str, int, float)) else list(value)
+        if not values:
+            return "FALSE", []
+        clauses.append(f'"{column}"::VARCHAR IN ({", ".join("?" * len(values))})')
+        params.extend(str(v) for v in values)
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def scope_entity_ids(conn, filters, table="sample_table", kinds=ENTITY_KINDS):
+    """
+    Ids (as in entity_documents) of the entities with timesheet rows
+    matching `filters`, e.g. {"Project ID": "P1", "Financial Period (Posted Date)": ["Apr-25", "May-25"]}.
+    Works for row-level columns the entity documents don't carry (a
+    resource's period or non-main projects).
+    """
+    where, params = scope_where(conn, filters, table)
+
+    ids = []
+    for kind in kinds:
+        rows = conn.execute(
+            f"SELECT DISTINCT {ENTITY_KEYS[kind]} FROM {table} WHERE {where}", params
+        ).fetchall()
+        ids.extend(f"{kind}:{key}" for key, in rows if key)
+    return ids
+
+
+def scope_filter(ids):
+    """Vector store `filter` (Chroma `where` syntax) restricting results to `ids`."""
+    return {"entity_id": {"$in": list(ids)}}
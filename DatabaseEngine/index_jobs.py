@@ -0,0 +1,155 @@
+"""
+Background vector index builds with status tracking.
+
+Uploads only create the DuckDB table. A vector index is built in a
+background thread the first time something asks for semantic search, so
+sessions that never use it never pay for embeddings. Until the build
+finishes, callers fall back to fuzzy matching.
+
+Status per index (also written to <index dir>/index_status.json so a
+restarted app knows which indexes are ready):
+
+    {"state": "missing" | "building" | "ready" | "failed" | "stale",
+     "started": iso time, "finished": iso time, "seconds": float,
+     "documents": int, "error": str, "schema": int}
+
+An index built by an older version of the code (a different "schema",
+see INDEX_SCHEMA_VERSION) is reported as stale, so ensure_index rebuilds it.
+A failed build is only retried INDEX_RETRY_S after it finished, or sooner
+after invalidate() or ensure_index(..., retry=True).
+"""
+import os
+import json
+import time
+import datetime
+import threading
+
+STATUS_FILE = "index_status.json"
+
+# Bump whenever indexed documents or their metadata change shape
+# (2: entity_id metadata, needed by scoped search)
+INDEX_SCHEMA_VERSION = 2
+
+# Seconds before a failed build is retried automatically
+INDEX_RETRY_S = float(os.environ.get("INDEX_RETRY_S", 300))
+
+_status = {}
+_threads = {}
+_invalidated = set()
+_lock = threading.Lock()
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _write(index_dir, status):
+    if not index_dir:
+        return
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, STATUS_FILE), "w") as f:
+        json.dump(dict(status, schema=INDEX_SCHEMA_VERSION), f)
+
+
+def index_status(key, index_dir=None):
+    """Current status of the index `key` (see module docstring)."""
+    with _lock:
+        if key in _status:
+            return dict(_status[key])
+
+    path = os.path.join(index_dir, STATUS_FILE) if index_dir else None
+    if path and os.path.exists(path):
+        with open(path) as f:
+            status = json.load(f)
+        # A build that was running when the app stopped never finished
+        if status.get("state") == "building":
+            status = {"state": "missing"}
+        elif status.get("state") == "ready" and status.get("schema") != INDEX_SCHEMA_VERSION:
+            status = dict(status, state="stale")
+        with _lock:
+            _status.setdefault(key, status)
+        return dict(status)
+
+    return {"state": "missing"}
+
+
+def is_ready(key, index_dir=None):
+    return index_status(key, index_dir)["state"] == "ready"
+
+
+def _backing_off(status):
+    """A failed build whose retry delay hasn't passed yet."""
+    if status["state"] != "failed" or "finished" not in status:
+        return False
+    finished = datetime.datetime.fromisoformat(status["finished"])
+    return (datetime.datetime.now() - finished).total_seconds() < INDEX_RETRY_S
+
+
+def _run(key, build, index_dir):
+    start = time.perf_counter()
+    try:
+        documents = build()
+        status = {"state": "ready", "documents": documents}
+    except Exception as e:
+        status = {"state": "failed", "error": f"{type(e).__name__}: {e}"}
+
+    with _lock:
+        status.update(
+            started=_status[key]["started"],
+            finished=_now(),
+            seconds=round(time.perf_counter() - start, 2),
+        )
+        # Data changed while building; the index is already out of date
+        if key in _invalidated and status["state"] == "ready":
+            status["state"] = "stale"
+        _invalidated.discard(key)
+        _status[key] = status
+        # Written before the thread is dropped, so wait() returns with the
+        # status already on disk
+        _write(index_dir, status)
+        _threads.pop(key, None)
+
+
+def ensure_index(key, build, index_dir=None, retry=False):
+    """
+    Start build() in the background unless the index is ready or already
+    building. build() returns the number of documents indexed.
+    A recent failure is returned as is (every caller would otherwise
+    restart a build that keeps failing) unless `retry` is set.
+    Returns the status after the call.
+    """
+    status = index_status(key, index_dir)
+    if status["state"] in ("ready", "building") or (not retry and _backing_off(status)):
+        return status
+
+    with _lock:
+        if key in _threads:
+            return dict(_status[key])
+        status = {"state": "building", "started": _now()}
+        _status[key] = status
+        thread = threading.Thread(target=_run, args=(key, build, index_dir), daemon=True,
+                                  name=f"index-build-{key}")
+        _threads[key] = thread
+    _write(index_dir, status)
+    thread.start()
+    return dict(status)
+
+
+def invalidate(key, index_dir=None):
+    """Mark the index out of date (e.g. new data was uploaded)."""
+    with _lock:
+        if key in _threads:
+            _invalidated.add(key)
+            return
+        status = {"state": "stale", "finished": _now()}
+        _status[key] = status
+    _write(index_dir, status)
+
+
+def wait(key, timeout=None):
+    """Block until a running build of `key` finishes (for scripts and tests)."""
+    with _lock:
+        thread = _threads.get(key)
+    if thread is not None:
+        thread.join(timeout)
+    return index_status(key)
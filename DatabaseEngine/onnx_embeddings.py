@@ -0,0 +1,257 @@
+"""
+ONNX Runtime embedding backend (EMBED_BACKEND=onnx or onnx-int8).
+
+The sentence-transformers model is exported once to ONNX_DIR/<model>/
+(model.onnx, plus model-int8.onnx with dynamically quantized weights),
+together with its tokenizer and pooling settings. At run time only
+onnxruntime and the tokenizer are used: texts are length-sorted into
+batches, and a small thread pool tokenizes one batch while another runs
+through the session.
+
+    python -m DatabaseEngine.onnx_embeddings
+
+exports the default model if needed, checks both ONNX variants against
+the PyTorch path and prints sentences/sec per backend.
+"""
+import os
+import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from DatabaseEngine.embeddings import (
+    EMBED_MODEL, EMBED_THREADS, BACKENDS, EmbeddingModel, canonical_name, get_model,
+)
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:
+    AutoTokenizer = None
+
+ONNX_DIR = os.environ.get("ONNX_DIR", os.path.join("Data", "onnx_models"))
+
+# Batches in flight at once: one tokenizing while another runs inference
+PIPELINE_WORKERS = int(os.environ.get("EMBED_PIPELINE_WORKERS", 2))
+
+# Cosine similarity to the PyTorch vectors each backend must reach
+MIN_COSINE = {"onnx": 0.9999, "onnx-int8": 0.99}
+
+
+def export_dir(model_name, onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, re.sub(r"[^\w.-]+", "_", canonical_name(model_name)))
+
+
+# ---------------------------------------------------------
+#                       EXPORT
+# ---------------------------------------------------------
+def export_onnx(model_name=EMBED_MODEL, onnx_dir=ONNX_DIR, quantize=True):
+    """
+    Export the transformer of a sentence-transformers model to ONNX (and,
+    with quantize, an int8 copy). Needs torch and sentence-transformers;
+    serving the exported model doesn't.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    out = export_dir(model_name, onnx_dir)
+    os.makedirs(out, exist_ok=True)
+
+    st_model = SentenceTransformer(canonical_name(model_name), device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    pooling = next(m for m in st_model if isinstance(m, models.Pooling))
+
+    dummy = st_model.tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(dummy.keys())
+
+    class LastHidden(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHidden(transformer),
+            tuple(dummy[name] for name in input_names),
+            os.path.join(out, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    st_model.tokenizer.save_pretrained(out)
+    with open(os.path.join(out, "embedding_config.json"), "w") as f:
+        json.dump({
+            "model": canonical_name(model_name),
+            "inputs": input_names,
+            # get_pooling_mode_str() up to sentence-transformers 5.x
+            "pooling": (pooling.get_pooling_mode_str() if hasattr(pooling, "get_pooling_mode_str")
+                        else pooling.pooling_mode),
+            "normalize": any(isinstance(m, models.Normalize) for m in st_model),
+            "max_seq_length": st_model.max_seq_length,
+            "dimension": st_model.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(
+            os.path.join(out, "model.onnx"),
+            os.path.join(out, "model-int8.onnx"),
+            weight_type=QuantType.QInt8,
+        )
+
+    return out
+
+
+# ---------------------------------------------------------
+#                       BACKEND
+# ---------------------------------------------------------
+class OnnxEmbeddingModel(EmbeddingModel):
+    """Same interface as EmbeddingModel, served by ONNX Runtime."""
+
+    def __init__(self, model_name, quantized=False, onnx_dir=ONNX_DIR, workers=PIPELINE_WORKERS):
+        self.quantized = quantized
+        self.onnx_dir = onnx_dir
+        self.workers = max(1, workers)
+        self.backend = "onnx-int8" if quantized else "onnx"
+        super().__init__(model_name)
+
+    def _load(self, device):
+        if ort is None or AutoTokenizer is None:
+            raise ImportError("onnxruntime and transformers are required for the ONNX embedding backend.")
+
+        path = export_dir(self.name, self.onnx_dir)
+        model_file = os.path.join(path, "model-int8.onnx" if self.quantized else "model.onnx")
+        if not os.path.exists(model_file):
+            export_onnx(self.name, self.onnx_dir, quantize=self.quantized)
+
+        with open(os.path.join(path, "embedding_config.json")) as f:
+            self.config = json.load(f)
+        if self.config["pooling"] not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling '{self.config['pooling']}' for the ONNX backend.")
+
+        # Split the thread budget across the batches running concurrently
+        options = ort.SessionOptions()
+        if EMBED_THREADS:
+            options.intra_op_num_threads = max(1, int(EMBED_THREADS) // self.workers)
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        self.memory_bytes = os.path.getsize(model_file)
+        self.dimension = self.config["dimension"]
+
+    def _pool(self, hidden, mask):
+        if self.config["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def _run_batch(self, batch):
+        encoded = self.tokenizer(
+            batch,
+            padding=True,
+            truncation=True,
+            max_length=self.config["max_seq_length"],
+            return_tensors="np",
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.config["inputs"]}
+        hidden = self.session.run(None, feeds)[0]
+        return self._pool(hidden, encoded["attention_mask"])
+
+    def _infer(self, texts, batch_size, normalize):
+        # Similar lengths per batch means less padding to run through
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        results = self.pool.map(self._run_batch, [[texts[i] for i in idx] for idx in batches])
+        for idx, batch_vectors in zip(batches, results):
+            vectors[idx] = batch_vectors
+
+        # The PyTorch path applies the model's own Normalize module regardless
+        if normalize or self.config["normalize"]:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+
+# ---------------------------------------------------------
+#               EQUIVALENCE CHECK / BENCHMARK
+# ---------------------------------------------------------
+SAMPLE_TEXTS = [
+    "Resource:Ramya Sri | ResourceID:R1021 | Role:Developer | Projects:Apollo Revamp",
+    "Project:Apollo Revamp | ProjectID:91HYFY25_RASESI_NOA | Manager:Sandhya | Class:Billable",
+    "Manager:Sandhya | Projects:Apollo Revamp; Zeus Billing",
+    "Task:Data migration | TaskID:T-118 | Project:Zeus Billing",
+    "Total posted hours per resource in November",
+    "who logged hours late",
+    "a",
+    "Resource:John Carter | ResourceID:R2044 | Role:QA Engineer | Projects:Zeus Billing; Apollo Revamp; Internal",
+]
+
+
+def check_equivalence(backend="onnx", model_name=EMBED_MODEL, texts=SAMPLE_TEXTS, min_cosine=None):
+    """
+    Compare a backend's vectors with the PyTorch ones for the same texts.
+
+    Returns:
+        {"backend", "min_cosine", "max_abs_diff", "passed"}
+    """
+    reference = get_model(model_name, "torch").encode(texts, normalize=True)
+    candidate = get_model(model_name, backend).encode(texts, normalize=True)
+
+    cosines = np.sum(reference * candidate, axis=1)
+    threshold = min_cosine if min_cosine is not None else MIN_COSINE.get(backend, 0.9999)
+    return {
+        "backend": backend,
+        "min_cosine": float(cosines.min()),
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "passed": bool(cosines.min() >= threshold),
+    }
+
+
+def benchmark(model_name=EMBED_MODEL, backends=BACKENDS, n_texts=2000, batch_size=None, repeat=3):
+    """Best-of-`repeat` sentences/sec per backend on generated entity documents."""
+    texts = [
+        f"Resource:Person {i} | ResourceID:R{i:05d} | Role:Role {i % 13} | Projects:Project {i % 97}; Project {i % 31}"
+        for i in range(n_texts)
+    ]
+
+    rows = []
+    for backend in backends:
+        model = get_model(model_name, backend)
+        model.encode(texts[:32], batch_size=batch_size)  # warm-up
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.encode(texts, batch_size=batch_size)
+            best = min(best, time.perf_counter() - start)
+
+        rows.append({
+            "backend": backend,
+            "sentences_per_s": round(n_texts / best, 1),
+            "model_mb": round(model.memory_bytes / 2**20, 1),
+            "load_s": round(model.load_s, 2),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for backend in ("onnx", "onnx-int8"):
+        print(check_equivalence(backend))
+    for row in benchmark():
+        print(row)
@@ -0,0 +1,34 @@
+import multiprocessing
+
+import numpy as np
+
+from DatabaseEngine.embedding_cache import EmbeddingCache
+
+DIMENSION = 8
+
+
+def encode(texts):
+    return [[(sum(map(ord, t)) % 997) / 997] * DIMENSION for t in texts]
+
+
+def expected(texts):
+    return np.asarray(encode(texts), dtype=np.float16).astype(np.float32)
+
+
+def append_rows(cache_dir, worker):
+    cache = EmbeddingCache("model", DIMENSION, cache_dir=cache_dir)
+    for i in range(40):
+        texts = [f"own {worker} {i}", f"shared {i}"]
+        if not np.allclose(cache.get_or_encode(texts, encode), expected(texts)):
+            return False
+    return True
+
+
+def test_concurrent_appends(tmp_path):
+    with multiprocessing.Pool(4) as pool:
+        assert all(pool.starmap(append_rows, [(str(tmp_path), w) for w in range(4)]))
+
+    cache = EmbeddingCache("model", DIMENSION, cache_dir=str(tmp_path))
+    texts = [f"own {w} {i}" for w in range(4) for i in range(40)] + [f"shared {i}" for i in range(40)]
+    assert len(cache) == len(texts)
+    assert np.allclose(cache.get_or_encode(texts, lambda missing: 1 / 0), expected(texts))
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from DatabaseEngine import embeddings
+from DatabaseEngine.embedding_cache import EmbeddingCache
+from DatabaseEngine.embeddings import RegistryEmbeddings, canonical_name, get_model
+
+KNOWN_MODELS = ("sentence-transformers/all-MiniLM-L6-v2", "sentence-transformers/tiny")
+DIMENSION = 4
+
+
+class StubSentenceTransformer:
+    """Deterministic stand-in for SentenceTransformer that counts loads and encoded texts."""
+
+    loads = []
+
+    def __init__(self, name, device=None):
+        if name not in KNOWN_MODELS:
+            raise OSError(f"{name} is not a valid model identifier")
+        self.loads.append(name)
+        self.encoded = []
+
+    def parameters(self):
+        return []
+
+    def buffers(self):
+        return []
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, **kwargs):
+        self.encoded.extend(texts)
+        vectors = np.array([[len(t), t.count("a"), t.count("e"), 1.0] for t in texts], dtype=np.float32)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    StubSentenceTransformer.loads = []
+    monkeypatch.setattr(embeddings, "SentenceTransformer", StubSentenceTransformer)
+    monkeypatch.setattr(embeddings, "_models", {})
+    monkeypatch.setattr(embeddings, "_load_locks", {})
+    monkeypatch.setattr(embeddings, "EmbeddingCache",
+                        lambda name, dimension: EmbeddingCache(name, dimension, cache_dir=str(tmp_path)))
+
+
+def test_registry_loads_each_model_once():
+    model = get_model("all-MiniLM-L6-v2", backend="torch")
+    assert get_model("sentence-transformers/all-MiniLM-L6-v2", backend="torch") is model
+    assert canonical_name("all-MiniLM-L6-v2") == model.name == KNOWN_MODELS[0]
+
+    other = get_model("tiny", backend="torch")
+    assert other is not model
+    assert StubSentenceTransformer.loads == list(KNOWN_MODELS)
+    assert [s["model"] for s in embeddings.model_stats()] == list(KNOWN_MODELS)
+
+
+def test_unknown_model_and_backend():
+    with pytest.raises(OSError):
+        get_model("no-such-model", backend="torch")
+    # A failed load is not registered; the next call tries again
+    assert embeddings._models == {}
+
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        get_model(backend="tensorflow")
+
+
+def test_missing_sentence_transformers(monkeypatch):
+    monkeypatch.setattr(embeddings, "SentenceTransformer", None)
+    with pytest.raises(ImportError):
+        get_model(backend="torch")
+
+
+def test_query_lru(monkeypatch):
+    monkeypatch.setattr(embeddings, "QUERY_CACHE_SIZE", 2)
+    monkeypatch.setattr(embeddings, "EMBED_BACKEND", "torch")
+    model = get_model()
+    stub = model.model
+    embedder = RegistryEmbeddings()
+
+    first = embedder.embed_query("alpha")
+    embedder.embed_query("beta")
+    # Whitespace differences are the same query
+    assert embedder.embed_query("  alpha ") == first
+    assert stub.encoded == ["alpha", "beta"]
+
+    # "beta" is now least recently used and makes room for "gamma"
+    embedder.embed_query("gamma")
+    embedder.embed_query("alpha")
+    embedder.embed_query("beta")
+    assert stub.encoded == ["alpha", "beta", "gamma", "beta"]
+    assert (model.query_hits, model.query_misses) == (2, 4)
+
+    # Normalised and raw vectors are cached separately
+    normalised = RegistryEmbeddings(normalize=True).embed_query("alpha")
+    assert normalised != first
+    assert np.isclose(np.linalg.norm(normalised), 1.0)
+
+
+def test_documents_use_the_disk_cache(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBED_BACKEND", "torch")
+    embedder = RegistryEmbeddings()
+    stub = get_model().model
+
+    alpha, beta = embedder.embed_documents(["alpha", "beta"])
+    again = embedder.embed_documents(["beta", "alpha", "delta"])
+    assert again[:2] == [beta, alpha]
+    assert stub.encoded == ["alpha", "beta", "delta"]
@@ -0,0 +1,78 @@
+import duckdb
+import numpy as np
+import pytest
+
+from DatabaseEngine.vector_store import MmapVectorStore
+from DatabaseEngine.entity_index import entity_documents, scope_entity_ids, scope_filter, scope_where
+
+ROWS = [
+    # Resource ID, Resource Name, Role, Project ID, Project Name, Period, Posted Hours
+    ("R1", "Asha", "Analyst", "P1", "Apollo", "Apr-25", 8),
+    ("R1", "Asha", "Analyst", "P2", "Borealis", "May-25", 4),
+    ("R2", "Ben", "Engineer", "P1", "Apollo", "May-25", 6),
+    ("R3", "Chen", "Engineer", "P2", "Borealis", "Jun-25", 2),
+]
+
+
+class ConstantEmbeddings:
+    """Every text gets the same vector, so only the filter decides what is found."""
+
+    def embed_query(self, text):
+        return np.ones(4, dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE sample_table ("Resource ID" VARCHAR, "Resource Name" VARCHAR, "Resource Primary Role" VARCHAR,
+                                   "Project ID" VARCHAR, "Project Name" VARCHAR,
+                                   "Financial Period (Posted Date)" VARCHAR, "Posted Hours" INTEGER)
+    """)
+    conn.executemany("INSERT INTO sample_table VALUES (?, ?, ?, ?, ?, ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def matching_names(conn, filters):
+    where, params = scope_where(conn, filters)
+    return [name for name, in conn.execute(
+        f'SELECT DISTINCT "Resource Name" FROM sample_table WHERE {where} ORDER BY 1', params).fetchall()]
+
+
+def test_scope_where(conn):
+    assert matching_names(conn, {}) == ["Asha", "Ben", "Chen"]
+    assert matching_names(conn, {"Project ID": "P1"}) == ["Asha", "Ben"]
+    assert matching_names(conn, {"Financial Period (Posted Date)": ["May-25", "Jun-25"]}) == ["Asha", "Ben", "Chen"]
+    assert matching_names(conn, {"Project ID": "P2", "Financial Period (Posted Date)": ["May-25"]}) == ["Asha"]
+    # Values compare as text, whatever the column type
+    assert matching_names(conn, {"Posted Hours": 6}) == ["Ben"]
+    assert matching_names(conn, {"Project ID": []}) == []
+
+
+def test_scope_where_is_parameterised(conn):
+    where, params = scope_where(conn, {"Resource Name": "x' OR '1'='1"})
+    assert params == ["x' OR '1'='1"]
+    assert conn.execute(f"SELECT COUNT(*) FROM sample_table WHERE {where}", params).fetchone()[0] == 0
+
+
+def test_scope_where_rejects_unknown_columns(conn):
+    with pytest.raises(ValueError, match="Unknown filter column"):
+        scope_where(conn, {'Project ID" OR TRUE --': "P1"})
+
+
+def test_scope_filter_restricts_vector_search(conn, tmp_path):
+    ids = scope_entity_ids(conn, {"Project ID": "P2"}, kinds=("resource",))
+    assert sorted(ids) == ["resource:R1|Asha", "resource:R3|Chen"]
+    assert scope_filter(ids) == {"entity_id": {"$in": ids}}
+
+    # The ids match the entity_id metadata of the indexed documents
+    doc_ids, texts, metadatas = entity_documents(conn, kinds=("resource",))
+    store = MmapVectorStore.from_texts(texts, ConstantEmbeddings(), metadatas=metadatas, ids=doc_ids,
+                                       persist_directory=str(tmp_path / "vectors"))
+    found = store.similarity_search("anyone", k=10, filter=scope_filter(ids))
+    assert sorted(d.metadata["entity_id"] for d in found) == sorted(ids)
+    assert {d.metadata["Resource Name"] for d in found} == {"Asha", "Chen"}
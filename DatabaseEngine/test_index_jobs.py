@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from DatabaseEngine import index_jobs
+from DatabaseEngine.index_jobs import STATUS_FILE, ensure_index, index_status, wait
+
+
+@pytest.fixture(autouse=True)
+def restarted(monkeypatch):
+    # Every test starts like a fresh process: only the status files remain
+    monkeypatch.setattr(index_jobs, "_status", {})
+    monkeypatch.setattr(index_jobs, "_threads", {})
+
+
+def write_status(index_dir, status):
+    with open(os.path.join(index_dir, STATUS_FILE), "w") as f:
+        json.dump(status, f)
+
+
+def test_ready_index_survives_restart(tmp_path):
+    ensure_index("k", lambda: 3, str(tmp_path))
+    assert wait("k")["state"] == "ready"
+
+    index_jobs._status.clear()
+    assert index_status("k", str(tmp_path))["state"] == "ready"
+
+
+def test_older_schema_is_rebuilt(tmp_path):
+    write_status(str(tmp_path), {"state": "ready", "documents": 3})
+    assert index_status("k", str(tmp_path))["state"] == "stale"
+
+    built = []
+    ensure_index("k", lambda: built.append(1) or 3, str(tmp_path))
+    wait("k")
+    assert built == [1]
+    assert index_status("k", str(tmp_path))["state"] == "ready"
+
+
+def failing():
+    raise RuntimeError("embedding model unavailable")
+
+
+def test_failed_build_backs_off_until_retry(tmp_path):
+    index_dir = str(tmp_path)
+    ensure_index("k", failing, index_dir)
+    assert wait("k")["state"] == "failed"
+
+    # Repeated calls don't restart a build that just failed
+    built = []
+    status = ensure_index("k", lambda: built.append(1) or 3, index_dir)
+    assert status["state"] == "failed" and "RuntimeError" in status["error"]
+    assert built == []
+
+    # ...also after a restart, since the failure time is on disk
+    index_jobs._status.clear()
+    assert ensure_index("k", lambda: built.append(1) or 3, index_dir)["state"] == "failed"
+    assert built == []
+
+    ensure_index("k", lambda: built.append(1) or 3, index_dir, retry=True)
+    assert wait("k")["state"] == "ready"
+    assert built == [1]
+
+
+def test_failed_build_is_retried_after_invalidate_or_delay(tmp_path, monkeypatch):
+    index_dir = str(tmp_path)
+    ensure_index("k", failing, index_dir)
+    wait("k")
+
+    index_jobs.invalidate("k", index_dir)
+    ensure_index("k", lambda: 3, index_dir)
+    assert wait("k")["state"] == "ready"
+
+    ensure_index("j", failing, index_dir)
+    wait("j")
+    monkeypatch.setattr(index_jobs, "INDEX_RETRY_S", 0)
+    ensure_index("j", lambda: 3, index_dir)
+    assert wait("j")["state"] == "ready"
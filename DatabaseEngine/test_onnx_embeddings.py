@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+pytest.importorskip("sentence_transformers")
+
+from DatabaseEngine.embeddings import EMBED_MODEL
+from DatabaseEngine.onnx_embeddings import check_equivalence
+
+# The first run also needs torch and onnx to export the model to ONNX_DIR
+EMBED_TEST_MODEL = os.environ.get("EMBED_TEST_MODEL", EMBED_MODEL)
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_matches_torch(backend):
+    result = check_equivalence(backend, EMBED_TEST_MODEL)
+    assert result["passed"], result
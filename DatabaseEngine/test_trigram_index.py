@@ -0,0 +1,53 @@
+import random
+
+import pytest
+from rapidfuzz import process, fuzz, utils
+
+from DatabaseEngine.trigram_index import TrigramIndex, sample_names, typo
+
+MIN_RECALL_AT_1 = 0.99
+MIN_RECALL_AT_3 = 0.95
+RELEVANT_SCORE = 75
+QUERIES = 200
+
+
+def recall(n, candidates):
+    # A query counts as recalled at k when the prefiltered top-k has the
+    # same scores as brute-force WRatio (ties can pick different values); at
+    # 3, only matches scoring RELEVANT_SCORE or more are compared. The
+    # latency benchmark is `python -m DatabaseEngine.trigram_index`.
+    rng = random.Random(1)
+    texts = [utils.default_process(t) for t in sample_names(n)]
+    index = TrigramIndex(texts)
+
+    hits_1 = hits_3 = 0
+    for _ in range(QUERIES):
+        query = utils.default_process(typo(rng.choice(texts), rng))
+        brute = [score for _, score, _ in process.extract(query, texts, scorer=fuzz.WRatio, processor=None, limit=3)]
+        fast = [score for _, score, _ in index.extract(query, texts, limit=3, candidates=candidates)]
+        hits_1 += fast[:1] == brute[:1]
+        relevant = [score for score in brute if score >= RELEVANT_SCORE]
+        hits_3 += fast[:len(relevant)] == relevant
+    return hits_1 / QUERIES, hits_3 / QUERIES
+
+
+# The prefilter keeps `candidates` of n values; the production ratio is
+# 500 of 100k+, scaled down here so the suite runs in seconds
+@pytest.mark.parametrize("n, candidates", [(2000, 50), (10000, 150)])
+def test_recall(n, candidates):
+    recall_1, recall_3 = recall(n, candidates)
+    assert recall_1 >= MIN_RECALL_AT_1
+    assert recall_3 >= MIN_RECALL_AT_3
+
+
+def test_no_shared_trigram_falls_back_to_all_values():
+    texts = ["ramya sri", "john carter"]
+    index = TrigramIndex(texts)
+    assert index.candidates("qqq") is None
+    assert [text for text, _, _ in index.extract("qqq", texts, limit=2)] == \
+        [text for text, _, _ in process.extract("qqq", texts, scorer=fuzz.WRatio, processor=None, limit=2)]
+
+
+def test_small_index_keeps_every_sharing_row():
+    texts = ["ramya sri", "john carter", "ramesh"]
+    assert sorted(TrigramIndex(texts).candidates("ram", limit=10)) == [0, 2]
@@ -0,0 +1,125 @@
+import json
+
+import duckdb
+import numpy as np
+import pytest
+
+import DatabaseEngine.vector_store as vector_store
+from DatabaseEngine.vector_store import MmapVectorStore
+
+
+class LetterEmbeddings:
+    """Letter counts as the embedding: texts sharing letters are close."""
+
+    def embed_query(self, text):
+        vector = np.zeros(26, dtype=np.float32)
+        for ch in text.lower():
+            if "a" <= ch <= "z":
+                vector[ord(ch) - ord("a")] += 1
+        return vector + 1e-3
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+TEXTS = ["apple", "banana", "cherry", "grape", "lemon", "mango"]
+METADATAS = [
+    {"column": "fruit", "table": "a", "rows": 10},
+    {"column": "fruit", "table": "b", "rows": 20},
+    {"column": "berry", "table": "a", "rows": 30},
+    {"column": "berry", "table": "b", "rows": 40},
+    {"column": "citrus", "table": "a", "rows": 50},
+    {"column": "fruit", "table": "c", "rows": 60},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MmapVectorStore.from_texts(TEXTS, LetterEmbeddings(), metadatas=METADATAS,
+                                      ids=[f"id{i}" for i in range(len(TEXTS))],
+                                      persist_directory=str(tmp_path / "store"))
+
+
+def matching(store, where):
+    return [TEXTS[row] for row in store.filter_rows(where)]
+
+
+def test_where_operators(store):
+    assert matching(store, {"column": "berry"}) == ["cherry", "grape"]
+    assert matching(store, {"rows": {"$gte": 40}}) == ["grape", "lemon", "mango"]
+    assert matching(store, {"table": {"$in": ["b", "c"]}}) == ["banana", "grape", "mango"]
+    assert matching(store, {"table": {"$nin": ["a"]}}) == ["banana", "grape", "mango"]
+    assert matching(store, {"table": {"$in": []}}) == []
+    assert matching(store, {"$and": [{"column": "fruit"}, {"rows": {"$lt": 30}}]}) == ["apple", "banana"]
+    assert matching(store, {"$or": [{"column": "citrus"}, {"table": "c"}]}) == ["lemon", "mango"]
+    assert matching(store, {"$or": [{"$and": [{"column": "berry"}, {"table": "a"}]}, {"rows": 60}]}) == [
+        "cherry", "mango"
+    ]
+
+    with pytest.raises(ValueError):
+        store.filter_rows({"rows": {"$regex": "1"}})
+
+
+def test_from_texts_round_trip(store, tmp_path):
+    reopened = MmapVectorStore(str(tmp_path / "store"), LetterEmbeddings())
+    assert reopened.count == len(TEXTS)
+    assert reopened.dimension == 26
+    assert reopened.index is None
+
+    doc, score = reopened.similarity_search_with_score("banana", k=1)[0]
+    assert doc.page_content == "banana"
+    assert doc.metadata == METADATAS[1]
+    assert score == pytest.approx(0.0, abs=1e-3)
+
+    # Results come back closest first, with Chroma-style distances
+    scores = [s for _, s in reopened.similarity_search_with_score("apple", k=len(TEXTS))]
+    assert scores == sorted(scores)
+    assert all(0.0 <= s <= 4.0 for s in scores)
+
+    reopened.delete_collection()
+    assert MmapVectorStore(str(tmp_path / "store"), LetterEmbeddings()).count == 0
+
+
+def test_filtered_search_only_returns_matches(store):
+    found = store.similarity_search("banana", k=3, filter={"column": "berry"})
+    assert [d.page_content for d in found] == ["grape", "cherry"]
+
+    found = store.similarity_search("banana", k=3, filter={"column": "berry"}, rows=np.array([2]))
+    assert [d.page_content for d in found] == ["cherry"]
+
+    assert store.similarity_search("banana", filter={"column": "none"}) == []
+
+
+def test_searches_open_the_metadata_read_only(store, tmp_path):
+    # DuckDB refuses a read-write connection to a file this process already
+    # has open read-only, so this only works if searches open it read-only too
+    conn = duckdb.connect(str(tmp_path / "store" / "metadata.duckdb"), read_only=True)
+    try:
+        found = store.similarity_search("apple", k=1, filter={"table": "a"})
+        assert [d.page_content for d in found] == ["apple"]
+    finally:
+        conn.close()
+
+
+def test_switches_to_hnsw_above_the_threshold(tmp_path, monkeypatch):
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(vector_store, "HNSW_MIN_VECTORS", 4)
+
+    small = MmapVectorStore.from_texts(TEXTS[:3], LetterEmbeddings(), metadatas=METADATAS[:3],
+                                       persist_directory=str(tmp_path / "small"))
+    large = MmapVectorStore.from_texts(TEXTS, LetterEmbeddings(), metadatas=METADATAS,
+                                       persist_directory=str(tmp_path / "large"))
+
+    with open(tmp_path / "small" / "store.json") as f:
+        assert json.load(f)["index"] == "flat"
+    with open(tmp_path / "large" / "store.json") as f:
+        assert json.load(f)["index"] == "hnsw"
+    assert small.index is None and large.index is not None
+
+    assert large.similarity_search("lemon", k=1)[0].page_content == "lemon"
+    # A filtered candidate set under the threshold is searched brute force
+    found = large.similarity_search("lemon", k=2, filter={"column": "fruit"})
+    assert {d.metadata["column"] for d in found} == {"fruit"}
+    # ...and one over it walks the graph with a selector
+    found = large.similarity_search("lemon", k=6, filter={"rows": {"$gte": 20}})
+    assert {d.page_content for d in found} == set(TEXTS[1:])
@@ -0,0 +1,148 @@
+"""
+Trigram inverted index: candidate prefilter for fuzzy matching.
+
+process.extract scores the query against every value, which is fine for
+a few hundred names and slow for 200k task or project names. For columns
+with at least TRIGRAM_MIN_VALUES distinct values, the values with the
+highest trigram overlap with the query (TRIGRAM_CANDIDATES, default 500)
+are selected from an inverted index first, and only those go through
+WRatio. DatabaseEngine/test_trigram_index.py checks recall against brute
+force.
+
+Texts are expected preprocessed (utils.default_process), as in the
+value dictionaries.
+
+    python -m DatabaseEngine.trigram_index
+
+prints lookup latency, brute force vs prefiltered, across cardinalities.
+"""
+import os
+import time
+import random
+from collections import defaultdict
+
+import numpy as np
+from rapidfuzz import process, fuzz, utils
+
+TRIGRAM_MIN_VALUES = int(os.environ.get("TRIGRAM_MIN_VALUES", 5000))
+TRIGRAM_CANDIDATES = int(os.environ.get("TRIGRAM_CANDIDATES", 500))
+
+
+def trigrams(text):
+    """Distinct trigrams of text, padded so word starts and ends count."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, texts):
+        self.size = len(texts)
+        self.gram_counts = np.empty(self.size, dtype=np.float32)
+        postings = defaultdict(list)
+        for row, text in enumerate(texts):
+            grams = trigrams(text)
+            self.gram_counts[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def candidates(self, query, limit=TRIGRAM_CANDIDATES):
+        """
+        Rows of the `limit` texts with the highest trigram overlap with
+        query, or None if no text shares a trigram (the caller should fall
+        back to scoring every value).
+        """
+        grams = trigrams(query)
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return None
+
+        shared = np.bincount(np.concatenate(lists), minlength=self.size)
+        # Overlap coefficient: a short value inside a long query (or the
+        # reverse) ranks high, as it does under WRatio's partial matching
+        overlap = shared / np.minimum(self.gram_counts, len(grams))
+        if self.size > limit:
+            rows = np.argpartition(-overlap, limit)[:limit]
+        else:
+            rows = np.arange(self.size)
+        return rows[shared[rows] > 0]
+
+    def extract(self, query, texts, limit=3, scorer=fuzz.WRatio, candidates=TRIGRAM_CANDIDATES):
+        """process.extract over the prefiltered texts: [(text, score, row)], best first."""
+        rows = self.candidates(query, candidates)
+        if rows is None:
+            return process.extract(query, texts, scorer=scorer, processor=None, limit=limit)
+
+        matches = process.extract(query, [texts[r] for r in rows], scorer=scorer, processor=None, limit=limit)
+        return [(text, score, int(rows[i])) for text, score, i in matches]
+
+
+# ---------------------------------------------------------
+#                       BENCHMARK
+# ---------------------------------------------------------
+SYLLABLES = ["ra", "my", "sri", "kri", "shan", "jo", "hn", "car", "ter", "an", "ja", "li",
+             "mo", "de", "vi", "ka", "su", "re", "sh", "ta", "no", "pa", "el", "ix", "zo"]
+
+
+def sample_names(n, seed=0):
+    """n distinct, name-like strings (two or three words)."""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n:
+        words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+                 for _ in range(rng.randint(2, 3))]
+        names.add(" ".join(words))
+    return sorted(names)
+
+
+def typo(text, rng):
+    """A query as a user would type it: a dropped, swapped or wrong letter, or reordered words."""
+    kind = rng.choice(("drop", "swap", "replace", "reorder", "prefix"))
+    i = rng.randrange(max(1, len(text) - 1))
+    if kind == "drop":
+        return text[:i] + text[i + 1:]
+    if kind == "swap":
+        return text[:i] + text[i + 1:i + 2] + text[i:i + 1] + text[i + 2:]
+    if kind == "replace":
+        return text[:i] + rng.choice("aeiouxyz") + text[i + 1:]
+    if kind == "reorder":
+        return " ".join(reversed(text.split()))
+    return text.split()[0]
+
+
+def benchmark(cardinalities=(1000, 10000, 100000, 200000), queries=200, seed=0):
+    """Mean lookup ms, brute force vs prefiltered, per number of distinct values."""
+    rng = random.Random(seed)
+    rows = []
+    for n in cardinalities:
+        texts = [utils.default_process(t) for t in sample_names(n, seed)]
+
+        start = time.perf_counter()
+        index = TrigramIndex(texts)
+        build_s = time.perf_counter() - start
+
+        sample = [utils.default_process(typo(rng.choice(texts), rng)) for _ in range(queries)]
+
+        start = time.perf_counter()
+        for q in sample:
+            process.extract(q, texts, scorer=fuzz.WRatio, processor=None, limit=3)
+        brute_ms = (time.perf_counter() - start) * 1000 / queries
+
+        start = time.perf_counter()
+        for q in sample:
+            index.extract(q, texts, limit=3)
+        indexed_ms = (time.perf_counter() - start) * 1000 / queries
+
+        rows.append({
+            "values": n,
+            "build_s": round(build_s, 2),
+            "brute_force_ms": round(brute_ms, 2),
+            "trigram_ms": round(indexed_ms, 2),
+            "speedup": round(brute_ms / indexed_ms, 1),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
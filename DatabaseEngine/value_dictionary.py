@@ -0,0 +1,195 @@
+"""
+Per-session distinct-value dictionaries for fuzzy matching.
+
+Built once at ingest and persisted next to the session's DuckDB file as
+value_dictionary.json, so fuzzy lookups (resource / project matching,
+SQL literal grounding, find_best_match) are served from memory instead
+of a SELECT DISTINCT per call. The file records the database's signature
+(size and mtime of the DuckDB file and its WAL); appends change it, and
+the next lookup rebuilds the dictionary.
+
+Values are kept twice in memory: as stored, and preprocessed for
+rapidfuzz (utils.default_process: lowercased, non-alphanumerics
+stripped), so a lookup only preprocesses the query. Columns with
+TRIGRAM_MIN_VALUES or more values also get a trigram index (built on
+first lookup) that narrows scoring to a few hundred candidates.
+"""
+import os
+import json
+import threading
+
+import duckdb
+from rapidfuzz import process, fuzz, utils
+
+from DatabaseEngine.trigram_index import TRIGRAM_MIN_VALUES, TrigramIndex
+
+BASE_PATH = "Data/sessions"
+DICTIONARY_FILE = "value_dictionary.json"
+
+# Text columns with more distinct values than this are free text, not
+# entities, and get no dictionary
+MAX_DISTINCT = 5000
+
+# db path -> (signature, entry); entry = {"columns": {column: [values]},
+# "extra": {column: [values]} (non-text columns loaded on demand),
+# "processed": {column: [preprocessed values]},
+# "trigrams": {column: TrigramIndex} (large columns, built on first lookup)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def entity_columns(conn, table="sample_table"):
+    """The table's text columns."""
+    return [row[0] for row in conn.execute(f"DESCRIBE {table}").fetchall() if row[1] == "VARCHAR"]
+
+
+def build_value_dictionary(conn, table="sample_table", max_distinct=MAX_DISTINCT):
+    """
+    {column: sorted distinct non-null values} for every text column with
+    at most `max_distinct` values.
+    """
+    dictionary = {}
+    for column in entity_columns(conn, table):
+        rows = conn.execute(
+            f'SELECT DISTINCT "{column}" FROM {table} WHERE "{column}" IS NOT NULL LIMIT {max_distinct + 1}'
+        ).fetchall()
+        if len(rows) <= max_distinct:
+            dictionary[column] = sorted(r[0] for r in rows)
+    return dictionary
+
+
+def _paths(session_id, base_path):
+    session_path = os.path.join(base_path, session_id)
+    return os.path.join(session_path, "duckdb.duckdb"), os.path.join(session_path, DICTIONARY_FILE)
+
+
+def _signature(db_path):
+    """Changes whenever rows are written (to the file or, before a checkpoint, its WAL)."""
+    signature = []
+    for path in (db_path, db_path + ".wal"):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature += [stat.st_size, stat.st_mtime_ns]
+        else:
+            signature += [None, None]
+    return signature
+
+
+def _with_processed(entry):
+    entry["trigrams"] = {}
+    entry["processed"] = {
+        column: [utils.default_process(str(v)) for v in values]
+        for part in ("columns", "extra") for column, values in entry[part].items()
+    }
+    return entry
+
+
+def _save(dict_path, signature, entry):
+    tmp_path = dict_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "columns": entry["columns"], "extra": entry["extra"]},
+                  f, default=str)
+    os.replace(tmp_path, dict_path)
+
+
+def _entry(session_id, base_path):
+    db_path, dict_path = _paths(session_id, base_path)
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"No DuckDB database found for session_id='{session_id}' at {db_path}")
+
+    signature = _signature(db_path)
+    with _cache_lock:
+        cached = _cache.get(db_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    if os.path.exists(dict_path):
+        with open(dict_path, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("signature") == signature:
+            entry = _with_processed({"columns": stored["columns"], "extra": stored.get("extra", {})})
+            with _cache_lock:
+                _cache[db_path] = (signature, entry)
+            return entry
+
+    return build_session_dictionary(session_id, base_path)
+
+
+# ---------------------------------------------------------
+#                     PUBLIC API
+# ---------------------------------------------------------
+def build_session_dictionary(session_id, base_path=BASE_PATH):
+    """(Re)build and persist the session's dictionary; call after ingest."""
+    db_path, dict_path = _paths(session_id, base_path)
+
+    conn = duckdb.connect(db_path)
+    try:
+        columns = build_value_dictionary(conn)
+    finally:
+        conn.close()
+
+    signature = _signature(db_path)
+    entry = _with_processed({"columns": columns, "extra": {}})
+    _save(dict_path, signature, entry)
+    with _cache_lock:
+        _cache[db_path] = (signature, entry)
+    return entry
+
+
+def invalidate_value_dictionary(session_id, base_path=BASE_PATH):
+    """Drop the session's dictionary (e.g. after appending rows); rebuilt on next use."""
+    db_path, dict_path = _paths(session_id, base_path)
+    with _cache_lock:
+        _cache.pop(db_path, None)
+    if os.path.exists(dict_path):
+        os.remove(dict_path)
+
+
+def get_value_dictionary(session_id, base_path=BASE_PATH):
+    """The session's {text column: distinct values}."""
+    return _entry(session_id, base_path)["columns"]
+
+
+def column_values(session_id, column, base_path=BASE_PATH):
+    """
+    (values, preprocessed values) of one column. Columns outside the
+    dictionary (numeric IDs, more than MAX_DISTINCT values) are read once
+    and then kept with it.
+    """
+    entry = _entry(session_id, base_path)
+    if column not in entry["columns"] and column not in entry["extra"]:
+        db_path, dict_path = _paths(session_id, base_path)
+        conn = duckdb.connect(db_path)
+        try:
+            if column not in {c[0] for c in conn.execute("DESCRIBE sample_table").fetchall()}:
+                return [], []
+            rows = conn.execute(
+                f'SELECT DISTINCT "{column}"::VARCHAR FROM sample_table WHERE "{column}" IS NOT NULL'
+            ).fetchall()
+        finally:
+            conn.close()
+
+        values = sorted(r[0] for r in rows)
+        with _cache_lock:
+            entry["extra"][column] = values
+            entry["processed"][column] = [utils.default_process(v) for v in values]
+        _save(dict_path, _signature(db_path), entry)
+
+    values = entry["columns"].get(column, entry["extra"].get(column))
+    return values, entry["processed"][column]
+
+
+def fuzzy_lookup(session_id, column, query, limit=3, base_path=BASE_PATH, scorer=fuzz.WRatio):
+    """Top `limit` [(value, score)] of a column for `query`, best first."""
+    values, processed = column_values(session_id, column, base_path)
+    query = utils.default_process(str(query))
+
+    if len(processed) < TRIGRAM_MIN_VALUES:
+        matches = process.extract(query, processed, scorer=scorer, processor=None, limit=limit)
+        return [(values[index], score) for _, score, index in matches]
+
+    trigrams = _entry(session_id, base_path)["trigrams"]
+    index = trigrams.get(column)
+    if index is None:
+        index = trigrams[column] = TrigramIndex(processed)
+    return [(values[row], score) for _, score, row in index.extract(query, processed, limit, scorer)]
@@ -0,0 +1,240 @@
+"""
+Lightweight on-disk vector store, an alternative to Chroma (VECTOR_STORE=mmap).
+
+A session's few thousand entity vectors don't need a database server:
+
+    vectors.f16       float16 matrix, unit-normalised, opened memory-mapped
+                      (zero-copy; nothing is read until a search touches it)
+    metadata.duckdb   row -> id, document text, metadata (JSON)
+    index.hnsw        FAISS HNSW graph, only for stores of HNSW_MIN_VECTORS+
+    store.json        count, dimension, index type
+
+Searches are brute-force matrix products below HNSW_MIN_VECTORS and go
+through HNSW (if faiss is installed) above it. The class follows the
+LangChain Chroma methods this repo uses (from_texts,
+similarity_search[_with_score] with a Chroma-style `filter`,
+delete_collection), and scores are squared L2 distances like Chroma's
+default, so callers can switch. Filters are evaluated in DuckDB over the
+metadata into a candidate row set before any vector is touched.
+"""
+import os
+import json
+
+import duckdb
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    class Document:
+        def __init__(self, page_content, metadata=None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+
+HNSW_MIN_VECTORS = int(os.environ.get("HNSW_MIN_VECTORS", 50000))
+HNSW_NEIGHBOURS = 32
+HNSW_EF_SEARCH = 64  # candidates explored per query; higher = better recall, slower
+
+WHERE_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+STORE_FILES = ("store.json", "vectors.f16", "metadata.duckdb", "metadata.duckdb.wal", "index.hnsw")
+
+# Rows multiplied at once in brute-force search (bounds float32 scratch memory)
+SEARCH_CHUNK = 65536
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class MmapVectorStore:
+    def __init__(self, persist_directory, embedding_function):
+        self.path = persist_directory
+        self.embedding_function = embedding_function
+        self.count = 0
+        self.dimension = None
+        self.vectors = None
+        self.index = None
+
+        meta_path = os.path.join(self.path, "store.json")
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.count, self.dimension = meta["count"], meta["dimension"]
+
+        if self.count:
+            self.vectors = np.memmap(os.path.join(self.path, "vectors.f16"), dtype=np.float16,
+                                     mode="r", shape=(self.count, self.dimension))
+        if meta.get("index") == "hnsw" and faiss is not None:
+            self.index = faiss.read_index(os.path.join(self.path, "index.hnsw"))
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    # ---------------------------------------------------------
+    #                        WRITE
+    # ---------------------------------------------------------
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=None, **kwargs):
+        """Build (replacing) the store at persist_directory."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(i) for i in range(len(texts))]
+
+        vectors = _normalise(embedding.embed_documents(texts)) if texts else np.zeros((0, 0), np.float32)
+        dimension = vectors.shape[1] if len(vectors) else 0
+
+        store = cls(persist_directory, embedding)
+        store.delete_collection()
+
+        os.makedirs(persist_directory, exist_ok=True)
+        with open(os.path.join(persist_directory, "vectors.f16"), "wb") as f:
+            f.write(vectors.astype(np.float16).tobytes())
+
+        conn = duckdb.connect(os.path.join(persist_directory, "metadata.duckdb"))
+        try:
+            conn.execute("DROP TABLE IF EXISTS entities")
+            conn.execute("CREATE TABLE entities (row INTEGER, id VARCHAR, text VARCHAR, metadata JSON)")
+            conn.executemany(
+                "INSERT INTO entities VALUES (?, ?, ?, ?)",
+                [(row, ids[row], texts[row], json.dumps(metadatas[row], default=str))
+                 for row in range(len(texts))],
+            )
+        finally:
+            conn.close()
+
+        index_type = "flat"
+        if len(vectors) >= HNSW_MIN_VECTORS and faiss is not None:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_NEIGHBOURS, faiss.METRIC_INNER_PRODUCT)
+            index.add(vectors)
+            faiss.write_index(index, os.path.join(persist_directory, "index.hnsw"))
+            index_type = "hnsw"
+
+        # Written last: a store without store.json is treated as empty
+        with open(os.path.join(persist_directory, "store.json"), "w") as f:
+            json.dump({"count": len(texts), "dimension": dimension, "index": index_type}, f)
+
+        return cls(persist_directory, embedding)
+
+    def delete_collection(self):
+        # Only the store's own files; the directory may hold other state
+        # (e.g. the index build status)
+        self.vectors = None
+        self.index = None
+        self.count = 0
+        for name in STORE_FILES:
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ---------------------------------------------------------
+    #                        SEARCH
+    # ---------------------------------------------------------
+    def _top_k(self, query, k, rows=None):
+        """(rows, inner products) of the k closest vectors, best first."""
+        if self.index is not None and (rows is None or len(rows) >= HNSW_MIN_VECTORS):
+            # Large candidate sets: walk the graph, skipping rows outside the set
+            params = None
+            if rows is not None:
+                params = faiss.SearchParametersHNSW(sel=faiss.IDSelectorBatch(np.asarray(rows, dtype=np.int64)),
+                                                    efSearch=max(HNSW_EF_SEARCH, k))
+            scores, found = self.index.search(query[None, :], k, params=params)
+            keep = found[0] >= 0
+            return found[0][keep], scores[0][keep]
+
+        candidates = np.arange(self.count) if rows is None else np.asarray(rows)
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), SEARCH_CHUNK):
+            chunk = candidates[start:start + SEARCH_CHUNK]
+            block = self.vectors[chunk[0]:chunk[-1] + 1] if rows is None else self.vectors[chunk]
+            scores[start:start + len(chunk)] = block.astype(np.float32) @ query
+
+        k = min(k, len(candidates))
+        if k == 0:
+            return np.array([], dtype=np.int64), scores[:0]
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    def _where(self, where):
+        """Chroma `where` dict -> (DuckDB condition on the metadata JSON, params)."""
+        clauses, params = [], []
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._where(part) for part in condition]
+                clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+                params.extend(p for _, part_params in parts for p in part_params)
+                continue
+
+            op, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            values = list(value) if op in ("$in", "$nin") else [value]
+            numeric = bool(values) and all(isinstance(v, (int, float)) for v in values)
+            field = f"""json_extract_string(metadata, '$."{key.replace('"', '')}"')"""
+            if numeric:
+                field = f"TRY_CAST({field} AS DOUBLE)"
+            params.extend(values if numeric else [str(v) for v in values])
+
+            if op in ("$in", "$nin"):
+                if not values:
+                    clauses.append("FALSE" if op == "$in" else "TRUE")
+                    continue
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{field} {negate}IN ({', '.join('?' * len(values))})")
+            elif op in WHERE_OPERATORS:
+                clauses.append(f"{field} {WHERE_OPERATORS[op]} ?")
+            else:
+                raise ValueError(f"Unsupported filter operator '{op}'.")
+        return " AND ".join(clauses) or "TRUE", params
+
+    def filter_rows(self, where):
+        """Rows whose metadata matches a Chroma-style `where` dict."""
+        sql, params = self._where(where)
+        conn = duckdb.connect(os.path.join(self.path, "metadata.duckdb"), read_only=True)
+        try:
+            found = conn.execute(f"SELECT row FROM entities WHERE {sql} ORDER BY row", params).fetchall()
+        finally:
+            conn.close()
+        return np.array([row for row, in found], dtype=np.int64)
+
+    def _documents(self, rows):
+        if len(rows) == 0:
+            return {}
+        conn = duckdb.connect(os.path.join(self.path, "metadata.duckdb"), read_only=True)
+        try:
+            found = conn.execute(
+                "SELECT row, text, metadata FROM entities WHERE row IN (SELECT UNNEST(?))",
+                [[int(r) for r in rows]],
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row: Document(page_content=text, metadata=json.loads(meta)) for row, text, meta in found}
+
+    def similarity_search_with_score(self, query, k=4, filter=None, rows=None):
+        """
+        [(Document, score)] closest first; score is the squared L2 distance
+        between unit vectors (2 - 2 * cosine), as in Chroma.
+        filter: Chroma-style metadata `where` ($eq/$ne/$gt/$gte/$lt/$lte,
+                $in/$nin, $and/$or); rows: candidate rows, if already known.
+        """
+        if not self.count:
+            return []
+
+        if filter:
+            matching = self.filter_rows(filter)
+            rows = matching if rows is None else np.intersect1d(matching, rows)
+        if rows is not None and len(rows) == 0:
+            return []
+
+        vector = _normalise(self.embedding_function.embed_query(query))
+        found, inner = self._top_k(vector, k, rows)
+        documents = self._documents(found)
+        return [(documents[int(r)], max(0.0, float(2 - 2 * s))) for r, s in zip(found, inner) if int(r) in documents]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
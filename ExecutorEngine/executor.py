@@ -1,5 +1,6 @@
 import duckdb
 import os
+import re
 import traceback
 
 
@@ -33,9 +34,10 @@ class SQLExecutor:
         return duckdb.connect(db_path)
 
 
-    def execute(self, session_id, sql_query):
+    def execute(self, session_id, sql_query, params=None):
         """
         Executes an SQL query on the DuckDB DB for a given session.
+        params: values for ? placeholders in the query, if any.
         
         Returns:
             {
@@ -49,7 +51,7 @@ class SQLExecutor:
             conn = self.load_connection(session_id)
 
             # Execute SQL
-            result = conn.execute(sql_query)
+            result = conn.execute(sql_query, params)
 
             # Fetch results (DuckDB: fetchall returns list of tuples)
             rows = result.fetchall()
@@ -71,3 +73,71 @@ class SQLExecutor:
                 "rows": None,
                 "error": f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
             }
+
+
+    def dry_run(self, session_id, sql_query):
+        """
+        Parses, binds and plans the query with EXPLAIN without scanning any
+        data, so bad SQL is caught before it runs.
+
+        Returns:
+            {
+                "success": bool,
+                "error": str or None,
+                "error_type": str or None,   e.g. "ParserException"
+                "fragment": str or None      the part of the SQL DuckDB points at
+            }
+        """
+        try:
+            conn = self.load_connection(session_id)
+        except FileNotFoundError as e:
+            return {"success": False, "error": str(e), "error_type": type(e).__name__, "fragment": None}
+
+        try:
+            return self.explain(conn, sql_query)
+        finally:
+            conn.close()
+
+
+    @classmethod
+    def explain(cls, conn, sql_query):
+        """
+        dry_run on an already open connection or cursor. Exactly one
+        statement is accepted: "SELECT 1; DROP TABLE t" would otherwise
+        EXPLAIN the SELECT and execute the DROP.
+        """
+        try:
+            statements = conn.extract_statements(sql_query)
+            if len(statements) != 1:
+                return {
+                    "success": False,
+                    "error": f"Expected exactly one SQL statement, got {len(statements)}.",
+                    "error_type": "MultipleStatements" if statements else "EmptyStatement",
+                    "fragment": None,
+                }
+            conn.execute(f"EXPLAIN {sql_query}")
+            return {"success": True, "error": None, "error_type": None, "fragment": None}
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "fragment": cls.offending_fragment(str(e)),
+            }
+
+
+    @staticmethod
+    def offending_fragment(error, width=40):
+        """
+        The SQL around DuckDB's caret marker (LINE n: ... / ^), falling
+        back to the first quoted name in the error message.
+        """
+        lines = error.splitlines()
+        for i, line in enumerate(lines[:-1]):
+            match = re.match(r"LINE \d+: ", line)
+            caret = lines[i + 1].find("^")
+            if match and caret >= 0:
+                return line[caret:caret + width].strip() or None
+
+        quoted = re.search(r'"([^"]+)"', error)
+        return quoted.group(1) if quoted else None
@@ -0,0 +1,81 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+
+class PoolClosedError(RuntimeError):
+    pass
+
+
+class ReadOnlyPool:
+    """
+    Read-only cursors on one session database, for running checks from
+    several threads at once. Each cursor is used by one thread at a time.
+
+    Close the pool before opening the same database read-write (DuckDB
+    won't mix configurations for one file in a process). Closing
+    interrupts queries still running on its cursors.
+    """
+
+    def __init__(self, session_id, base_path="Data/sessions", size=4):
+        db_path = os.path.join(base_path, session_id, "duckdb.duckdb")
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(
+                f"No DuckDB database found for session_id='{session_id}' at {db_path}"
+            )
+
+        self.conn = duckdb.connect(db_path, read_only=True)
+        self.size = size
+        self.cursors = queue.Queue()
+        self.all_cursors = [self.conn.cursor() for _ in range(size)]
+        for cur in self.all_cursors:
+            self.cursors.put(cur)
+
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def cursor(self):
+        while True:
+            if self.closed:
+                raise PoolClosedError("Connection pool is closed.")
+            try:
+                cur = self.cursors.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+
+        try:
+            yield cur
+        finally:
+            self.cursors.put(cur)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+        # Queries still running are abandoned: interrupt them so their
+        # cursors come back now, not when the slowest query finishes
+        returned = 0
+        while returned < self.size:
+            for cur in self.all_cursors:
+                cur.interrupt()
+            try:
+                self.cursors.get(timeout=0.05)
+                returned += 1
+            except queue.Empty:
+                continue  # a query started after the interrupt; interrupt again
+        for cur in self.all_cursors:
+            cur.close()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
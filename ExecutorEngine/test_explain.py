@@ -0,0 +1,23 @@
+import duckdb
+import pytest
+
+from ExecutorEngine.executor import SQLExecutor
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE t AS SELECT 1 AS x")
+    yield conn
+    conn.close()
+
+
+def test_single_statement(conn):
+    assert SQLExecutor.explain(conn, "SELECT x FROM t;")["success"]
+    assert SQLExecutor.explain(conn, "SELECT y FROM t")["error_type"] == "BinderException"
+
+
+@pytest.mark.parametrize("sql", ["SELECT x FROM t; DROP TABLE t", "", ";"])
+def test_rejects_anything_but_one_statement(conn, sql):
+    assert not SQLExecutor.explain(conn, sql)["success"]
+    assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
@@ -5,9 +5,10 @@ import datetime
 from typing import overload
 import duckdb
 
-from rapidfuzz import process, fuzz
 from docxtpl import DocxTemplate
 
+from DatabaseEngine.value_dictionary import fuzzy_lookup
+
 class Invoicer:
     def __init__(self, session_id, base_path="Data/sessions", invoice_path="Invoices"):
         self.session_id = session_id
@@ -18,24 +19,17 @@ class Invoicer:
 
         self.db_path = os.path.join(base_path, session_id, "duckdb.duckdb")
         self.conn = duckdb.connect(self.db_path)
+
+    def close(self):
+        self.conn.close()
         
     # -------------------------------------------------------------
     #  MATCHING HELPERS
     # -------------------------------------------------------------
     def fuzzy_match_top(self, column, value, limit=3):
-        """Return top-N fuzzy matches for a column."""
-        rows = self.conn.execute(f"SELECT DISTINCT {column} FROM sample_table").fetchall()
-        values = [r[0] for r in rows if r[0] is not None]
-
-        matches = process.extract(
-            value,
-            values,
-            scorer=fuzz.WRatio,
-            limit=limit
-        )
-
-        # matches is [(match_value, score, index), ...]
-        return [{"match": m[0], "score": m[1]} for m in matches]
+        """Return top-N fuzzy matches for a column (from the session's value dictionary)."""
+        matches = fuzzy_lookup(self.session_id, column.strip('"'), value, limit, self.base_path)
+        return [{"match": match, "score": score} for match, score in matches]
 
 
     # -------------------------------------------------------------
@@ -314,9 +308,10 @@ class Invoicer:
 
 
 #usage:
-inv = Invoicer(session_id="master")
-# use project_invoice_with_all_resources
-invoices = inv.project_invoice_with_all_resources(project_id="91HYFY25_RASESI_NOA", financial_period="2025-11")
+if __name__ == "__main__":
+    inv = Invoicer(session_id="master")
+    # use project_invoice_with_all_resources
+    invoices = inv.project_invoice_with_all_resources(project_id="91HYFY25_RASESI_NOA", financial_period="2025-11")
 
 # example usage:
 # invoicer = Invoicer(session_id="abc123")
@@ -1,182 +1,17 @@
-import requests
+import os
 import json
+import time
+import requests
 
-SQL_SYSTEM_PROMPT = """
-You are an SQL query generator.
-Your ONLY job is to output a valid SQL query.
-
-===========================
-      STRICT RULES
-===========================
-1. Output ONLY the SQL query.
-2. Do NOT add explanations, notes, markdown, or backticks.
-3. Do NOT rewrite the schema.
-4. Do NOT add comments in the SQL.
-5. Use ONLY the columns exactly as they appear in the schema.
-6. Use ONLY the table name: sample_table.
-7. If the user provides meanings for columns, use them ONLY for query logic.
-8. If a request is ambiguous, generate the simplest valid SQL query.
-9. NEVER invent columns, tables, or functions that do not exist.
-10. All dates are real DATE types unless shown as VARCHAR.
-11. Assume queries run on DuckDB unless the user specifies otherwise.
-
-===========================
-     CHAIN-OF-THOUGHT
-===========================
-Do NOT reveal chain-of-thought or internal reasoning steps.
-Do NOT provide your chain-of-thought. Provide only the final SQL query.
-
-===========================
-         SCHEMA
-===========================
-Columns in table sample_table are:
-
-- Project Financial Location (VARCHAR)
-- Project ID (VARCHAR)
-- Project Name (VARCHAR)
-- Project Manager (VARCHAR)
-- Resource Name (VARCHAR)
-- Resource ID (VARCHAR)
-- Resource Financial Location (VARCHAR)
-- Posted Hours (DOUBLE)
-- Project Task Name (VARCHAR)
-- Project Task ID (VARCHAR)
-- Actual Date (DATE)
-- Posted Date (DATE)
-- Financial Period (Posted Date) (VARCHAR, format: YYYY-MM)
-- Resource Financial Department (VARCHAR)
-- Project Financial Department (VARCHAR)
-- Project Class (VARCHAR)
-- Timesheet Week (Actual Date) (VARCHAR)
-- Timesheet Week (Posted Date) (VARCHAR)
-- Resource Rate (DOUBLE)
-- Project Rate (VARCHAR)
-- Resource Primary Role (VARCHAR)
-- Resource Project Role (VARCHAR)
-- Resource Currency (VARCHAR)
-
-===========================
-     COLUMN MEANINGS
-===========================
-Use these ONLY when required for logic:
-
-- Actual Date:
-  The date on which the work/hours actually occurred.
-
-- Posted Date:
-  The date on which the resource logged the hours into the system.
-  A resource may log hours for a past Actual Date at a later Posted Date.
-
-- Financial Period (Posted Date):
-  A string like "2025-11" representing the financial month of the Posted Date.
-
-All other fields (Project ID, Resource Name, Posted Hours, etc.) behave normally.
-
-===========================
-     FEW-SHOT EXAMPLES
-===========================
-
-User: Get total Posted Hours per Resource Name.
-Assistant:
-SELECT "Resource Name", SUM("Posted Hours") AS total_hours
-FROM sample_table
-GROUP BY "Resource Name";
-
-User: Show rows where Posted Date is after Actual Date.
-Assistant:
-SELECT *
-FROM sample_table
-WHERE "Posted Date" > "Actual Date";
-
-User: Count number of entries per Financial Period (Posted Date).
-Assistant:
-SELECT "Financial Period (Posted Date)", COUNT(*) AS entry_count
-FROM sample_table
-GROUP BY "Financial Period (Posted Date)";
-"""
-
-class LlamaCPPHandler:
-    def __init__(self, api_url="http://localhost:8001/generate"):
-        self.api_url = api_url
-
-    def generate(self, prompt, max_tokens=256, temperature=0.1):
-        """
-        Basic text generation from FastAPI + llama.cpp service.
-        """
-        payload = {
-            "prompt": prompt,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-        }
-
-        r = requests.post(self.api_url, json=payload)
-        r.raise_for_status()
-        return r.json()["text"]
-
-    def generate_SQL(self, question):
-        """
-        Wrap the SQL system prompt + user question.
-        """  # your existing prompt
-
-        final_prompt = f"{SQL_SYSTEM_PROMPT}\n\nUSER QUERY:\n{question}\n\nSQL ONLY:"
-        response = self.generate(final_prompt, max_tokens=300, temperature=0.0)
-
-        # Return cleaned SQL
-        return self.clean_SQL(response)
-
-    def clean_SQL(self, sql):
-        """
-        Extract a valid SQL query from the streamed output.
-        """
-
-        sql = sql.replace("```sql", "").replace("```", "")
-
-        lines = sql.split("\n")
-        collecting = False
-        final_lines = []
-
-        for line in lines:
-            stripped = line.strip()
-            if not stripped:
-                continue
-
-            # Start capturing once SELECT or WITH appears
-            if stripped.upper().startswith("SELECT") or stripped.upper().startswith("WITH"):
-                collecting = True
-
-            if collecting:
-                final_lines.append(stripped)
-
-                # Stop when a line ends with semicolon
-                if stripped.endswith(";"):
-                    break
-
-        return " ".join(final_lines).strip()
-
-
-        
-    def interpret_response(self, executor_result, original_user_question):
-        """
-        Interpret SQLExecutor results into a human-readable explanation
-        using the llama.cpp FastAPI backend (non-streaming).
-        """
-
-        import json
-
-        # ------------------------
-        # SAFE SERIALIZATION
-        # ------------------------
-        safe_columns = executor_result.get("columns") or []
-        safe_rows = executor_result.get("rows") or []
-
-        # Convert tuples → lists for JSON safety
-        safe_rows_json = json.dumps([list(r) for r in safe_rows[:20]], ensure_ascii=False)
-        safe_columns_json = json.dumps(safe_columns, ensure_ascii=False)
+from LLMEngine.result_compactor import compact_result, approx_token_count
+from LLMEngine.prompt_builder import SQL_RULES, build_sql_system_prompt
+from LLMEngine.llm_metrics import record_call
+from LLMEngine.generation_config import STAGE_CONFIGS, REQUEST_TIMEOUT, request_timeout
 
-        # ------------------------
-        # SYSTEM PROMPT — DO NOT MODIFY
-        # ------------------------
-        SYSTEM_PROMPT = """
+# ---------------------------------------------------------
+#      INTERPRETER SYSTEM PROMPT — DO NOT MODIFY
+# ---------------------------------------------------------
+INTERPRETER_SYSTEM_PROMPT = """
 You are a Data Interpretation Assistant designed to translate raw database query
 results into clear, accurate, human-readable insights.
 
@@ -250,31 +85,266 @@ When success=False:
 • If previewing, show rows EXACTLY without alterations.
 """
 
+INTERPRETER_PREFIX = f"fOLLOW this sTRICTLY : {INTERPRETER_SYSTEM_PROMPT}"
+
+# Fixed prompt heads shared by every request; the server keeps their
+# evaluated KV state cached so only the user-specific suffix is evaluated.
+# SQL prompts vary with the question after the rules header.
+PROMPT_PREFIXES = [SQL_RULES, INTERPRETER_PREFIX]
+
+# kick_start.ps1 serves LlamaCPPServer on port 8000
+LLAMA_API_URL = os.environ.get("LLAMA_API_URL", "http://localhost:8000/generate")
+
+class LlamaCPPHandler:
+    def __init__(self, api_url=LLAMA_API_URL, result_token_budget=1200, configs=None, timeout=REQUEST_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = request_timeout(timeout)
+        self.result_token_budget = result_token_budget
+        # Per-stage GenerationConfig (context size and threads are fixed server-side)
+        self.configs = dict(STAGE_CONFIGS, **(configs or {}))
+
+    def count_tokens(self, text):
+        """
+        Token count under the served model's tokenizer.
+        Falls back to a character estimate if the server can't be asked.
+        """
+        base_url = self.api_url.rsplit("/", 1)[0]
+        try:
+            r = requests.post(f"{base_url}/tokenize", json={"text": text}, timeout=self.timeout)
+            r.raise_for_status()
+            return r.json()["tokens"]
+        except requests.RequestException:
+            return approx_token_count(text)
+
+    def record_metrics(self, session_id, stage, timings, ttft_ms, wall_ms):
+        """
+        Store the server's timings for one call (prompt evaluation ends at
+        the server-side first token; the rest is decoding).
+        """
+        server_ttft = timings.get("ttft_ms")
+        server_total = timings.get("total_ms")
+        record_call(
+            session_id, stage,
+            backend="llama.cpp",
+            model=timings.get("model") or self.api_url,
+            prompt_tokens=timings.get("prompt_tokens"),
+            cached_tokens=timings.get("cached_tokens"),
+            completion_tokens=timings.get("completion_tokens"),
+            ttft_ms=ttft_ms,
+            wall_ms=wall_ms,
+            prompt_eval_ms=server_ttft,
+            eval_ms=server_total - server_ttft if server_total is not None and server_ttft is not None else None,
+        )
+
+    def generate(self, prompt, max_tokens=256, temperature=0.1, stop=None, stage="generate", session_id=None,
+                 cancelled=None):
+        """
+        Basic text generation from FastAPI + llama.cpp service.
+
+        With `cancelled`, the text is streamed instead so that
+        cancelled() -> True can drop the connection, which cancels the
+        request on the server; the partial text is returned.
+        """
+        if cancelled is not None:
+            pieces = []
+            stream = self.generate_stream(prompt, max_tokens, temperature, stop, stage, session_id)
+            try:
+                for piece in stream:
+                    if cancelled():
+                        break
+                    pieces.append(piece)
+            finally:
+                stream.close()
+            return "".join(pieces)
+
+        payload = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stop": stop or [],
+        }
+
+        start = time.perf_counter()
+        r = requests.post(self.api_url, json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        body = r.json()
+
+        wall_ms = (time.perf_counter() - start) * 1000
+        timings = body.get("timings", {})
+        self.record_metrics(session_id, stage, timings, timings.get("ttft_ms", wall_ms), wall_ms)
+
+        return body["text"]
+
+    def generate_stream(self, prompt, max_tokens=256, temperature=0.1, stop=None, stage="generate", session_id=None):
+        """
+        Token streaming from the server-sent events endpoint.
+        Yields text pieces as they decode. Closing the generator (e.g. the
+        Streamlit page reruns) drops the connection, which cancels the
+        request on the server.
+        """
+        payload = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stop": stop or [],
+        }
+
+        start = time.perf_counter()
+        ttft_ms = None
+        r = requests.post(f"{self.api_url}/stream", json=payload, stream=True, timeout=self.timeout)
+        r.raise_for_status()
+
+        try:
+            event = "message"
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    event = "message"  # blank line ends an event
+                    continue
+
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "error":
+                        raise RuntimeError(data["error"])
+                    if event == "done":
+                        wall_ms = (time.perf_counter() - start) * 1000
+                        self.record_metrics(session_id, stage, data.get("timings", {}),
+                                            ttft_ms if ttft_ms is not None else wall_ms, wall_ms)
+                        return
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    yield data["token"]
+        finally:
+            r.close()
+
+    def build_SQL_prompt(self, question, session_id=None):
+        """
+        Wrap the SQL system prompt + user question. With a session, the
+        system prompt is pruned to that session's live schema.
+        """
+        system_prompt = build_sql_system_prompt(question, session_id)
+        return f"{system_prompt}\n\nUSER QUERY:\n{question}\n\nSQL ONLY:"
+
+    def generate_SQL(self, question, session_id=None, temperature=None, cancelled=None):
+        """
+        Generate SQL for a natural-language question.
+        """
+        final_prompt = self.build_SQL_prompt(question, session_id)
+        config = self.configs["sql"].with_overrides(temperature=temperature)
+        response = self.generate(final_prompt, **config.llama_cpp_fields(),
+                                 stage="sql", session_id=session_id, cancelled=cancelled)
+
+        # Return cleaned SQL
+        return self.clean_SQL(response)
+
+    def build_repair_prompt(self, sql, error, fragment):
+        """
+        Repair prompt: only the failed query, the error and the fragment it
+        points at. Starts with the cached rules header.
+        """
+        return (
+            f"{SQL_RULES}\n\nThis SQL query failed:\n{sql}\n\n"
+            f"DuckDB error:\n{error}\n\nProblem near: {fragment}\n\nCORRECTED SQL ONLY:"
+        )
+
+    def repair_SQL(self, sql, error, fragment=None, session_id=None, cancelled=None):
+        """
+        Ask the model to fix a query that failed the dry-run.
+        """
+        final_prompt = self.build_repair_prompt(sql, error, fragment)
+        response = self.generate(final_prompt, **self.configs["repair"].llama_cpp_fields(),
+                                 stage="repair", session_id=session_id, cancelled=cancelled)
+        return self.clean_SQL(response)
+
+    def clean_SQL(self, sql):
+        """
+        Extract a valid SQL query from the streamed output.
+        """
+
+        sql = sql.replace("```sql", "").replace("```", "")
+
+        lines = sql.split("\n")
+        collecting = False
+        final_lines = []
+
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            # Start capturing once SELECT or WITH appears
+            if stripped.upper().startswith("SELECT") or stripped.upper().startswith("WITH"):
+                collecting = True
+
+            if collecting:
+                final_lines.append(stripped)
+
+                # Stop when a line ends with semicolon
+                if stripped.endswith(";"):
+                    break
+
+        return " ".join(final_lines).strip()
+
+
+        
+    def build_interpret_prompt(self, executor_result, original_user_question):
+        """
+        Compose the interpreter prompt (system prefix + executor payload).
+        """
+
+        # ------------------------
+        # COMPACT SERIALIZATION
+        # ------------------------
+        # Columnar, token-budgeted: exact stats over every row plus as many
+        # sampled rows as fit, so large results cost a bounded prompt
+        compact = compact_result(
+            executor_result,
+            count_tokens=self.count_tokens,
+            token_budget=self.result_token_budget,
+        )
+
         # ------------------------
         # USER PAYLOAD
         # ------------------------
         user_payload = f"""
 The user originally asked: "{original_user_question}"
 
-Here is the raw executor response that you must interpret:
+Here is the executor response that you must interpret:
 
 Success: {executor_result["success"]}
-Columns (JSON): {safe_columns_json}
-Rows (first 20, JSON): {safe_rows_json}
+{compact["text"]}
 """
 
         # ------------------------
         # COMPOSE FINAL PROMPT (SYSTEM + USER)
         # ------------------------
-        final_prompt = f"fOLLOW this sTRICTLY : {SYSTEM_PROMPT}\n\n{user_payload}\n\nWrite a human-friendly explanation IN A Paragraph INTEPRETING THE DATA YOU GOT"
+        return f"{INTERPRETER_PREFIX}\n\n{user_payload}\n\nWrite a human-friendly explanation IN A Paragraph INTEPRETING THE DATA YOU GOT"
+
+    def interpret_response(self, executor_result, original_user_question, session_id=None):
+        """
+        Interpret SQLExecutor results into a human-readable explanation
+        using the llama.cpp FastAPI backend (non-streaming).
+        """
+        final_prompt = self.build_interpret_prompt(executor_result, original_user_question)
 
         # ------------------------
         # CALL llama.cpp FastAPI backend
         # ------------------------
         result_text = self.generate(
             final_prompt,
-            max_tokens=400,
-            temperature=0.2
+            **self.configs["interpret"].llama_cpp_fields(),
+            stage="interpret",
+            session_id=session_id,
         )
 
         return result_text.strip()
+
+    def interpret_response_stream(self, executor_result, original_user_question, session_id=None):
+        """
+        Same as interpret_response, but yields text pieces as they decode
+        (for st.write_stream).
+        """
+        final_prompt = self.build_interpret_prompt(executor_result, original_user_question)
+        yield from self.generate_stream(final_prompt, **self.configs["interpret"].llama_cpp_fields(),
+                                        stage="interpret", session_id=session_id)
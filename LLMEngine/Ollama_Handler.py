@@ -1,135 +1,111 @@
-import requests
-
-url = "http://localhost:11434/api/chat?stream=false"
-
-import json
-import requests
-SQL_SYSTEM_PROMPT = SQL_SYSTEM_PROMPT = """
-You are an SQL query generator.
-Your ONLY job is to output a valid SQL query.
-
-===========================
-      STRICT RULES
-===========================
-1. Output ONLY the SQL query.
-2. Do NOT add explanations, notes, markdown, or backticks.
-3. Do NOT rewrite the schema.
-4. Do NOT add comments in the SQL.
-5. Use ONLY the columns exactly as they appear in the schema.
-6. Use ONLY the table name: sample_table.
-7. If the user provides meanings for columns, use them ONLY for query logic.
-8. If a request is ambiguous, generate the simplest valid SQL query.
-9. NEVER invent columns, tables, or functions that do not exist.
-10. All dates are real DATE types unless shown as VARCHAR.
-11. Assume queries run on DuckDB unless the user specifies otherwise.
-
-===========================
-     CHAIN-OF-THOUGHT
-===========================
-Do NOT reveal chain-of-thought or internal reasoning steps.
-Do NOT provide your chain-of-thought. Provide only the final SQL query.
-
-===========================
-         SCHEMA
-===========================
-Columns in table sample_table are:
-
-- Project Financial Location (VARCHAR)
-- Project ID (VARCHAR)
-- Project Name (VARCHAR)
-- Project Manager (VARCHAR)
-- Resource Name (VARCHAR)
-- Resource ID (VARCHAR)
-- Resource Financial Location (VARCHAR)
-- Posted Hours (DOUBLE)
-- Project Task Name (VARCHAR)
-- Project Task ID (VARCHAR)
-- Actual Date (DATE)
-- Posted Date (DATE)
-- Financial Period (Posted Date) (VARCHAR, format: YYYY-MM)
-- Resource Financial Department (VARCHAR)
-- Project Financial Department (VARCHAR)
-- Project Class (VARCHAR)
-- Timesheet Week (Actual Date) (VARCHAR)
-- Timesheet Week (Posted Date) (VARCHAR)
-- Resource Rate (DOUBLE)
-- Project Rate (VARCHAR)
-- Resource Primary Role (VARCHAR)
-- Resource Project Role (VARCHAR)
-- Resource Currency (VARCHAR)
-
-===========================
-     COLUMN MEANINGS
-===========================
-Use these ONLY when required for logic:
-
-- Actual Date:
-  The date on which the work/hours actually occurred.
-
-- Posted Date:
-  The date on which the resource logged the hours into the system.
-  A resource may log hours for a past Actual Date at a later Posted Date.
-
-- Financial Period (Posted Date):
-  A string like "2025-11" representing the financial month of the Posted Date.
-
-All other fields (Project ID, Resource Name, Posted Hours, etc.) behave normally.
-
-===========================
-     FEW-SHOT EXAMPLES
-===========================
-
-User: Get total Posted Hours per Resource Name.
-Assistant:
-SELECT "Resource Name", SUM("Posted Hours") AS total_hours
-FROM sample_table
-GROUP BY "Resource Name";
-
-User: Show rows where Posted Date is after Actual Date.
-Assistant:
-SELECT *
-FROM sample_table
-WHERE "Posted Date" > "Actual Date";
-
-User: Count number of entries per Financial Period (Posted Date).
-Assistant:
-SELECT "Financial Period (Posted Date)", COUNT(*) AS entry_count
-FROM sample_table
-GROUP BY "Financial Period (Posted Date)";
-"""
+import os
 import json
+import time
 import requests
 
-url = "http://localhost:11434/api/chat"
+from LLMEngine.result_compactor import compact_result, approx_token_count
+from LLMEngine.prompt_builder import SQL_RULES, build_sql_system_prompt
+from LLMEngine.llm_metrics import record_call
+from LLMEngine.generation_config import STAGE_CONFIGS, REQUEST_TIMEOUT, request_timeout
+
+# Default endpoint; a handler can be pointed at another Ollama host
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/chat")
 
 
 class OllamaHandler:
-    def __init__(self, model="gpt-oss", temperature=0.0, max_tokens=256):
+    def __init__(self, model="gpt-oss", temperature=None, max_tokens=None, result_token_budget=1200,
+                 url=OLLAMA_URL, interpret_model="llama3.2:3b", configs=None, timeout=REQUEST_TIMEOUT):
+        self.url = url
+        self.timeout = request_timeout(timeout)
         self.model = model
-        self.temperature = temperature
-        self.max_tokens = max_tokens
+        self.interpret_model = interpret_model
+        self.result_token_budget = result_token_budget
+
+        # Per-stage GenerationConfig; temperature/max_tokens override SQL generation
+        self.configs = dict(STAGE_CONFIGS, **(configs or {}))
+        self.configs["sql"] = self.configs["sql"].with_overrides(
+            temperature=temperature, max_tokens=max_tokens
+        )
+
+    def count_tokens(self, text):
+        """
+        Ollama has no tokenize endpoint, so this is a character estimate.
+        """
+        return approx_token_count(text)
+
+    def record_metrics(self, session_id, stage, model, final, ttft_ms, wall_ms):
+        """
+        Store the counters from Ollama's final stream chunk (durations are
+        nanoseconds). `final` is empty if the stream was closed early.
+        """
+        ns_to_ms = lambda v: v / 1e6 if v is not None else None
+        record_call(
+            session_id, stage,
+            backend="ollama",
+            model=model,
+            prompt_tokens=final.get("prompt_eval_count"),
+            completion_tokens=final.get("eval_count"),
+            ttft_ms=ttft_ms,
+            wall_ms=wall_ms,
+            prompt_eval_ms=ns_to_ms(final.get("prompt_eval_duration")),
+            eval_ms=ns_to_ms(final.get("eval_duration")),
+        )
+
+
+    def generate_SQL(self, user_prompt, session_id=None, temperature=None, cancelled=None):
+        # Pruned to the session's live schema when a session is given
+        system_prompt = build_sql_system_prompt(user_prompt, session_id)
+        return self.chat_SQL(system_prompt, user_prompt, temperature, session_id=session_id,
+                             cancelled=cancelled)
+
+
+    def repair_SQL(self, sql, error, fragment=None, session_id=None, cancelled=None):
+        """
+        Ask the model to fix a query that failed the dry-run, from the
+        error and the fragment it points at only.
+        """
+        user_prompt = (
+            f"This SQL query failed:\n{sql}\n\n"
+            f"DuckDB error:\n{error}\n\nProblem near: {fragment}\n\n"
+            f"Return the corrected SQL query only."
+        )
+        return self.chat_SQL(SQL_RULES, user_prompt, stage="repair", session_id=session_id,
+                             cancelled=cancelled)
 
 
-    def generate_SQL(self, user_prompt):
+    def chat_SQL(self, system_prompt, user_prompt, temperature=None, stage="sql", session_id=None,
+                 cancelled=None):
+        """
+        cancelled() -> True stops reading and drops the connection, which
+        makes Ollama stop generating; the partial SQL is returned.
+        """
         headers = {"Content-Type": "application/json"}
+        config = self.configs[stage].with_overrides(temperature=temperature)
 
         payload = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": SQL_SYSTEM_PROMPT},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "stream": True,
+            # options (num_predict, num_ctx, stop, ...), keep_alive, format
+            **config.ollama_fields(),
         }
 
         # Ollama ALWAYS streams → must use stream=True
-        response = requests.post(url, json=payload, headers=headers, stream=True)
+        start = time.perf_counter()
+        ttft_ms = None
+        final = {}
+        response = requests.post(self.url, json=payload, headers=headers, stream=True, timeout=self.timeout)
         response.raise_for_status()
 
         final_output = ""
 
         for line in response.iter_lines():
+            if cancelled is not None and cancelled():
+                response.close()
+                break
             if not line:
                 continue
 
@@ -140,8 +116,17 @@ class OllamaHandler:
 
             # Append streamed LLM content
             if "message" in obj and "content" in obj["message"]:
+                if ttft_ms is None and obj["message"]["content"]:
+                    ttft_ms = (time.perf_counter() - start) * 1000
                 final_output += obj["message"]["content"]
 
+            # The last chunk carries token counts and durations
+            if obj.get("done"):
+                final = obj
+
+        wall_ms = (time.perf_counter() - start) * 1000
+        self.record_metrics(session_id, stage, self.model, final, ttft_ms, wall_ms)
+
         # Clean & return SQL
         return self.clean_SQL(final_output)
 
@@ -175,9 +160,19 @@ class OllamaHandler:
 
         return " ".join(final_lines).strip()
     
-    def interpret_response(self, executor_response, original_user_question):
+    def interpret_response(self, executor_response, original_user_question, session_id=None):
         """
         Interprets the result returned by the SQLExecutor using the LLM.
+        """
+        return "".join(
+            self.interpret_response_stream(executor_response, original_user_question, session_id)
+        ).strip()
+
+    def interpret_response_stream(self, executor_response, original_user_question, session_id=None):
+        """
+        Streaming variant of interpret_response: yields text pieces as Ollama
+        produces them (for st.write_stream). Closing the generator closes the
+        HTTP connection, which makes Ollama stop generating.
         
         executor_response structure:
         {
@@ -276,47 +271,65 @@ When creating tables:
 These anti-hallucination rules MUST be followed every time.
 
 """
+        # Columnar and token-budgeted instead of every row as indented JSON
+        compact = compact_result(
+            executor_response,
+            count_tokens=self.count_tokens,
+            token_budget=self.result_token_budget,
+        )
+
         user_payload = f"""
 The user originally asked: "{original_user_question}"
 
-Here is the raw executor response that you must interpret:
+Here is the executor response that you must interpret:
 
-{json.dumps(executor_response, indent=4)}
+Success: {executor_response["success"]}
+{compact["text"]}
 """
 
         headers = {"Content-Type": "application/json"}
         payload = {
-            "model": 'llama3.2:3b',
+            "model": self.interpret_model,
             "messages": [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_payload}
             ],
-            "temperature": 0.2,
-            "max_tokens": 400
+            "stream": True,
+            **self.configs["interpret"].ollama_fields(),
         }
 
         # IMPORTANT → STREAMING MODE (your Ollama ALWAYS streams)
+        start = time.perf_counter()
+        ttft_ms = None
+        final = {}
         response = requests.post(
-            "http://localhost:11434/api/chat",
+            self.url,
             json=payload,
             headers=headers,
-            stream=True
+            stream=True,
+            timeout=self.timeout
         )
         response.raise_for_status()
 
-        final_output = ""
-
-        # Parse NDJSON streaming chunks
-        for line in response.iter_lines():
-            if not line:
-                continue
-
-            try:
-                obj = json.loads(line.decode("utf-8"))
-            except json.JSONDecodeError:
-                continue
-
-            if "message" in obj and "content" in obj["message"]:
-                final_output += obj["message"]["content"]
-
-        return final_output.strip()
+        try:
+            # Parse NDJSON streaming chunks
+            for line in response.iter_lines():
+                if not line:
+                    continue
+
+                try:
+                    obj = json.loads(line.decode("utf-8"))
+                except json.JSONDecodeError:
+                    continue
+
+                if obj.get("done"):
+                    final = obj
+
+                if "message" in obj and "content" in obj["message"]:
+                    if ttft_ms is None and obj["message"]["content"]:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    yield obj["message"]["content"]
+        finally:
+            response.close()
+            wall_ms = (time.perf_counter() - start) * 1000
+            self.record_metrics(session_id, "interpret", self.interpret_model, final, ttft_ms, wall_ms)
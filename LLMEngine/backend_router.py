@@ -0,0 +1,388 @@
+"""
+Routes LLM calls across several Ollama hosts and llama.cpp servers.
+
+Configured from a JSON file (LLM_BACKENDS, default llm_backends.json):
+
+    {
+        "health_interval_s": 15,
+        "backends": [
+            {"name": "llama-local", "type": "llama.cpp", "weight": 2,
+             "url": "http://localhost:8000/generate"},
+            {"name": "ollama-gpu", "type": "ollama", "weight": 1,
+             "url": "http://gpu-box:11434/api/chat", "model": "gpt-oss"}
+        ]
+    }
+
+Each call goes to a healthy backend picked by weight. If it hasn't
+produced its first token (or, for non-streaming calls, its answer) within
+that backend's p95 for the same kind of call, a hedged duplicate goes to
+another healthy backend and whichever answers first wins; the loser is
+cancelled. Until a backend has MIN_SAMPLES latencies for a call kind it
+is only hedged after "hedge_after_s", if set (by default not at all).
+
+A backend answering 429 is busy, not down: it is skipped for a while
+(its Retry-After, or THROTTLE_S) while other backends have room.
+"""
+import os
+import json
+import time
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+from LLMEngine.Ollama_Handler import OllamaHandler
+from LLMEngine.LlamaCPP_Handler import LlamaCPPHandler
+from LLMEngine.llm_metrics import percentile
+
+CONFIG_PATH = os.environ.get("LLM_BACKENDS", "llm_backends.json")
+
+# Latency samples kept per backend and call kind for the p95 window
+WINDOW_SAMPLES = 50
+MIN_SAMPLES = 20
+
+# How long a backend that answered 429 without a Retry-After is skipped
+THROTTLE_S = 2.0
+
+
+class NoHealthyBackendError(RuntimeError):
+    pass
+
+
+class Backend:
+    def __init__(self, name, kind, url, weight=1, **handler_kwargs):
+        self.name = name
+        self.kind = kind
+        self.weight = weight
+
+        if kind == "ollama":
+            self.handler = OllamaHandler(url=url, **handler_kwargs)
+            self.health_url = url.split("/api/")[0] + "/api/tags"
+        elif kind == "llama.cpp":
+            self.handler = LlamaCPPHandler(api_url=url, **handler_kwargs)
+            self.health_url = url.rsplit("/", 1)[0] + "/metrics"
+        else:
+            raise ValueError(f"Unknown backend type '{kind}' for {name}. Use 'ollama' or 'llama.cpp'.")
+
+        self.healthy = True
+        self.checked_at = 0.0
+        self.busy_until = 0.0
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def check_health(self, timeout=2.0):
+        try:
+            requests.get(self.health_url, timeout=timeout).raise_for_status()
+            self.healthy = True
+        except requests.RequestException as e:
+            self.on_error(e)
+        self.checked_at = time.monotonic()
+        return self.healthy
+
+    @property
+    def busy(self):
+        return time.monotonic() < self.busy_until
+
+    def on_error(self, error):
+        """A 429 means the backend is busy; any other HTTP failure marks it unhealthy."""
+        if not isinstance(error, requests.RequestException):
+            return
+        response = getattr(error, "response", None)
+        if response is not None and response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get("Retry-After", THROTTLE_S))
+            except ValueError:
+                retry_after = THROTTLE_S
+            self.busy_until = time.monotonic() + retry_after
+            self.healthy = True
+        else:
+            self.healthy = False
+
+    def record(self, call_kind, seconds):
+        with self.lock:
+            self.latencies.setdefault(call_kind, deque(maxlen=WINDOW_SAMPLES)).append(seconds)
+
+    def p95(self, call_kind):
+        with self.lock:
+            samples = list(self.latencies.get(call_kind, ()))
+        return percentile(samples, 95) if len(samples) >= MIN_SAMPLES else None
+
+
+class BackendRouter:
+    """
+    Drop-in for OllamaHandler / LlamaCPPHandler in the apps: same SQL
+    and interpretation methods, served by whichever backend is fastest.
+    """
+
+    def __init__(self, backends, health_interval_s=15.0, hedge_after_s=None):
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend.")
+        self.backends = backends
+        self.health_interval_s = health_interval_s
+        self.hedge_after_s = hedge_after_s
+        self.pool = ThreadPoolExecutor(max_workers=4 * len(backends))
+        # Health checks get their own threads: a pool saturated by slow
+        # generations must not delay noticing that a backend is back
+        self.health_pool = ThreadPoolExecutor(max_workers=len(backends))
+        self.last_backend = None
+
+    @classmethod
+    def from_config(cls, path=CONFIG_PATH):
+        with open(path) as f:
+            config = json.load(f)
+
+        backends = []
+        for entry in config["backends"]:
+            entry = dict(entry)
+            backends.append(Backend(
+                entry.pop("name"), entry.pop("type"), entry.pop("url"),
+                weight=entry.pop("weight", 1), **entry,
+            ))
+
+        return cls(
+            backends,
+            health_interval_s=config.get("health_interval_s", 15.0),
+            hedge_after_s=config.get("hedge_after_s"),
+        )
+
+    @property
+    def label(self):
+        return f"router:{self.last_backend.name}" if self.last_backend else "router"
+
+    # ---------------------------------------------------------
+    #                  SELECTION / HEALTH
+    # ---------------------------------------------------------
+
+    def refresh_health(self):
+        """Re-check backends whose last check is older than the interval."""
+        stale = [b for b in self.backends if time.monotonic() - b.checked_at > self.health_interval_s]
+        if stale:
+            wait([self.health_pool.submit(b.check_health) for b in stale])
+
+    def pick(self, exclude=()):
+        self.refresh_health()
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        # Busy (429) backends only get traffic when nothing else is left
+        candidates = [b for b in candidates if not b.busy] or candidates
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=[b.weight for b in candidates])[0]
+
+    def hedge_window(self, backend, call_kind):
+        """Seconds to wait before hedging, or None to wait for the answer."""
+        p95 = backend.p95(call_kind)
+        return p95 if p95 is not None else self.hedge_after_s
+
+    def summary(self):
+        return [
+            {
+                "name": b.name,
+                "type": b.kind,
+                "weight": b.weight,
+                "healthy": b.healthy,
+                "busy": b.busy,
+                "p95_s": {kind: b.p95(kind) for kind in b.latencies},
+            }
+            for b in self.backends
+        ]
+
+    # ---------------------------------------------------------
+    #                   HEDGED CALLS
+    # ---------------------------------------------------------
+
+    def _timed(self, backend, call_kind, fn, cancelled):
+        start = time.perf_counter()
+        try:
+            result = fn(backend.handler, cancelled.is_set)
+        except Exception as e:
+            backend.on_error(e)
+            raise
+        if not cancelled.is_set():
+            backend.record(call_kind, time.perf_counter() - start)
+        return backend, result
+
+    def call(self, call_kind, fn):
+        """
+        Run fn(handler, cancelled) on one backend; hedge to a second one if
+        no answer arrives within the first backend's p95 for this call kind.
+        fn must pass `cancelled` on to the handler so the losing call stops.
+        """
+        primary = self.pick()
+        if primary is None:
+            raise NoHealthyBackendError("No healthy LLM backend.")
+
+        cancel = {}
+
+        def start(backend):
+            cancel[backend] = threading.Event()
+            return self.pool.submit(self._timed, backend, call_kind, fn, cancel[backend])
+
+        futures = {start(primary)}
+        done, _ = wait(futures, timeout=self.hedge_window(primary, call_kind))
+
+        # Hedge when the primary is slow, or failed outright
+        if not done or next(iter(done)).exception() is not None:
+            secondary = self.pick(exclude=(primary,))
+            if secondary is not None:
+                futures.add(start(secondary))
+
+        errors = []
+        try:
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for f in done:
+                    try:
+                        backend, result = f.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    self.last_backend = backend
+                    return result
+        finally:
+            # Stop the slower duplicate: not started yet, or mid-generation
+            for f in futures:
+                f.cancel()
+            for event in cancel.values():
+                event.set()
+
+        raise errors[0]
+
+    def _pump(self, backend, make_stream, out, cancelled):
+        """Move one backend's stream into `out` until it ends or loses."""
+        start = time.perf_counter()
+        first = True
+        stream = None
+        try:
+            stream = make_stream(backend.handler)
+            for piece in stream:
+                if cancelled.is_set():
+                    break
+                if first:
+                    backend.record("first_token", time.perf_counter() - start)
+                    first = False
+                out.put((backend, "token", piece))
+            out.put((backend, "done", None))
+        except Exception as e:
+            backend.on_error(e)
+            out.put((backend, "error", e))
+        finally:
+            if stream is not None:
+                stream.close()  # drops the HTTP connection; the server stops generating
+
+    def call_stream(self, make_stream):
+        """
+        Stream from one backend; if it hasn't produced a token within its
+        p95 time-to-first-token (or fails first), start a duplicate on a
+        second backend and keep whichever produces a token first.
+        """
+        primary = self.pick()
+        if primary is None:
+            raise NoHealthyBackendError("No healthy LLM backend.")
+
+        out = queue.Queue()
+        cancel = {}
+        active = set()
+
+        def start(backend):
+            cancel[backend] = threading.Event()
+            active.add(backend)
+            self.pool.submit(self._pump, backend, make_stream, out, cancel[backend])
+
+        def hedge():
+            backend = self.pick(exclude=tuple(cancel))
+            if backend is not None:
+                start(backend)
+
+        start(primary)
+        winner = None
+        hedged = False
+        errors = []
+        try:
+            while True:
+                timeout = None
+                if winner is None and not hedged:
+                    timeout = self.hedge_window(primary, "first_token")
+                try:
+                    backend, kind, data = out.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    hedge()
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        active.discard(backend)
+                        errors.append(data)
+                        if not hedged:
+                            hedged = True
+                            hedge()
+                        if not active:
+                            raise errors[0]
+                        continue
+
+                    # First token (or an empty answer) decides the race
+                    winner = backend
+                    self.last_backend = backend
+                    for other, event in cancel.items():
+                        if other is not winner:
+                            event.set()
+
+                if backend is not winner:
+                    continue
+
+                if kind == "token":
+                    yield data
+                elif kind == "done":
+                    return
+                else:
+                    raise data
+        finally:
+            for event in cancel.values():
+                event.set()
+
+    # ---------------------------------------------------------
+    #             HANDLER INTERFACE (as used by the apps)
+    # ---------------------------------------------------------
+
+    def generate_SQL(self, question, session_id=None, temperature=None):
+        kwargs = {"session_id": session_id}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        return self.call("sql", lambda h, cancelled: h.generate_SQL(question, cancelled=cancelled, **kwargs))
+
+    def repair_SQL(self, sql, error, fragment=None, session_id=None):
+        return self.call(
+            "sql", lambda h, cancelled: h.repair_SQL(sql, error, fragment, session_id=session_id, cancelled=cancelled)
+        )
+
+    def interpret_response_stream(self, executor_result, original_user_question, session_id=None):
+        yield from self.call_stream(
+            lambda h: h.interpret_response_stream(executor_result, original_user_question, session_id=session_id)
+        )
+
+    def interpret_response(self, executor_result, original_user_question, session_id=None):
+        return "".join(
+            self.interpret_response_stream(executor_result, original_user_question, session_id)
+        ).strip()
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def load_router(path=CONFIG_PATH):
+    """
+    The process-wide router for `path`, or None when there's no config
+    file (callers then use a single handler as before).
+    """
+    global _router
+    if not os.path.exists(path):
+        return None
+
+    with _router_lock:
+        if _router is None:
+            _router = BackendRouter.from_config(path)
+    return _router
@@ -0,0 +1,35 @@
+import os
+
+import duckdb
+import pytest
+
+# Two timesheet rows with the columns the SQL prompt, grounding and
+# candidate tests query
+SESSION_TABLE = """
+    SELECT * FROM (VALUES
+        ('Ramya Sri', 'R1021', '2025-11', 'P1', 8.0),
+        ('John Carter', 'R2044', '2025-10', 'P2', 6.5)
+    ) t("Resource Name", "Resource ID", "Financial Period (Posted Date)", "Project ID", "Posted Hours")
+"""
+
+
+@pytest.fixture
+def make_session(tmp_path):
+    """
+    make_session(session_id="s1", base_path=None, table=SESSION_TABLE)
+    creates a session database (under tmp_path by default) whose
+    sample_table is the `table` query, or no table when it is None.
+    Returns the base path.
+    """
+    def make(session_id="s1", base_path=None, table=SESSION_TABLE):
+        base_path = base_path or str(tmp_path)
+        os.makedirs(os.path.join(base_path, session_id))
+        conn = duckdb.connect(os.path.join(base_path, session_id, "duckdb.duckdb"))
+        try:
+            if table is not None:
+                conn.execute(f"CREATE TABLE sample_table AS {table}")
+        finally:
+            conn.close()
+        return base_path
+
+    return make
@@ -0,0 +1,110 @@
+import os
+from dataclasses import dataclass, field, replace
+from typing import List, Optional
+
+# How long Ollama keeps a model loaded after a call; every expiry costs a
+# full reload on the next question
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_THREAD = os.environ.get("OLLAMA_NUM_THREAD")
+
+# (connect, read) seconds for every HTTP call to a backend. The read timeout
+# bounds each wait for data (the first token, or the next one when
+# streaming), not the whole generation; without it a hung backend blocks
+# its caller (and the router's hedging threads) forever
+REQUEST_TIMEOUT = (
+    float(os.environ.get("LLM_CONNECT_TIMEOUT_S", 5)),
+    float(os.environ.get("LLM_READ_TIMEOUT_S", 120)),
+)
+
+
+def request_timeout(timeout):
+    """A timeout from JSON config ([connect, read] list) in the form requests accepts."""
+    return tuple(timeout) if isinstance(timeout, list) else timeout
+
+
+@dataclass(frozen=True)
+class GenerationConfig:
+    """
+    Sampling and resource limits for one pipeline stage, mapped onto each
+    backend's own request fields.
+    """
+    temperature: float = 0.0
+    max_tokens: int = 256                  # Ollama: num_predict
+    num_ctx: int = 4096                    # Ollama only; llama.cpp sets n_ctx at load
+    num_thread: Optional[int] = None       # Ollama only; None = Ollama's default
+    stop: List[str] = field(default_factory=list)
+    keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE
+    format: Optional[str] = None           # "json" constrains Ollama to valid JSON
+
+    def with_overrides(self, **overrides):
+        """Copy with the given fields replaced (None values are ignored)."""
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
+
+    def ollama_fields(self):
+        """
+        Fields for an Ollama /api/chat payload. Sampling and limits must go
+        under "options"; top-level temperature/max_tokens are ignored.
+        """
+        options = {
+            "temperature": self.temperature,
+            "num_predict": self.max_tokens,
+            "num_ctx": self.num_ctx,
+        }
+        if self.num_thread:
+            options["num_thread"] = self.num_thread
+        if self.stop:
+            options["stop"] = list(self.stop)
+
+        fields = {"options": options}
+        if self.keep_alive is not None:
+            fields["keep_alive"] = self.keep_alive
+        if self.format:
+            fields["format"] = self.format
+        return fields
+
+    def llama_cpp_fields(self):
+        """Fields for a LlamaCPPServer /generate payload."""
+        return {
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stop": list(self.stop),
+        }
+
+
+# ---------------------------------------------------------
+#                 PER-STAGE DEFAULTS
+# ---------------------------------------------------------
+# Context sizes: the stage's prompt (system prompt + payload) plus its
+# output cap, rounded up. Smaller contexts load and evaluate faster.
+# SQL stages stop at ";" + newline, not at any ";": a semicolon inside a
+# string literal ('a;b') would cut the query short. clean_SQL trims
+# whatever follows the statement.
+SQL_STOP = [";\n"]
+
+STAGE_CONFIGS = {
+    # ~800-token pruned schema prompt + question; one statement
+    "sql": GenerationConfig(
+        temperature=0.0,
+        max_tokens=300,
+        num_ctx=2048,
+        stop=list(SQL_STOP),
+        num_thread=int(OLLAMA_NUM_THREAD) if OLLAMA_NUM_THREAD else None,
+    ),
+    # Failed query + short error + fragment; same output shape as "sql"
+    "repair": GenerationConfig(
+        temperature=0.0,
+        max_tokens=300,
+        num_ctx=2048,
+        stop=list(SQL_STOP),
+        num_thread=int(OLLAMA_NUM_THREAD) if OLLAMA_NUM_THREAD else None,
+    ),
+    # ~900-token interpreter prompt + result compacted to 1200 tokens;
+    # one paragraph of explanation
+    "interpret": GenerationConfig(
+        temperature=0.2,
+        max_tokens=400,
+        num_ctx=4096,
+        num_thread=int(OLLAMA_NUM_THREAD) if OLLAMA_NUM_THREAD else None,
+    ),
+}
+
@@ -0,0 +1,344 @@
+"""
+Answers common questions from parameterized SQL templates, without an LLM.
+
+The question is matched to the nearest labelled example (embedding
+similarity); the example's intent picks a template, and its slots are
+filled from the question:
+
+    {entity}  a resource or project, resolved with Invoicer's rapidfuzz
+              matching against the session's own values
+    {period}  a month name or YYYY-MM, via Invoicer.convert_period
+
+Anything not confidently matched (low similarity, an ambiguous intent, an
+unresolved name, words the template has no slot for, or a negation or
+exclusion the templates can't express) returns None and goes to the LLM
+as before.
+"""
+import os
+import re
+import threading
+
+from rapidfuzz import fuzz, utils
+
+from LLMEngine.prompt_builder import SentenceTransformer, embed, _similarities
+from InvoiceEngine.Invoicer import Invoicer
+
+# Cosine similarity needed to trust the nearest example. Lexical fallback
+# vectors (no sentence-transformers) score lower for the same paraphrase.
+MIN_SIMILARITY = float(os.environ.get(
+    "INTENT_MIN_SIMILARITY", 0.75 if SentenceTransformer is not None else 0.6
+))
+# The runner-up intent must trail the best one by at least this much
+MIN_MARGIN = 0.05
+# rapidfuzz WRatio score needed to accept a resource/project match
+MIN_ENTITY_SCORE = 85
+
+# Templates only filter *for* a value; "except Ramya" or "excluding
+# November" would otherwise be answered as if the modifier were absent
+NEGATION = re.compile(
+    r"\b(?:not|no|non|none|nor|neither|never|except|excepting|excluding|exclude[sd]?|"
+    r"without|besides|minus|other than|apart from|but|aside from|instead of)\b|n't\b",
+    re.IGNORECASE,
+)
+
+PERIOD_COLUMN = "Financial Period (Posted Date)"
+ENTITY_COLUMNS = {
+    ("resource", "name"): "Resource Name",
+    ("resource", "id"): "Resource ID",
+    ("project", "name"): "Project Name",
+    ("project", "id"): "Project ID",
+}
+
+# ---------------------------------------------------------
+#                   TEMPLATE LIBRARY
+# ---------------------------------------------------------
+# "entity": which kinds of {entity} the template can filter on.
+# "conditions": fixed WHERE terms; slot filters are ANDed after them.
+INTENTS = {
+    "hours_per_resource": {
+        "sql": ('SELECT "Resource Name", SUM("Posted Hours") AS total_hours\n'
+                'FROM sample_table{where}\n'
+                'GROUP BY "Resource Name"\n'
+                'ORDER BY total_hours DESC'),
+        "entity": ("project",),
+        "entity_required": False,
+        "examples": [
+            "Total posted hours per resource",
+            "How many hours did each resource log?",
+            "Show hours by resource for {period}",
+            "Hours per resource on project {entity}",
+            "Which resources logged the most hours?",
+        ],
+    },
+    "hours_per_project": {
+        "sql": ('SELECT "Project ID", "Project Name", SUM("Posted Hours") AS total_hours\n'
+                'FROM sample_table{where}\n'
+                'GROUP BY "Project ID", "Project Name"\n'
+                'ORDER BY total_hours DESC'),
+        "entity": ("resource",),
+        "entity_required": False,
+        "examples": [
+            "Total hours per project",
+            "How many hours were posted on each project?",
+            "Show hours by project for {period}",
+            "Hours per project for {entity}",
+            "Which projects have the most hours?",
+        ],
+    },
+    "entity_hours": {
+        "sql": ('SELECT SUM("Posted Hours") AS total_hours\n'
+                'FROM sample_table{where}'),
+        "entity": ("resource", "project"),
+        "entity_required": True,
+        "examples": [
+            "How many hours did {entity} log?",
+            "Total hours for {entity} in {period}",
+            "Hours posted by {entity}",
+            "How many hours were logged on {entity} in {period}?",
+        ],
+    },
+    "billable_amount": {
+        "sql": ('SELECT SUM("Posted Hours") AS total_hours,\n'
+                '       SUM("Posted Hours" * "Resource Rate") AS billable_amount\n'
+                'FROM sample_table{where}'),
+        "entity": ("resource", "project"),
+        "entity_required": True,
+        "examples": [
+            "Billable amount for {entity} in {period}",
+            "How much can we bill for {entity} in {period}?",
+            "What is the invoice amount for {entity}?",
+            "Total billing for {entity} for {period}",
+        ],
+    },
+    "late_entries": {
+        "sql": ('SELECT *\n'
+                'FROM sample_table{where}\n'
+                'ORDER BY "Posted Date"'),
+        "conditions": ['"Posted Date" > "Actual Date"'],
+        "entity": ("resource", "project"),
+        "entity_required": False,
+        "examples": [
+            "Show entries posted after the actual date",
+            "Which hours were logged late?",
+            "Late posted entries for {entity}",
+            "Show rows where Posted Date is after Actual Date in {period}",
+        ],
+    },
+}
+
+LABELLED = [(text, intent) for intent, spec in INTENTS.items() for text in spec["examples"]]
+
+MONTHS = ("january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december")
+PERIOD_PATTERN = re.compile(
+    r"\b(\d{4}-\d{2})\b|\b(" + "|".join(MONTHS) + r")(?:\s*,?\s*(\d{4}))?\b",
+    re.IGNORECASE,
+)
+TOKEN = re.compile(r"[\w&.'-]+")
+
+# Words the templates themselves use; anything else in a question is
+# taken to be a name
+VOCABULARY = {
+    w.lower() for text, _ in LABELLED for w in TOKEN.findall(text.replace("{entity}", "").replace("{period}", ""))
+} | {"the", "a", "an", "for", "in", "of", "on", "by", "to", "me", "please", "all", "list",
+     "give", "get", "what", "were", "was", "are", "per", "month", "period", "during", "did",
+     "has", "have", "total", "much", "many", "posted", "logged", "worked", "spent", "from",
+     "resource", "project", "hours", "amount", "entries", "rows", "is", "with", "and"}
+
+
+# ---------------------------------------------------------
+#                     CLASSIFICATION
+# ---------------------------------------------------------
+_example_vectors = None
+_vectors_lock = threading.Lock()
+
+
+def example_similarities(question):
+    """Similarity of `question` to every labelled example, in LABELLED order."""
+    global _example_vectors
+    texts = [text for text, _ in LABELLED]
+
+    # Lexical fallback vectors depend on the texts compared together
+    if SentenceTransformer is None:
+        return _similarities(question, texts)
+
+    with _vectors_lock:
+        if _example_vectors is None:
+            _example_vectors = embed(texts)
+    return _example_vectors @ embed([question])[0]
+
+
+def classify(question):
+    """
+    (intent, similarity) of the nearest labelled example, or (None, score)
+    when it isn't close enough or another intent is nearly as close.
+    """
+    scores = example_similarities(question)
+    best = {}
+    for (_, intent), score in zip(LABELLED, scores):
+        best[intent] = max(best.get(intent, -1.0), float(score))
+
+    ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    intent, score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+
+    if score < MIN_SIMILARITY or score - runner_up < MIN_MARGIN:
+        return None, score
+    return intent, score
+
+
+# ---------------------------------------------------------
+#                     SLOT EXTRACTION
+# ---------------------------------------------------------
+def split_period(question):
+    """(question with the period replaced by {period}, period text or None)."""
+    match = PERIOD_PATTERN.search(question)
+    if not match:
+        return question, None
+    return question[:match.start()] + "{period}" + question[match.end():], match.group(0)
+
+
+def split_entity(question):
+    """
+    (question with each run of words outside the template vocabulary
+    replaced by {entity}, the runs as strings).
+    """
+    runs, current = [], []
+    for token in TOKEN.findall(question):
+        word = re.sub(r"'s$", "", token).strip(".'-")
+        if word and word.lower() not in VOCABULARY:
+            current.append(word)
+        elif current:
+            runs.append(" ".join(current))
+            current = []
+    if current:
+        runs.append(" ".join(current))
+
+    normalised = question
+    for run in runs:
+        pattern = r"\W+".join(map(re.escape, run.split()))
+        normalised = re.sub(pattern + r"(?:'s)?", "{entity}", normalised, count=1)
+    return normalised, runs
+
+
+def covers(value, text, min_score=MIN_ENTITY_SCORE):
+    """
+    Every word of `text` matches a word of `value` (fuzz.ratio), so
+    "ramya" covers "Ramya Sri" but "everyone ramya" doesn't: WRatio's
+    partial matching alone scores both 85+.
+    """
+    value_words = utils.default_process(str(value)).split()
+    text_words = utils.default_process(text).split()
+    return bool(text_words) and all(
+        any(fuzz.ratio(word, candidate) >= min_score for candidate in value_words)
+        for word in text_words
+    )
+
+
+class IntentRouter:
+    """
+    Template answers for one session. Entity slots are resolved against
+    the session's own resource/project values.
+    """
+
+    def __init__(self, session_id, base_path="Data/sessions"):
+        self.session_id = session_id
+        self.base_path = base_path
+
+    def resolve_period(self, invoicer, text):
+        """YYYY-MM for a month name (optionally with a year) or YYYY-MM."""
+        match = PERIOD_PATTERN.fullmatch(text.strip())
+        period = invoicer.convert_period(match.group(1) or match.group(2))
+        if match.group(3):
+            # convert_period assumes the current year
+            period = f"{match.group(3)}{period[4:]}"
+        return period
+
+    def resolve_entity(self, invoicer, text, kinds):
+        """(column, value, score) of the best match over `kinds`, or None."""
+        candidates = []
+        if "resource" in kinds:
+            candidates += [("resource", m) for m in invoicer.match_resource(text)]
+        if "project" in kinds:
+            candidates += [("project", m) for m in invoicer.match_project(text)]
+        if not candidates:
+            return None
+
+        kind, best = max(candidates, key=lambda c: c[1]["score"])
+        if best["score"] < MIN_ENTITY_SCORE or not covers(best["match"], text):
+            return None
+        return ENTITY_COLUMNS[(kind, best["type"])], best["match"], best["score"]
+
+    def route(self, question):
+        """
+        Returns None (send the question to the LLM) or:
+            {
+                "intent": str,
+                "similarity": float,
+                "sql": str,             with ? placeholders
+                "params": list,         values for the placeholders
+                "slots": dict           resolved slot values
+            }
+        """
+        if NEGATION.search(question):
+            return None
+
+        normalised, period_text = split_period(question)
+        normalised, names = split_entity(normalised)
+        if len(names) > 1:
+            # Only one entity slot per template
+            return None
+        entity_text = names[0] if names else None
+
+        intent, similarity = classify(normalised)
+        if intent is None:
+            return None
+
+        spec = INTENTS[intent]
+        if entity_text and not spec["entity"]:
+            return None
+        if spec["entity_required"] and not entity_text:
+            return None
+
+        invoicer = Invoicer(self.session_id, base_path=self.base_path)
+        try:
+            conditions = list(spec.get("conditions", []))
+            params = []
+            slots = {}
+
+            if entity_text:
+                entity = self.resolve_entity(invoicer, entity_text, spec["entity"])
+                if entity is None:
+                    return None
+                column, value, score = entity
+                conditions.append(f'"{column}" = ?')
+                params.append(value)
+                slots["entity"] = {"column": column, "value": value, "score": score}
+
+            if period_text:
+                try:
+                    period = self.resolve_period(invoicer, period_text)
+                except ValueError:
+                    return None
+                conditions.append(f'"{PERIOD_COLUMN}" = ?')
+                params.append(period)
+                slots["period"] = period
+        finally:
+            invoicer.close()
+
+        where = "\nWHERE " + "\n  AND ".join(conditions) if conditions else ""
+        return {
+            "intent": intent,
+            "similarity": round(similarity, 3),
+            "sql": spec["sql"].format(where=where),
+            "params": params,
+            "slots": slots,
+        }
+
+
+def route_question(question, session_id, base_path="Data/sessions"):
+    """IntentRouter(session_id).route(question); None if the session has no database."""
+    # Invoicer would create an empty database rather than fail
+    if not os.path.exists(os.path.join(base_path, session_id, "duckdb.duckdb")):
+        return None
+    return IntentRouter(session_id, base_path).route(question)
@@ -0,0 +1,117 @@
+import os
+import math
+import json
+import datetime
+import threading
+
+BASE_PATH = "Data/sessions"
+METRICS_FILE = "llm_metrics.jsonl"
+
+# Calls made outside a session are kept in memory only
+_unsessioned = []
+_lock = threading.Lock()
+
+
+def metrics_path(session_id, base_path=BASE_PATH):
+    return os.path.join(base_path, session_id, METRICS_FILE)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of samples, rounded to 2 places (None if empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(math.ceil(pct / 100 * len(ordered))) - 1)
+    return round(ordered[max(idx, 0)], 2)
+
+
+def _rate(tokens, ms):
+    if not tokens or not ms:
+        return None
+    return round(tokens / (ms / 1000), 2)
+
+
+def record_call(session_id, stage, backend, model, prompt_tokens=None, completion_tokens=None,
+                ttft_ms=None, wall_ms=None, prompt_eval_ms=None, eval_ms=None,
+                cached_tokens=None, base_path=BASE_PATH):
+    """
+    Append one LLM call to the session's metrics store.
+
+    stage: "sql", "repair" or "interpret". prompt_eval_ms / eval_ms are the
+    backend's own prompt-processing and decoding times when it reports them.
+    """
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "session_id": session_id,
+        "stage": stage,
+        "backend": backend,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "wall_ms": round(wall_ms, 1) if wall_ms is not None else None,
+        "prompt_eval_ms": round(prompt_eval_ms, 1) if prompt_eval_ms is not None else None,
+        "eval_ms": round(eval_ms, 1) if eval_ms is not None else None,
+        "prompt_tok_s": _rate(prompt_tokens, prompt_eval_ms),
+        "decode_tok_s": _rate(completion_tokens, eval_ms),
+    }
+
+    with _lock:
+        if session_id is None:
+            _unsessioned.append(record)
+            return record
+
+        path = metrics_path(session_id, base_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return record
+
+
+def load_metrics(session_id=None, base_path=BASE_PATH):
+    if session_id is None:
+        with _lock:
+            return list(_unsessioned)
+
+    path = metrics_path(session_id, base_path)
+    if not os.path.exists(path):
+        return []
+
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+SUMMARY_FIELDS = ("prompt_tokens", "completion_tokens", "ttft_ms", "prompt_eval_ms",
+                  "eval_ms", "wall_ms", "prompt_tok_s", "decode_tok_s")
+
+
+def stage_summary(records):
+    """
+    Per (stage, model): call count and p50/p95 of every timing/token field.
+    """
+    groups = {}
+    for r in records:
+        groups.setdefault((r["stage"], r["model"]), []).append(r)
+
+    rows = []
+    for (stage, model), calls in sorted(groups.items(), key=lambda g: (g[0][0], str(g[0][1]))):
+        row = {"stage": stage, "model": model, "calls": len(calls)}
+        for field in SUMMARY_FIELDS:
+            values = [c[field] for c in calls if c.get(field) is not None]
+            row[f"{field}_p50"] = percentile(values, 50)
+            row[f"{field}_p95"] = percentile(values, 95)
+        rows.append(row)
+    return rows
+
+
+def bottleneck(row):
+    """
+    Which phase dominates a stage's latency: prompt evaluation (prompt
+    too large) or decoding (too many / too slow output tokens).
+    """
+    prompt_ms, decode_ms = row.get("prompt_eval_ms_p50"), row.get("eval_ms_p50")
+    if prompt_ms is None or decode_ms is None:
+        return "unknown"
+    return "prompt size" if prompt_ms > decode_ms else "decode speed"
@@ -0,0 +1,130 @@
+import re
+import datetime
+from decimal import Decimal
+
+# Results at or below these sizes are described locally instead of by the LLM
+MAX_LOCAL_COLUMNS = 6   # single-row results
+MAX_LOCAL_ROWS = 10     # single-column results
+
+
+# ---------------------------------------------------------
+#                 WELL-KNOWN DUCKDB ERRORS
+# ---------------------------------------------------------
+# (pattern, explanation template); groups are filled in from the match
+ERROR_RULES = [
+    (
+        re.compile(r'Referenced column "?([^"]+?)"? not found', re.I),
+        'The query refers to a column named "{0}", which does not exist in the data. '
+        "Check the spelling, or ask about one of the uploaded columns.",
+    ),
+    (
+        re.compile(r"Table with name (\S+) does not exist", re.I),
+        'The query refers to a table named {0}, which does not exist. '
+        "All uploaded data lives in the table sample_table.",
+    ),
+    (
+        re.compile(r'syntax error at or near "([^"]*)"', re.I),
+        'The generated SQL is not valid (syntax error near "{0}"). '
+        "Try rephrasing the question, or correct the SQL and run it again.",
+    ),
+    (
+        re.compile(r"Could not convert string '([^']*)' to (\w+)", re.I),
+        'The value "{0}" could not be used as a {1}. '
+        "Make sure numbers and dates in the question are written in the same format as the data.",
+    ),
+    (
+        re.compile(r"No function matches the given name and argument types '([^']+)'", re.I),
+        "The function call {0} does not fit the column types it was given "
+        "(for example, summing a text column). Try rephrasing the question.",
+    ),
+    (
+        re.compile(r"No DuckDB database found for session_id='([^']+)'", re.I),
+        'There is no database for session {0}. Upload a CSV to create the session first.',
+    ),
+]
+
+
+def explain_error(error):
+    """
+    Plain-language explanation of a well-known execution error, or None
+    when the cause isn't obvious.
+    """
+    for pattern, template in ERROR_RULES:
+        match = pattern.search(error or "")
+        if match:
+            return template.format(*match.groups())
+    return None
+
+
+# ---------------------------------------------------------
+#                      FORMATTING
+# ---------------------------------------------------------
+
+def format_value(v):
+    if v is None:
+        return "empty"
+    if isinstance(v, bool):
+        return str(v)
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        v = float(v)
+    if isinstance(v, float):
+        return f"{int(v):,}" if v.is_integer() else f"{round(v, 2):,}"
+    if isinstance(v, int):
+        return f"{v:,}"
+    return str(v)
+
+
+# ---------------------------------------------------------
+#                   RESULT SUMMARIES
+# ---------------------------------------------------------
+
+def summarize_locally(executor_result, question=None):
+    """
+    Deterministic description of a trivial result, or None when the
+    result is worth an LLM interpretation.
+
+    Handled: well-known errors, empty results, single values, single rows
+    with a few columns and short single-column lists.
+    """
+    subject = f' for "{question}"' if question else ""
+
+    if not executor_result.get("success"):
+        explanation = explain_error(executor_result.get("error"))
+        return f"The query could not be run. {explanation}" if explanation else None
+
+    columns = executor_result.get("columns") or []
+    rows = executor_result.get("rows") or []
+
+    if not rows:
+        return f"The query ran successfully but returned no rows{subject}. " \
+               "Nothing in the data matches the conditions asked for."
+
+    if len(rows) == 1 and len(columns) == 1:
+        return f"The result{subject} is {format_value(rows[0][0])} ({columns[0]})."
+
+    if len(rows) == 1 and len(columns) <= MAX_LOCAL_COLUMNS:
+        fields = "\n".join(f"- **{c}**: {format_value(v)}" for c, v in zip(columns, rows[0]))
+        return f"The query returned a single row{subject}:\n\n{fields}"
+
+    if len(columns) == 1 and len(rows) <= MAX_LOCAL_ROWS:
+        items = "\n".join(f"- {format_value(r[0])}" for r in rows)
+        return f"The query returned {len(rows)} values of {columns[0]}{subject}:\n\n{items}"
+
+    return None
+
+
+def interpret_stream(handler, executor_result, question, session_id=None):
+    """
+    Policy layer: trivial results (see summarize_locally) are described
+    locally in milliseconds; only multi-row, multi-column results and
+    unfamiliar errors are worth the handler's LLM round-trip.
+    Yields text pieces either way (for st.write_stream).
+    """
+    summary = summarize_locally(executor_result, question)
+    if summary is not None:
+        yield summary
+        return
+
+    yield from handler.interpret_response_stream(executor_result, question, session_id=session_id)
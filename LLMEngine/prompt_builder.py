@@ -0,0 +1,368 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import duckdb
+import numpy as np
+
+from ExecutorEngine.executor import SQLExecutor
+from DatabaseEngine.embeddings import EMBED_MODEL, SentenceTransformer, get_model
+
+# ---------------------------------------------------------
+#      STABLE RULES HEADER (identical for every question)
+# ---------------------------------------------------------
+# Every SQL prompt starts with exactly this text, so the llama.cpp server
+# can keep its evaluated KV state cached (see PROMPT_PREFIXES).
+SQL_RULES = """
+You are an SQL query generator.
+Your ONLY job is to output a valid SQL query.
+
+===========================
+      STRICT RULES
+===========================
+1. Output ONLY the SQL query.
+2. Do NOT add explanations, notes, markdown, or backticks.
+3. Do NOT rewrite the schema.
+4. Do NOT add comments in the SQL.
+5. Use ONLY the columns exactly as they appear in the schema.
+6. Use ONLY the table name: sample_table.
+7. If the user provides meanings for columns, use them ONLY for query logic.
+8. If a request is ambiguous, generate the simplest valid SQL query.
+9. NEVER invent columns, tables, or functions that do not exist.
+10. All dates are real DATE types unless shown as VARCHAR.
+11. Assume queries run on DuckDB unless the user specifies otherwise.
+
+===========================
+     CHAIN-OF-THOUGHT
+===========================
+Do NOT reveal chain-of-thought or internal reasoning steps.
+Do NOT provide your chain-of-thought. Provide only the final SQL query.
+
+"""
+
+# Static prompt for callers without a session (no live table to introspect)
+SQL_SYSTEM_PROMPT = SQL_RULES + """===========================
+         SCHEMA
+===========================
+Columns in table sample_table are:
+
+- Project Financial Location (VARCHAR)
+- Project ID (VARCHAR)
+- Project Name (VARCHAR)
+- Project Manager (VARCHAR)
+- Resource Name (VARCHAR)
+- Resource ID (VARCHAR)
+- Resource Financial Location (VARCHAR)
+- Posted Hours (DOUBLE)
+- Project Task Name (VARCHAR)
+- Project Task ID (VARCHAR)
+- Actual Date (DATE)
+- Posted Date (DATE)
+- Financial Period (Posted Date) (VARCHAR, format: YYYY-MM)
+- Resource Financial Department (VARCHAR)
+- Project Financial Department (VARCHAR)
+- Project Class (VARCHAR)
+- Timesheet Week (Actual Date) (VARCHAR)
+- Timesheet Week (Posted Date) (VARCHAR)
+- Resource Rate (DOUBLE)
+- Project Rate (VARCHAR)
+- Resource Primary Role (VARCHAR)
+- Resource Project Role (VARCHAR)
+- Resource Currency (VARCHAR)
+
+===========================
+     COLUMN MEANINGS
+===========================
+Use these ONLY when required for logic:
+
+- Actual Date:
+  The date on which the work/hours actually occurred.
+
+- Posted Date:
+  The date on which the resource logged the hours into the system.
+  A resource may log hours for a past Actual Date at a later Posted Date.
+
+- Financial Period (Posted Date):
+  A string like "2025-11" representing the financial month of the Posted Date.
+
+All other fields (Project ID, Resource Name, Posted Hours, etc.) behave normally.
+
+===========================
+     FEW-SHOT EXAMPLES
+===========================
+
+User: Get total Posted Hours per Resource Name.
+Assistant:
+SELECT "Resource Name", SUM("Posted Hours") AS total_hours
+FROM sample_table
+GROUP BY "Resource Name";
+
+User: Show rows where Posted Date is after Actual Date.
+Assistant:
+SELECT *
+FROM sample_table
+WHERE "Posted Date" > "Actual Date";
+
+User: Count number of entries per Financial Period (Posted Date).
+Assistant:
+SELECT "Financial Period (Posted Date)", COUNT(*) AS entry_count
+FROM sample_table
+GROUP BY "Financial Period (Posted Date)";
+"""
+
+# ---------------------------------------------------------
+#                 CURATED KNOWLEDGE
+# ---------------------------------------------------------
+# Meanings for columns whose semantics aren't obvious from the name
+COLUMN_NOTES = {
+    "Actual Date": "The date on which the work/hours actually occurred.",
+    "Posted Date": (
+        "The date on which the resource logged the hours into the system.\n"
+        "  A resource may log hours for a past Actual Date at a later Posted Date."
+    ),
+    "Financial Period (Posted Date)": (
+        'A string like "2025-11" representing the financial month of the Posted Date.'
+    ),
+}
+
+# Few-shot library; only the examples closest to the question are sent
+EXAMPLE_LIBRARY = [
+    ("Get total Posted Hours per Resource Name.",
+     'SELECT "Resource Name", SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'GROUP BY "Resource Name";'),
+    ("Show rows where Posted Date is after Actual Date.",
+     'SELECT *\n'
+     'FROM sample_table\n'
+     'WHERE "Posted Date" > "Actual Date";'),
+    ("Count number of entries per Financial Period (Posted Date).",
+     'SELECT "Financial Period (Posted Date)", COUNT(*) AS entry_count\n'
+     'FROM sample_table\n'
+     'GROUP BY "Financial Period (Posted Date)";'),
+    ("Total hours per project.",
+     'SELECT "Project ID", "Project Name", SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'GROUP BY "Project ID", "Project Name";'),
+    ("Which resources worked on project Apollo?",
+     'SELECT DISTINCT "Resource Name"\n'
+     'FROM sample_table\n'
+     'WHERE "Project Name" ILIKE \'%Apollo%\';'),
+    ("Who is the project manager of project P-1001?",
+     'SELECT DISTINCT "Project Manager"\n'
+     'FROM sample_table\n'
+     'WHERE "Project ID" = \'P-1001\';'),
+    ("How many hours did Ramya log in 2025-11?",
+     'SELECT SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'WHERE "Resource Name" ILIKE \'%Ramya%\'\n'
+     '  AND "Financial Period (Posted Date)" = \'2025-11\';'),
+    ("What is the billable amount per resource (hours times rate)?",
+     'SELECT "Resource Name", "Resource Currency", SUM("Posted Hours" * "Resource Rate") AS amount\n'
+     'FROM sample_table\n'
+     'GROUP BY "Resource Name", "Resource Currency";'),
+    ("Top 5 resources by hours.",
+     'SELECT "Resource Name", SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'GROUP BY "Resource Name"\n'
+     'ORDER BY total_hours DESC\n'
+     'LIMIT 5;'),
+    ("Hours per task for project P-1001.",
+     'SELECT "Project Task Name", SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'WHERE "Project ID" = \'P-1001\'\n'
+     'GROUP BY "Project Task Name";'),
+    ("Hours worked per week in November 2025.",
+     'SELECT "Timesheet Week (Actual Date)", SUM("Posted Hours") AS total_hours\n'
+     'FROM sample_table\n'
+     'WHERE "Actual Date" BETWEEN DATE \'2025-11-01\' AND DATE \'2025-11-30\'\n'
+     'GROUP BY "Timesheet Week (Actual Date)"\n'
+     'ORDER BY "Timesheet Week (Actual Date)";'),
+    ("How many distinct resources are in each department?",
+     'SELECT "Resource Financial Department", COUNT(DISTINCT "Resource ID") AS resources\n'
+     'FROM sample_table\n'
+     'GROUP BY "Resource Financial Department";'),
+    ("List the roles each resource has played on projects.",
+     'SELECT DISTINCT "Resource Name", "Resource Primary Role", "Resource Project Role"\n'
+     'FROM sample_table;'),
+    ("Which entries were logged more than 30 days late?",
+     'SELECT "Resource Name", "Project Name", "Actual Date", "Posted Date"\n'
+     'FROM sample_table\n'
+     'WHERE "Posted Date" - "Actual Date" > 30;'),
+]
+
+QUOTED_IDENTIFIER = re.compile(r'"([^"]+)"')
+
+
+# ---------------------------------------------------------
+#                      EMBEDDINGS
+# ---------------------------------------------------------
+def _words(text):
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def embed(texts):
+    """
+    Unit-normalised embeddings. Without sentence-transformers, falls back
+    to bag-of-words vectors so selection still works (lexically).
+    """
+    if SentenceTransformer is not None:
+        # Shared with the vector stores; loaded once per process
+        return get_model(EMBED_MODEL).encode(texts)
+
+    vocab = sorted(set().union(*(_words(t) for t in texts)))
+    index = {w: i for i, w in enumerate(vocab)}
+    vectors = np.zeros((len(texts), max(len(vocab), 1)), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for w in _words(text):
+            vectors[row, index[w]] = 1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def _similarities(question, texts):
+    vectors = embed([question] + list(texts))
+    return vectors[1:] @ vectors[0]
+
+
+# ---------------------------------------------------------
+#                    PROMPT BUILDER
+# ---------------------------------------------------------
+
+class SQLPromptBuilder:
+    """
+    Builds a minimal SQL system prompt for one session: the stable rules
+    header, then only the live columns and few-shot examples relevant to
+    the question.
+    """
+
+    def __init__(self, session_id, base_path="Data/sessions", top_columns=8, top_examples=3):
+        self.session_id = session_id
+        self.executor = SQLExecutor(base_path=base_path)
+        self.top_columns = top_columns
+        self.top_examples = top_examples
+        self._schema = None
+        self._schema_mtime = None
+
+    def describe(self):
+        """
+        [(column, type)] of the live sample_table, as read_csv_auto created it.
+        Re-read whenever the session database changes.
+        """
+        db_path = self.executor._get_duckdb_path(self.session_id)
+        mtime = os.path.getmtime(db_path)
+
+        if self._schema is None or mtime != self._schema_mtime:
+            conn = self.executor.load_connection(self.session_id)
+            try:
+                rows = conn.execute("DESCRIBE sample_table").fetchall()
+            finally:
+                conn.close()
+            self._schema = [(r[0], r[1]) for r in rows]
+            self._schema_mtime = mtime
+
+        return self._schema
+
+    def select_examples(self, question, columns):
+        # Only examples that are valid against the live table
+        usable = [
+            (q, sql) for q, sql in EXAMPLE_LIBRARY
+            if set(QUOTED_IDENTIFIER.findall(sql)) <= columns
+        ]
+        if not usable:
+            return []
+
+        scores = _similarities(question, [q for q, _ in usable])
+        order = np.argsort(-scores)[: self.top_examples]
+        return [usable[i] for i in order]
+
+    def select_columns(self, question, schema, examples):
+        if len(schema) <= self.top_columns:
+            return schema
+
+        described = [
+            f"{name} ({dtype}): {COLUMN_NOTES.get(name, '')}" for name, dtype in schema
+        ]
+        scores = _similarities(question, described)
+        keep = {schema[i][0] for i in np.argsort(-scores)[: self.top_columns]}
+
+        # Columns named in the question or used by the chosen examples
+        lowered = question.lower()
+        keep |= {name for name, _ in schema if name.lower() in lowered}
+        for _, sql in examples:
+            keep |= set(QUOTED_IDENTIFIER.findall(sql))
+
+        # Keep the table's own column order
+        return [(name, dtype) for name, dtype in schema if name in keep]
+
+    def build(self, question):
+        schema = self.describe()
+        examples = self.select_examples(question, {name for name, _ in schema})
+        columns = self.select_columns(question, schema, examples)
+
+        parts = [SQL_RULES]
+
+        parts.append(
+            "===========================\n"
+            "         SCHEMA\n"
+            "===========================\n"
+            "Relevant columns in table sample_table are:\n\n"
+            + "\n".join(f"- {name} ({dtype})" for name, dtype in columns)
+            + "\n"
+        )
+
+        notes = [(name, COLUMN_NOTES[name]) for name, _ in columns if name in COLUMN_NOTES]
+        if notes:
+            parts.append(
+                "\n===========================\n"
+                "     COLUMN MEANINGS\n"
+                "===========================\n"
+                "Use these ONLY when required for logic:\n\n"
+                + "\n\n".join(f"- {name}:\n  {note}" for name, note in notes)
+                + "\n"
+            )
+
+        if examples:
+            parts.append(
+                "\n===========================\n"
+                "     FEW-SHOT EXAMPLES\n"
+                "===========================\n\n"
+                + "\n\n".join(f"User: {q}\nAssistant:\n{sql}" for q, sql in examples)
+                + "\n"
+            )
+
+        return "".join(parts)
+
+
+# Most recently used sessions whose builders (and cached schemas) are kept
+BUILDER_CACHE_SIZE = int(os.environ.get("PROMPT_BUILDER_CACHE_SIZE", 64))
+
+_builders = OrderedDict()
+_builders_lock = threading.Lock()
+
+
+def _builder(session_id, base_path):
+    key = (session_id, base_path)
+    with _builders_lock:
+        builder = _builders.get(key)
+        if builder is None:
+            builder = _builders[key] = SQLPromptBuilder(session_id, base_path=base_path)
+        _builders.move_to_end(key)
+        while len(_builders) > BUILDER_CACHE_SIZE:
+            _builders.popitem(last=False)
+    return builder
+
+
+def build_sql_system_prompt(question, session_id=None, base_path="Data/sessions"):
+    """
+    SQL system prompt for `question`: pruned to the session's live schema
+    when a session is given, the static SQL_SYSTEM_PROMPT otherwise (or
+    when the session has no database or table yet).
+    """
+    if session_id is None:
+        return SQL_SYSTEM_PROMPT
+
+    try:
+        return _builder(session_id, base_path).build(question)
+    except (FileNotFoundError, duckdb.Error):
+        return SQL_SYSTEM_PROMPT
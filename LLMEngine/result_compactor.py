@@ -0,0 +1,218 @@
+import json
+import datetime
+from decimal import Decimal
+from collections import Counter
+
+
+def approx_token_count(text):
+    """Fallback when the backend exposes no tokenizer (~4 chars per token)."""
+    return len(text) // 4 + 1
+
+
+def _json_value(v):
+    if isinstance(v, (datetime.date, datetime.datetime, datetime.time)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, float):
+        return round(v, 4)
+    return v
+
+
+def _count_key(v):
+    """LIST / STRUCT / MAP values (lists, dicts) are unhashable; count them by their JSON."""
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, sort_keys=True, default=str)
+    return v
+
+
+def _is_number(v):
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+# ---------------------------------------------------------
+#              EXACT STATISTICS (ALL ROWS)
+# ---------------------------------------------------------
+
+def column_stats(values, top_k=5):
+    """
+    Exact aggregates over a full column. Numeric columns get count/sum/
+    min/max/mean; everything else gets count/distinct/top-k (plus min/max
+    for dates).
+    """
+    present = [v for v in values if v is not None]
+    stats = {"count": len(present), "nulls": len(values) - len(present)}
+
+    if present and all(_is_number(v) for v in present):
+        total = sum(present)
+        stats.update({
+            "sum": _json_value(total),
+            "min": _json_value(min(present)),
+            "max": _json_value(max(present)),
+            "mean": _json_value(float(total) / len(present)),
+        })
+        return stats
+
+    counts = Counter(_count_key(v) for v in present)
+    examples = {}
+    for v in present:
+        examples.setdefault(_count_key(v), v)
+    stats["distinct"] = len(counts)
+    stats["top"] = [[_json_value(examples[key]), n] for key, n in counts.most_common(top_k)]
+
+    if present and all(isinstance(v, (datetime.date, datetime.datetime)) for v in present):
+        stats["min"] = _json_value(min(present))
+        stats["max"] = _json_value(max(present))
+
+    return stats
+
+
+# ---------------------------------------------------------
+#                    ROW SAMPLING
+# ---------------------------------------------------------
+
+def sample_row_indices(n_rows, n_keep):
+    """
+    Head + tail + evenly spaced strata from the middle.
+    Returns sorted row indices, at most n_keep of them.
+    """
+    if n_keep >= n_rows:
+        return list(range(n_rows))
+    if n_keep <= 0:
+        return []
+
+    head = (n_keep + 2) // 3
+    tail = n_keep // 3
+    middle = n_keep - head - tail
+
+    picked = set(range(head)) | set(range(n_rows - tail, n_rows))
+
+    # One row from the centre of each equal-sized stratum of the middle
+    lo, hi = head, n_rows - tail
+    if middle > 0 and hi > lo:
+        width = (hi - lo) / middle
+        picked |= {lo + int(width * i + width / 2) for i in range(middle)}
+
+    return sorted(picked)[:n_keep] if len(picked) > n_keep else sorted(picked)
+
+
+# ---------------------------------------------------------
+#                     COMPACTION
+# ---------------------------------------------------------
+
+def _render(columns, rows, indices, stats, n_rows):
+    data = {
+        col: [_json_value(rows[i][c]) for i in indices]
+        for c, col in enumerate(columns)
+    }
+
+    if len(indices) == n_rows:
+        shown = f"all {n_rows} rows"
+    else:
+        shown = f"{len(indices)} of {n_rows} rows (first, last and evenly spaced samples; row numbers in _row)"
+        data = {"_row": [i + 1 for i in indices], **data}
+
+    return (
+        f"Row count: {n_rows}\n"
+        f"Columns: {json.dumps(columns, ensure_ascii=False)}\n"
+        f"Exact column statistics over all {n_rows} rows (JSON): "
+        f"{json.dumps(stats, ensure_ascii=False, separators=(',', ':'), default=str)}\n"
+        f"Rows shown: {shown}, column by column (JSON): "
+        f"{json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)}"
+    )
+
+
+def _compact_error(error, max_lines=6):
+    lines = [l for l in (error or "").splitlines() if l.strip()]
+    if len(lines) <= max_lines:
+        return "\n".join(lines)
+    # The first line names the error; the traceback tail says where it came from
+    return "\n".join(lines[:2] + ["..."] + lines[-(max_lines - 2):])
+
+
+# Calls to the real tokenizer (an HTTP round trip on llama.cpp) per result
+MAX_TOKENIZER_PROBES = 4
+
+
+def _trim_stats(stats, top_k):
+    """stats with every column's top values cut to top_k (dropped at 0)."""
+    trimmed = {}
+    for col, col_stats in stats.items():
+        col_stats = dict(col_stats)
+        if "top" in col_stats:
+            if top_k:
+                col_stats["top"] = col_stats["top"][:top_k]
+            else:
+                del col_stats["top"]
+        trimmed[col] = col_stats
+    return trimmed
+
+
+def compact_result(executor_result, count_tokens=None, token_budget=1200, top_k=5):
+    """
+    Serialize an SQLExecutor result for an LLM prompt within `token_budget`
+    tokens (as counted by `count_tokens`, e.g. the backend tokenizer).
+
+    The row count is searched with the local estimate (approx_token_count);
+    count_tokens only confirms the choice, at most MAX_TOKENIZER_PROBES
+    times. When even the statistics alone don't fit, top values are
+    trimmed, and "over_budget" is set if that isn't enough.
+
+    Returns {"text", "tokens", "rows_total", "rows_shown", "over_budget"}.
+    """
+    if not executor_result.get("success"):
+        text = f"Error: {_compact_error(executor_result.get('error'))}"
+        tokens = (count_tokens or approx_token_count)(text)
+        return {"text": text, "tokens": tokens, "rows_total": 0, "rows_shown": 0,
+                "over_budget": tokens > token_budget}
+
+    columns = list(executor_result.get("columns") or [])
+    rows = executor_result.get("rows") or []
+    n_rows = len(rows)
+
+    full_stats = {
+        col: column_stats([r[c] for r in rows], top_k=top_k)
+        for c, col in enumerate(columns)
+    }
+
+    # Fewest top values per column that still leaves the stats within budget
+    for k in sorted({top_k, 2, 1, 0}, reverse=True):
+        stats = _trim_stats(full_stats, k)
+        if approx_token_count(_render(columns, rows, [], stats, n_rows)) <= token_budget:
+            break
+
+    def render(n_keep):
+        return _render(columns, rows, sample_row_indices(n_rows, n_keep), stats, n_rows)
+
+    # Largest number of rows the estimate fits (binary search). Every row
+    # costs at least a token, so no more than token_budget can fit.
+    lo, hi = 0, min(n_rows, token_budget)
+    n_keep = 0
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if approx_token_count(render(mid)) <= token_budget:
+            n_keep = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+
+    if count_tokens is None:
+        text = render(n_keep)
+        tokens = approx_token_count(text)
+    else:
+        # The real tokenizer may count more than the estimate: shrink in
+        # proportion until it fits
+        for _ in range(MAX_TOKENIZER_PROBES):
+            text = render(n_keep)
+            tokens = count_tokens(text)
+            if tokens <= token_budget or n_keep == 0:
+                break
+            n_keep = int(n_keep * token_budget / tokens * 0.9)
+        else:
+            if tokens > token_budget:
+                n_keep = 0
+                text = render(0)
+                tokens = count_tokens(text)
+
+    return {"text": text, "tokens": tokens, "rows_total": n_rows, "rows_shown": n_keep,
+            "over_budget": tokens > token_budget}
@@ -0,0 +1,180 @@
+import time
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ExecutorEngine.executor import SQLExecutor
+from ExecutorEngine.pool import ReadOnlyPool, PoolClosedError
+from LLMEngine.prompt_builder import build_sql_system_prompt
+from LLMEngine.sql_repair import model_label
+
+# Rows read per candidate to fingerprint its result
+FINGERPRINT_ROWS = 5000
+
+# Time the checks get even when generation used up the whole budget
+MIN_CHECK_S = 2.0
+
+
+def result_fingerprint(cursor, sql, max_rows=FINGERPRINT_ROWS):
+    """
+    Order- and alias-insensitive hash of (up to max_rows of) the result,
+    so candidates that compute the same answer agree.
+    """
+    cursor.execute(f"SELECT * FROM ({sql.rstrip().rstrip(';')}) LIMIT {max_rows}")
+    rows = cursor.fetchall()
+
+    normalised = sorted(
+        repr(tuple(round(v, 6) if isinstance(v, float) else v for v in row))
+        for row in rows
+    )
+    digest = hashlib.sha1()
+    digest.update(str(len(cursor.description)).encode())
+    for row in normalised:
+        digest.update(row.encode("utf-8"))
+    return digest.hexdigest(), len(rows)
+
+
+def _generate_candidate(index, handler, temperature, question, session_id):
+    record = {
+        "index": index,
+        "model": model_label(handler),
+        "temperature": temperature,
+        "sql": None,
+        "valid": False,
+        "error": None,
+        "fingerprint": None,
+        "rows": None,
+    }
+
+    start = time.perf_counter()
+    try:
+        record["sql"] = handler.generate_SQL(question, session_id=session_id, temperature=temperature)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        record["llm_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    return record
+
+
+def _check_candidate(record, pool):
+    start = time.perf_counter()
+    try:
+        with pool.cursor() as cur:
+            check = SQLExecutor.explain(cur, record["sql"])
+            record["valid"] = check["success"]
+            record["error"] = check["error"]
+            if check["success"]:
+                record["fingerprint"], record["rows"] = result_fingerprint(cur, record["sql"])
+    except PoolClosedError:
+        record["error"] = "Latency budget exhausted before this candidate was checked."
+    except Exception as e:
+        # Plans fine but fails at run time (e.g. a bad cast on real data)
+        record["valid"] = False
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["check_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    return record
+
+
+def choose_candidate(records):
+    """
+    Largest group of valid candidates with the same result fingerprint;
+    ties go to the earliest source (sources are listed by preference).
+    """
+    groups = defaultdict(list)
+    for r in records:
+        if r["valid"]:
+            groups[r["fingerprint"]].append(r)
+    if not groups:
+        return None, 0
+
+    best = max(groups.values(), key=lambda g: (len(g), -min(r["index"] for r in g)))
+    return min(best, key=lambda r: r["index"]), len(best)
+
+
+def _wait_all(futures, deadline, on_done=None):
+    """Results of the futures finished by `deadline`; on_done(results) -> True stops early."""
+    results = []
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return results, True
+
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        results.extend(f.result() for f in done)
+        if on_done and on_done(results):
+            break
+    return results, False
+
+
+def generate_best_SQL(sources, question, session_id, budget_s=30.0, base_path="Data/sessions",
+                      min_check_s=MIN_CHECK_S):
+    """
+    Ask every source for SQL concurrently, then dry-run and fingerprint the
+    candidates on pooled read-only connections and choose by agreement.
+
+    sources: list of (handler, temperature), most preferred first; mix
+    temperatures and/or backends (OllamaHandler, LlamaCPPHandler).
+
+    Generation and checking are separate phases: building the SQL prompt
+    reads the schema over a read-write connection, and DuckDB won't open
+    the same file read-only in the same process while one is open. The
+    read-only pool is only opened once generation is over.
+
+    When `budget_s` runs out during generation, the candidates finished so
+    far are checked (given at least `min_check_s`) and stragglers are
+    abandoned (their HTTP calls finish in the background). A strict
+    majority agreeing ends the checks early.
+
+    Returns:
+        {
+            "sql": str or None,
+            "agreement": int,            candidates sharing its result
+            "timed_out": bool,
+            "elapsed_ms": float,
+            "candidates": list[dict]     finished candidates
+        }
+    """
+    start = time.perf_counter()
+    deadline = start + budget_s
+
+    # Cache the schema now, so late generations don't reopen the database
+    # read-write once the read-only pool below is open
+    build_sql_system_prompt(question, session_id, base_path)
+
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    futures = [
+        executor.submit(_generate_candidate, i, handler, temperature, question, session_id)
+        for i, (handler, temperature) in enumerate(sources)
+    ]
+    generated, timed_out = _wait_all(futures, deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    records = [r for r in generated if r["sql"] is None]
+    to_check = [r for r in generated if r["sql"] is not None]
+
+    if to_check:
+        pool = ReadOnlyPool(session_id, base_path=base_path, size=len(to_check))
+        checker = ThreadPoolExecutor(max_workers=len(to_check))
+        checks = [checker.submit(_check_candidate, r, pool) for r in to_check]
+
+        checked, checks_timed_out = _wait_all(
+            checks,
+            max(deadline, time.perf_counter() + min_check_s),
+            on_done=lambda done: choose_candidate(done)[1] > len(sources) // 2,
+        )
+        timed_out = timed_out or checks_timed_out
+        checker.shutdown(wait=False, cancel_futures=True)
+        pool.close()
+        records.extend(checked)
+
+    chosen, agreement = choose_candidate(records)
+    return {
+        "sql": chosen["sql"] if chosen else None,
+        "agreement": agreement,
+        "timed_out": timed_out,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "candidates": sorted(records, key=lambda r: r["index"]),
+    }
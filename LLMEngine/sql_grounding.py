@@ -0,0 +1,117 @@
+"""
+Snaps string literals in generated SQL to values that exist in the data.
+
+`"Resource Name" = 'ramya'` matches nothing; rewriting it to
+`"Resource Name" = 'Ramya Sri'` saves the user a retry (and another LLM
+round-trip). Only literals compared (=, <>, IN) against a bare column with
+a value dictionary are touched; LIKE patterns and wrapped columns
+(LOWER(...) etc.) are left alone.
+
+Only name-like columns are grounded: in IDs, periods and dates a close
+string is a different value ('2024-11' is not a typo of '2025-11'), so
+those columns, and any snap that changes a literal's digits, are skipped.
+"""
+import re
+
+from rapidfuzz import process, fuzz, utils
+
+from DatabaseEngine.value_dictionary import get_value_dictionary
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:
+    sqlglot = None
+
+# rapidfuzz WRatio score needed to replace a literal
+MIN_SCORE = 85
+
+# Columns whose values are codes, periods or dates, not names
+UNGROUNDED_COLUMN = re.compile(r"\b(?:id|date|period|month|year|no|number|code)\b", re.IGNORECASE)
+
+
+def _digits(text):
+    return re.findall(r"\d+", text)
+
+
+def snap_value(literal, values, min_score=MIN_SCORE):
+    """
+    (value, score) for the literal: itself if it exists, else a unique
+    case-insensitive or fuzzy match, else None.
+    """
+    if literal in values:
+        return None
+
+    folded = [v for v in values if v.lower() == literal.lower()]
+    if len(folded) == 1:
+        return folded[0], 100.0
+
+    matches = process.extract(literal, values, scorer=fuzz.WRatio,
+                              processor=utils.default_process, limit=2)
+    if not matches or matches[0][1] < min_score:
+        return None
+    # Different numbers are a different value, however close the strings
+    if _digits(matches[0][0]) != _digits(literal):
+        return None
+    # Two equally good candidates (e.g. two people named Ramya): don't guess
+    if len(matches) > 1 and matches[1][1] == matches[0][1]:
+        return None
+    return matches[0][0], matches[0][1]
+
+
+def _compared_literals(tree):
+    """(column name, literal node) for every string compared to a bare column."""
+    for node in tree.find_all(exp.EQ, exp.NEQ):
+        left, right = node.left, node.right
+        if isinstance(right, exp.Column) and isinstance(left, exp.Literal):
+            left, right = right, left
+        if isinstance(left, exp.Column) and isinstance(right, exp.Literal) and right.is_string:
+            yield left.name, right
+
+    for node in tree.find_all(exp.In):
+        if isinstance(node.this, exp.Column):
+            for item in node.expressions:
+                if isinstance(item, exp.Literal) and item.is_string:
+                    yield node.this.name, item
+
+
+def ground_literals(sql, session_id, base_path="Data/sessions", min_score=MIN_SCORE):
+    """
+    Returns:
+        {
+            "sql": str,                 rewritten query (unchanged if nothing snapped)
+            "substitutions": list[dict] {"column", "original", "replacement", "score"}
+        }
+    """
+    unchanged = {"sql": sql, "substitutions": []}
+    if sqlglot is None or not sql:
+        return unchanged
+
+    try:
+        tree = sqlglot.parse_one(sql, read="duckdb")
+        dictionary = get_value_dictionary(session_id, base_path)
+    except (sqlglot.errors.SqlglotError, FileNotFoundError):
+        return unchanged
+
+    substitutions = []
+    for column, literal in list(_compared_literals(tree)):
+        values = dictionary.get(column)
+        if not values or UNGROUNDED_COLUMN.search(column):
+            continue
+
+        snapped = snap_value(literal.this, values, min_score)
+        if snapped is None:
+            continue
+
+        value, score = snapped
+        substitutions.append({
+            "column": column,
+            "original": literal.this,
+            "replacement": value,
+            "score": round(score, 1),
+        })
+        literal.replace(exp.Literal.string(value))
+
+    if not substitutions:
+        return unchanged
+    return {"sql": tree.sql(dialect="duckdb"), "substitutions": substitutions}
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import datetime
+
+from ExecutorEngine.executor import SQLExecutor
+
+# One JSON line per attempt (generation or repair) with its latency
+REPAIR_LOG_PATH = os.path.join("Data", "sql_attempts.jsonl")
+
+# Errors the model can fix by rewriting the query; anything else
+# (e.g. a missing session database) is returned as-is
+REPAIRABLE_ERRORS = ("ParserException", "BinderException", "CatalogException")
+
+
+def model_label(handler):
+    if hasattr(handler, "label"):
+        return handler.label
+    if hasattr(handler, "model"):
+        return f"ollama:{handler.model}"
+    return f"llama.cpp:{getattr(handler, 'api_url', type(handler).__name__)}"
+
+
+def short_error(error, max_lines=3):
+    """
+    The error message without DuckDB's LINE/caret excerpt and long
+    candidate lists; the fragment is sent separately.
+    """
+    lines = []
+    for line in error.splitlines():
+        if line.startswith("LINE "):
+            break
+        if line.strip():
+            lines.append(line.strip())
+    return "\n".join(lines[:max_lines])
+
+
+def log_attempt(record, log_path=REPAIR_LOG_PATH):
+    if not log_path:
+        return
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+def generate_verified_SQL(handler, question, session_id, executor=None,
+                          max_repairs=2, log_path=REPAIR_LOG_PATH):
+    """
+    Generate SQL, dry-run it (EXPLAIN, no data scanned) and, on a parse/
+    binder/catalog error, ask the model to fix it from the error and the
+    offending fragment only, up to `max_repairs` times.
+
+    Returns:
+        {
+            "sql": str,               last candidate
+            "verified": bool,         passed the dry-run
+            "error": str or None,     last dry-run error
+            "attempts": list[dict]    per-attempt latency records
+        }
+    """
+    executor = executor or SQLExecutor()
+    attempts = []
+    sql = None
+    check = None
+
+    for attempt in range(max_repairs + 1):
+        start = time.perf_counter()
+        if attempt == 0:
+            sql = handler.generate_SQL(question, session_id=session_id)
+        else:
+            sql = handler.repair_SQL(sql, short_error(check["error"]), check["fragment"],
+                                     session_id=session_id)
+        llm_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        check = executor.dry_run(session_id, sql)
+        dry_run_ms = (time.perf_counter() - start) * 1000
+
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "session_id": session_id,
+            "model": model_label(handler),
+            "attempt": attempt,
+            "kind": "generate" if attempt == 0 else "repair",
+            "llm_ms": round(llm_ms, 1),
+            "dry_run_ms": round(dry_run_ms, 1),
+            "success": check["success"],
+            "error_type": check["error_type"],
+            "fragment": check["fragment"],
+            "sql": sql,
+        }
+        attempts.append(record)
+        log_attempt(record, log_path)
+
+        if check["success"] or check["error_type"] not in REPAIRABLE_ERRORS:
+            break
+
+    return {
+        "sql": sql,
+        "verified": check["success"],
+        "error": check["error"],
+        "attempts": attempts,
+    }
@@ -0,0 +1,143 @@
+import time
+import random
+
+import pytest
+import requests
+
+import LLMEngine.backend_router as backend_router
+from LLMEngine.backend_router import Backend, BackendRouter, NoHealthyBackendError
+
+
+class FakeHandler:
+    """Answers SQL after `delay` seconds, or raises `error`; stops early when cancelled."""
+
+    def __init__(self, answer, delay=0.0, error=None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    def generate_SQL(self, question, session_id=None, temperature=None, cancelled=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        deadline = time.perf_counter() + self.delay
+        while time.perf_counter() < deadline:
+            if cancelled is not None and cancelled():
+                self.cancelled = True
+                return ""
+            time.sleep(0.005)
+        return self.answer
+
+
+def fake_backend(name, handler, weight=1):
+    backend = Backend(name, "llama.cpp", f"http://{name}/generate", weight=weight)
+    backend.handler = handler
+    backend.checked_at = float("inf")  # never due for a health check
+    return backend
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status}", response=response)
+
+
+@pytest.fixture
+def first_choice(monkeypatch):
+    """Weighted picks always take the first candidate, so tests know the primary."""
+    monkeypatch.setattr(random, "choices", lambda candidates, weights: [candidates[0]])
+
+
+def test_pick_skips_unhealthy_excluded_and_busy():
+    a, b, c = (fake_backend(n, FakeHandler(n)) for n in "abc")
+    router = BackendRouter([a, b, c])
+
+    a.healthy = False
+    assert {router.pick(exclude=(b,)) for _ in range(20)} == {c}
+
+    c.busy_until = time.monotonic() + 60
+    assert {router.pick() for _ in range(20)} == {b}
+
+    # Busy backends still serve when nothing else is left
+    b.healthy = False
+    assert router.pick() is c
+
+    c.healthy = False
+    assert router.pick() is None
+    with pytest.raises(NoHealthyBackendError):
+        router.generate_SQL("q")
+
+
+def test_failover_marks_the_failed_backend_unhealthy(first_choice):
+    down = fake_backend("down", FakeHandler("x", error=requests.ConnectionError("refused")))
+    up = fake_backend("up", FakeHandler("SELECT 1"))
+    router = BackendRouter([down, up])
+
+    assert router.generate_SQL("q") == "SELECT 1"
+    assert router.last_backend is up
+    assert not down.healthy
+
+
+def test_429_is_backpressure_not_failure(first_choice):
+    busy = fake_backend("busy", FakeHandler("x", error=http_error(429, {"Retry-After": "30"})))
+    other = fake_backend("other", FakeHandler("SELECT 1"))
+    router = BackendRouter([busy, other])
+
+    assert router.generate_SQL("q") == "SELECT 1"
+    assert busy.healthy and busy.busy
+    assert busy.busy_until - time.monotonic() > 25
+
+    # While busy, new calls go elsewhere first
+    assert router.generate_SQL("q") == "SELECT 1"
+    assert busy.handler.calls == 1
+
+    assert router.summary()[0]["busy"] is True
+
+
+def test_no_hedge_without_enough_samples(first_choice):
+    slow = fake_backend("slow", FakeHandler("slow", delay=0.3))
+    fast = fake_backend("fast", FakeHandler("fast"))
+    router = BackendRouter([slow, fast])
+
+    for _ in range(backend_router.MIN_SAMPLES - 1):
+        slow.record("sql", 0.01)
+
+    assert router.generate_SQL("q") == "slow"
+    assert fast.handler.calls == 0
+
+
+def test_fixed_hedge_delay_applies_until_samples_exist(first_choice):
+    slow = fake_backend("slow", FakeHandler("slow", delay=2.0))
+    fast = fake_backend("fast", FakeHandler("fast"))
+    router = BackendRouter([slow, fast], hedge_after_s=0.1)
+
+    start = time.perf_counter()
+    assert router.generate_SQL("q") == "fast"
+    assert time.perf_counter() - start < 1.0
+
+
+def test_hedge_after_p95_and_cancel_the_loser(first_choice):
+    slow = fake_backend("slow", FakeHandler("slow", delay=2.0))
+    fast = fake_backend("fast", FakeHandler("fast", delay=0.05))
+    router = BackendRouter([slow, fast])
+
+    for _ in range(backend_router.MIN_SAMPLES):
+        slow.record("sql", 0.1)
+    assert router.hedge_window(slow, "sql") == pytest.approx(0.1)
+
+    start = time.perf_counter()
+    assert router.generate_SQL("q") == "fast"
+    elapsed = time.perf_counter() - start
+    assert 0.1 <= elapsed < 1.0
+    assert router.last_backend is fast
+
+    # The losing call sees the cancellation and stops instead of running on
+    deadline = time.perf_counter() + 1.0
+    while not slow.handler.cancelled and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert slow.handler.cancelled
+    # ...and its cut-short latency is not recorded
+    assert len(slow.latencies["sql"]) == backend_router.MIN_SAMPLES
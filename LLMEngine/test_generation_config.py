@@ -0,0 +1,48 @@
+from LLMEngine.generation_config import GenerationConfig, SQL_STOP, STAGE_CONFIGS, request_timeout
+
+
+def test_ollama_fields_nest_sampling_under_options():
+    config = GenerationConfig(temperature=0.2, max_tokens=100, num_ctx=2048, num_thread=4,
+                              stop=[";\n"], keep_alive="10m", format="json")
+    assert config.ollama_fields() == {
+        "options": {"temperature": 0.2, "num_predict": 100, "num_ctx": 2048, "num_thread": 4, "stop": [";\n"]},
+        "keep_alive": "10m",
+        "format": "json",
+    }
+
+
+def test_ollama_fields_leave_out_unset_options():
+    fields = GenerationConfig(keep_alive=None).ollama_fields()
+    assert fields == {"options": {"temperature": 0.0, "num_predict": 256, "num_ctx": 4096}}
+
+
+def test_llama_cpp_fields():
+    config = GenerationConfig(temperature=0.1, max_tokens=64, num_ctx=8192, num_thread=4, stop=["\n\n"])
+    fields = config.llama_cpp_fields()
+    # Context and threads are fixed when llama.cpp loads the model
+    assert fields == {"max_tokens": 64, "temperature": 0.1, "stop": ["\n\n"]}
+
+    # The payload gets its own list, not the frozen config's
+    fields["stop"].append("x")
+    assert config.stop == ["\n\n"]
+
+
+def test_with_overrides_ignores_none():
+    sql = STAGE_CONFIGS["sql"]
+    assert sql.with_overrides(temperature=None) == sql
+    assert sql.with_overrides(temperature=0.7).temperature == 0.7
+    assert sql.with_overrides(temperature=0.7).max_tokens == sql.max_tokens
+    assert sql.temperature == 0.0
+
+
+def test_sql_stages_stop_at_end_of_statement():
+    assert STAGE_CONFIGS["sql"].stop == SQL_STOP == [";\n"]
+    assert STAGE_CONFIGS["repair"].stop == SQL_STOP
+    assert STAGE_CONFIGS["interpret"].stop == []
+
+
+def test_request_timeout_normalises_json_lists():
+    assert request_timeout([5, 120]) == (5, 120)
+    assert request_timeout((5, 120)) == (5, 120)
+    assert request_timeout(30) == 30
+    assert request_timeout(None) is None
@@ -0,0 +1,63 @@
+import pytest
+
+import LLMEngine.intent_router as intent_router
+import LLMEngine.prompt_builder as prompt_builder
+
+
+@pytest.fixture
+def session(monkeypatch, make_session):
+    monkeypatch.setattr(prompt_builder, "SentenceTransformer", None)
+    monkeypatch.setattr(intent_router, "SentenceTransformer", None)
+    monkeypatch.setattr(intent_router, "MIN_SIMILARITY", 0.6)
+
+    return make_session("s", table="""
+        SELECT * FROM (VALUES
+            ('P1', 'Apollo Revamp', 'Ramya Sri', 'R1', 8.0, DATE '2025-11-01', DATE '2025-11-05', '2025-11', 50.0),
+            ('P2', 'Zeus Billing', 'John Carter', 'R2', 4.0, DATE '2025-10-01', DATE '2025-10-01', '2025-10', 40.0)
+        ) t("Project ID", "Project Name", "Resource Name", "Resource ID", "Posted Hours",
+            "Actual Date", "Posted Date", "Financial Period (Posted Date)", "Resource Rate")
+    """)
+
+
+def route(question, base_path):
+    return intent_router.route_question(question, "s", base_path)
+
+
+def test_routes_entity_and_period(session):
+    routed = route("How many hours did Ramya Sri log in November 2025?", session)
+    assert routed["intent"] == "entity_hours"
+    assert routed["params"] == ["Ramya Sri", "2025-11"]
+
+
+def test_partial_name_resolves(session):
+    routed = route("How many hours did Ramya log?", session)
+    assert routed["params"] == ["Ramya Sri"]
+
+
+@pytest.mark.parametrize("question", [
+    "How many hours did everyone except ramya log?",
+    "How many hours did ramya not log?",
+    "How many hours didn't ramya log?",
+    "Hours per project for non ramya",
+    "Hours per project for everyone other than Ramya",
+    "Billable amount for Apollo Revamp excluding November 2025",
+    "Hours per project without John",
+])
+def test_negation_goes_to_llm(session, question):
+    assert route(question, session) is None
+
+
+def test_entity_text_must_match_whole_value(session):
+    router = intent_router.IntentRouter("s", session)
+    invoicer = intent_router.Invoicer("s", base_path=session)
+    try:
+        assert router.resolve_entity(invoicer, "everyone ramya", ("resource",)) is None
+        assert router.resolve_entity(invoicer, "ramya", ("resource",))[1] == "Ramya Sri"
+    finally:
+        invoicer.close()
+
+
+def test_covers():
+    assert intent_router.covers("Ramya Sri", "ramya")
+    assert intent_router.covers("Ramya Sri", "sri ramya")
+    assert not intent_router.covers("Ramya Sri", "everyone ramya")
@@ -0,0 +1,71 @@
+import pytest
+
+from LLMEngine import llm_metrics
+from LLMEngine.llm_metrics import bottleneck, load_metrics, percentile, record_call, stage_summary
+
+
+@pytest.fixture(autouse=True)
+def unsessioned(monkeypatch):
+    # Calls without a session are kept in a module-level list
+    monkeypatch.setattr(llm_metrics, "_unsessioned", [])
+
+
+def test_percentile():
+    assert percentile([], 95) is None
+    assert percentile([7.123], 50) == 7.12
+    assert percentile([7.123], 95) == 7.12
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile(list(range(1, 101)), 0) == 1
+    assert percentile(list(range(1, 101)), 100) == 100
+
+
+def test_stage_summary_empty():
+    assert stage_summary([]) == []
+
+
+def test_stage_summary_single_sample():
+    record = record_call(None, "sql", "llama.cpp", "gemma", prompt_tokens=500, completion_tokens=40,
+                         ttft_ms=120.0, wall_ms=900.0, prompt_eval_ms=100.0, eval_ms=800.0)
+    row, = stage_summary([record])
+    assert row["stage"] == "sql" and row["model"] == "gemma" and row["calls"] == 1
+    assert row["wall_ms_p50"] == row["wall_ms_p95"] == 900.0
+    assert row["prompt_tok_s_p50"] == 5000.0
+    assert row["decode_tok_s_p50"] == 50.0
+    assert bottleneck(row) == "decode speed"
+
+
+def test_stage_summary_with_missing_timings():
+    # Ollama without durations, or a failed stream, leaves timings unset
+    records = [
+        record_call(None, "interpret", "ollama", "llama3.2:3b", wall_ms=300.0),
+        record_call(None, "interpret", "ollama", "llama3.2:3b", wall_ms=100.0, prompt_eval_ms=90.0, eval_ms=10.0),
+        record_call(None, "sql", "ollama", None, wall_ms=50.0),
+    ]
+    interpret, sql = stage_summary(records)
+
+    assert interpret["calls"] == 2
+    assert interpret["wall_ms_p50"] == 100.0 and interpret["wall_ms_p95"] == 300.0
+    # Only the call that reported them counts towards the phase timings
+    assert interpret["prompt_eval_ms_p50"] == 90.0
+    assert interpret["prompt_tok_s_p50"] is None and interpret["decode_tok_s_p50"] is None
+    assert bottleneck(interpret) == "prompt size"
+
+    assert sql["model"] is None
+    assert sql["ttft_ms_p50"] is None and sql["prompt_eval_ms_p95"] is None
+    assert bottleneck(sql) == "unknown"
+
+
+def test_bottleneck_needs_both_phases():
+    assert bottleneck({}) == "unknown"
+    assert bottleneck({"prompt_eval_ms_p50": 10.0, "eval_ms_p50": None}) == "unknown"
+    assert bottleneck({"prompt_eval_ms_p50": 0.0, "eval_ms_p50": 5.0}) == "decode speed"
+
+
+def test_sessions_are_stored_on_disk(tmp_path):
+    record_call("s1", "sql", "llama.cpp", "gemma", wall_ms=10.0, base_path=str(tmp_path))
+    record_call(None, "sql", "llama.cpp", "gemma", wall_ms=20.0, base_path=str(tmp_path))
+
+    assert [r["wall_ms"] for r in load_metrics("s1", str(tmp_path))] == [10.0]
+    assert [r["wall_ms"] for r in load_metrics()] == [20.0]
+    assert load_metrics("other", str(tmp_path)) == []
@@ -0,0 +1,106 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from LLMEngine.local_summarizer import (
+    MAX_LOCAL_COLUMNS, MAX_LOCAL_ROWS, explain_error, format_value, interpret_stream, summarize_locally,
+)
+
+
+class RecordingHandler:
+    """Stands in for the LLM handlers: streams a fixed answer and records calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def interpret_response_stream(self, executor_result, question, session_id=None):
+        self.calls.append((executor_result, question, session_id))
+        yield "From "
+        yield "the LLM."
+
+
+def ok(columns, rows):
+    return {"success": True, "columns": columns, "rows": rows, "error": None}
+
+
+def failed(error):
+    return {"success": False, "columns": [], "rows": [], "error": error}
+
+
+def interpret(result, question="How many?"):
+    handler = RecordingHandler()
+    text = "".join(interpret_stream(handler, result, question, session_id="s1"))
+    return text, handler.calls
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "empty"),
+    (True, "True"),
+    (1234567, "1,234,567"),
+    (1234.5678, "1,234.57"),
+    (2000.0, "2,000"),
+    (Decimal("12.50"), "12.5"),
+    (datetime.date(2024, 3, 1), "2024-03-01"),
+    ("P-1", "P-1"),
+])
+def test_format_value(value, expected):
+    assert format_value(value) == expected
+
+
+def test_known_errors_are_explained():
+    assert "Posted Hourz" in explain_error('Binder Error: Referenced column "Posted Hourz" not found in FROM clause!')
+    assert "sample_table" in explain_error("Catalog Error: Table with name projects does not exist!")
+    assert explain_error("INTERNAL Error: something odd") is None
+    assert explain_error(None) is None
+
+
+def test_single_value():
+    assert summarize_locally(ok(["total"], [(1500.0,)]), "total hours") == 'The result for "total hours" is 1,500 (total).'
+
+
+def test_empty_result():
+    assert "returned no rows" in summarize_locally(ok(["a", "b"], []))
+
+
+def test_single_row_up_to_the_column_limit():
+    columns = [f"c{i}" for i in range(MAX_LOCAL_COLUMNS)]
+    summary = summarize_locally(ok(columns, [tuple(range(MAX_LOCAL_COLUMNS))]))
+    assert summary.startswith("The query returned a single row")
+    assert f"- **c{MAX_LOCAL_COLUMNS - 1}**: {MAX_LOCAL_COLUMNS - 1}" in summary
+
+    wide = columns + ["extra"]
+    assert summarize_locally(ok(wide, [tuple(range(len(wide)))])) is None
+
+
+def test_short_single_column_list():
+    rows = [(f"P-{i}",) for i in range(MAX_LOCAL_ROWS)]
+    summary = summarize_locally(ok(["Project ID"], rows))
+    assert summary.startswith(f"The query returned {MAX_LOCAL_ROWS} values of Project ID")
+    assert summary.count("\n- ") == MAX_LOCAL_ROWS
+
+    assert summarize_locally(ok(["Project ID"], rows + [("P-x",)])) is None
+
+
+def test_small_results_are_answered_locally():
+    for result in (
+        ok(["total"], [(3,)]),
+        ok(["a", "b"], []),
+        ok(["a", "b"], [(1, 2)]),
+        ok(["a"], [(1,), (2,)]),
+        failed('Referenced column "x" not found'),
+    ):
+        text, calls = interpret(result)
+        assert calls == []
+        assert text == summarize_locally(result, "How many?")
+
+
+def test_larger_results_and_unknown_errors_go_to_the_llm():
+    for result in (
+        ok(["a", "b"], [(1, 2), (3, 4)]),
+        ok(["a"], [(i,) for i in range(MAX_LOCAL_ROWS + 1)]),
+        failed("INTERNAL Error: something odd"),
+    ):
+        text, calls = interpret(result)
+        assert text == "From the LLM."
+        assert calls == [(result, "How many?", "s1")]
@@ -0,0 +1,29 @@
+import pytest
+
+from LLMEngine import prompt_builder
+from LLMEngine.prompt_builder import SQL_SYSTEM_PROMPT, build_sql_system_prompt
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    # Lexical column ranking; no model download
+    monkeypatch.setattr(prompt_builder, "SentenceTransformer", None)
+    monkeypatch.setattr(prompt_builder, "_builders", prompt_builder.OrderedDict())
+
+
+def test_missing_database_or_table_falls_back(make_session):
+    base_path = make_session("empty", table=None)
+
+    assert build_sql_system_prompt("hours by resource", "missing", base_path) == SQL_SYSTEM_PROMPT
+    assert build_sql_system_prompt("hours by resource", "empty", base_path) == SQL_SYSTEM_PROMPT
+
+
+def test_builders_are_bounded(tmp_path, monkeypatch, make_session):
+    monkeypatch.setattr(prompt_builder, "BUILDER_CACHE_SIZE", 2)
+    base_path = str(tmp_path)
+    for session_id in ("a", "b", "c"):
+        make_session(session_id)
+        assert '"Resource Name"' in build_sql_system_prompt("hours by resource", session_id, base_path)
+
+    build_sql_system_prompt("hours by resource", "b", base_path)
+    assert list(prompt_builder._builders) == [("c", base_path), ("b", base_path)]
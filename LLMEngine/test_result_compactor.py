@@ -0,0 +1,66 @@
+import duckdb
+
+from LLMEngine.result_compactor import column_stats, compact_result
+
+
+def test_list_and_struct_columns():
+    cursor = duckdb.sql("""
+        SELECT * FROM (VALUES ([1, 2], {'a': 1}), ([1, 2], {'a': 2}), (NULL, {'a': 1}))
+        t(tags, info)
+    """)
+    rows = cursor.fetchall()
+
+    assert column_stats([r[0] for r in rows]) == {"count": 2, "nulls": 1, "distinct": 1, "top": [[[1, 2], 2]]}
+    assert column_stats([r[1] for r in rows])["top"] == [[{"a": 1}, 2], [{"a": 2}, 1]]
+
+    compacted = compact_result({"success": True, "columns": ["tags", "info"], "rows": rows})
+    assert compacted["rows_shown"] == 3
+
+
+def result(n_rows, n_columns=3):
+    columns = [f"Column {c}" for c in range(n_columns)]
+    rows = [tuple(f"value {r} {c}" for c in range(n_columns)) for r in range(n_rows)]
+    return {"success": True, "columns": columns, "rows": rows}
+
+
+class CountingTokenizer:
+    """Counts more tokens than approx_token_count, like a real tokenizer can."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return len(text) // 3
+
+
+def test_stays_within_budget():
+    for n_rows in (0, 1, 50, 5000):
+        compacted = compact_result(result(n_rows), token_budget=600)
+        assert compacted["tokens"] <= 600
+        assert not compacted["over_budget"]
+    assert compacted["rows_total"] == 5000
+    assert 0 < compacted["rows_shown"] < 5000
+
+
+def test_large_result_needs_few_tokenizer_calls():
+    tokenizer = CountingTokenizer()
+    compacted = compact_result(result(100000), count_tokens=tokenizer, token_budget=1200)
+
+    assert compacted["tokens"] <= 1200
+    assert compacted["rows_shown"] > 0
+    assert tokenizer.calls <= 4
+
+
+def test_stats_over_budget_are_trimmed_then_flagged():
+    # 40 columns' statistics: ~1750 tokens with 5 top values each, ~1250 with 2
+    wide = result(200, n_columns=40)
+    compacted = compact_result(wide, token_budget=1500)
+    assert compacted["tokens"] <= 1500
+    assert not compacted["over_budget"]
+    assert '"top":[["value 0 0",1],["value 1 0",1]]' in compacted["text"]
+    assert '"value 2 0",1]' not in compacted["text"].split("Rows shown")[0]
+
+    compacted = compact_result(wide, token_budget=100)
+    assert compacted["over_budget"]
+    assert '"top"' not in compacted["text"]
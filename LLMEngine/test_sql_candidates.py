@@ -0,0 +1,83 @@
+import pytest
+
+import LLMEngine.prompt_builder as prompt_builder
+from LLMEngine.prompt_builder import build_sql_system_prompt
+from LLMEngine.sql_candidates import generate_best_SQL
+
+
+class PromptingHandler:
+    """Builds the SQL prompt like the real handlers (schema read included), returns fixed SQL."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.model = "fake"
+
+    def generate_SQL(self, question, session_id=None, temperature=None):
+        build_sql_system_prompt(question, session_id)
+        return self.sql
+
+
+@pytest.fixture(autouse=True)
+def lexical_prompt_selection(monkeypatch):
+    # Column/example selection without downloading an embedding model
+    monkeypatch.setattr(prompt_builder, "SentenceTransformer", None)
+
+
+def test_candidates_agree_on_real_session(tmp_path, monkeypatch, make_session):
+    # The handlers read the schema from the default Data/sessions
+    monkeypatch.chdir(tmp_path)
+    make_session("s1", "Data/sessions")
+    session_id = "s1"
+
+    total = 'SELECT SUM("Posted Hours") FROM sample_table'
+    sources = [
+        (PromptingHandler(total), 0.0),
+        (PromptingHandler(total + ";"), 0.4),
+        (PromptingHandler('SELECT "No Such Column" FROM sample_table'), 0.8),
+    ]
+    best = generate_best_SQL(sources, "total hours", session_id, budget_s=30.0)
+
+    assert best["sql"] == total
+    assert best["agreement"] == 2
+    assert not best["timed_out"]
+    # Two of three agreeing is a majority; the third check may be cut short
+    assert [c["valid"] for c in best["candidates"][:2]] == [True, True]
+
+
+def test_no_valid_candidate(tmp_path, monkeypatch, make_session):
+    monkeypatch.chdir(tmp_path)
+    make_session("s1", "Data/sessions")
+    session_id = "s1"
+
+    best = generate_best_SQL([(PromptingHandler("SELECT nope FROM missing"), 0.0)], "x", session_id)
+
+    assert best["sql"] is None
+    assert best["candidates"][0]["error"]
+
+
+SLOW = "SELECT SUM(i) FROM range(50000000000) t(i)"
+
+
+def test_slow_check_does_not_outlast_the_budget(tmp_path, monkeypatch, make_session):
+    monkeypatch.chdir(tmp_path)
+    make_session("s1", "Data/sessions")
+    session_id = "s1"
+
+    best = generate_best_SQL([(PromptingHandler(SLOW), 0.0)], "x", session_id, budget_s=1.0, min_check_s=0.5)
+
+    assert best["timed_out"]
+    assert best["sql"] is None
+    assert best["elapsed_ms"] < 2000
+
+
+def test_majority_does_not_wait_for_a_slow_check(tmp_path, monkeypatch, make_session):
+    monkeypatch.chdir(tmp_path)
+    make_session("s1", "Data/sessions")
+    session_id = "s1"
+
+    total = 'SELECT SUM("Posted Hours") FROM sample_table'
+    sources = [(PromptingHandler(total), 0.0), (PromptingHandler(total), 0.4), (PromptingHandler(SLOW), 0.8)]
+    best = generate_best_SQL(sources, "total hours", session_id, budget_s=30.0)
+
+    assert best["sql"] == total
+    assert best["elapsed_ms"] < 5000
@@ -0,0 +1,32 @@
+import pytest
+
+from LLMEngine.sql_grounding import ground_literals, snap_value
+
+
+@pytest.fixture
+def session(make_session):
+    return make_session("s")
+
+
+def test_snaps_names(session):
+    grounded = ground_literals("""SELECT * FROM sample_table WHERE "Resource Name" = 'ramya sri'""", "s", session)
+    assert grounded["substitutions"][0]["replacement"] == "Ramya Sri"
+    assert "'Ramya Sri'" in grounded["sql"]
+
+
+@pytest.mark.parametrize("sql", [
+    """SELECT * FROM sample_table WHERE "Financial Period (Posted Date)" = '2024-11'""",
+    """SELECT * FROM sample_table WHERE "Resource ID" = 'R1012'""",
+    """SELECT * FROM sample_table WHERE "Project ID" IN ('P3')""",
+])
+def test_leaves_periods_and_ids_alone(session, sql):
+    assert ground_literals(sql, "s", session) == {"sql": sql, "substitutions": []}
+
+
+def test_never_changes_digits():
+    assert snap_value("Team 12", ["Team 21", "Other"]) is None
+
+
+def test_unparseable_sql_is_returned_unchanged(session):
+    sql = """SELECT * FROM sample_table WHERE "Resource Name" = 'Ramya"""
+    assert ground_literals(sql, "s", session) == {"sql": sql, "substitutions": []}
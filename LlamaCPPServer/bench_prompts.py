@@ -0,0 +1,34 @@
+from LLMEngine.LlamaCPP_Handler import LlamaCPPHandler
+
+# Representative questions from the Streamlit query box
+SAMPLE_QUESTIONS = [
+    "Get total posted hours per resource for 2025-11.",
+    "Which projects did Ramya post hours to last month?",
+    "Show entries where Posted Date is more than 7 days after Actual Date.",
+    "What is the billable amount per project for 2025-10?",
+]
+
+# A typical executor result handed to interpret_response
+SAMPLE_RESULT = {
+    "success": True,
+    "columns": ["Project ID", "Project Name", "Resource Name", "total_hours", "amount"],
+    "rows": [
+        (f"91HYFY25_PRJ{i:03d}", f"Project {i}", f"Resource {i % 7}", 8.0 * (i % 5 + 1), 450.0 * (i % 5 + 1))
+        for i in range(20)
+    ],
+    "error": None,
+}
+
+
+def benchmark_prompts():
+    """
+    Prompts exactly as LlamaCPPHandler sends them, tagged by pipeline stage.
+    Returns [(stage, prompt), ...].
+    """
+    handler = LlamaCPPHandler()
+    prompts = [("sql", handler.build_SQL_prompt(q)) for q in SAMPLE_QUESTIONS]
+    prompts += [
+        ("interpret", handler.build_interpret_prompt(SAMPLE_RESULT, q))
+        for q in SAMPLE_QUESTIONS[:2]
+    ]
+    return prompts
@@ -0,0 +1,133 @@
+"""
+Benchmark speculative decoding against plain decoding on our own prompts.
+
+Usage (from the repo root):
+    python -m LlamaCPPServer.bench_speculative --model models/gemma.gguf
+    python -m LlamaCPPServer.bench_speculative --model models/gemma.gguf \
+        --draft-model models/gemma-small.gguf --draft-tokens 8
+
+Reports, per mode and pipeline stage: decode tokens/sec, time-to-first-token
+and (for speculative modes) the estimated draft acceptance rate.
+"""
+import os
+import time
+import json
+import argparse
+
+from llama_cpp import Llama
+
+from LlamaCPPServer.bench_prompts import benchmark_prompts
+from LlamaCPPServer.speculative import build_draft_model, CountingDraftModel
+
+
+def run_prompt(llm, prompt, max_tokens):
+    llm.reset()  # every mode starts from a cold KV cache
+    start = time.perf_counter()
+    ttft = None
+    pieces = []
+
+    for chunk in llm(prompt, stream=True, max_tokens=max_tokens, temperature=0.0,
+                     stop=["</s>", "SQL ONLY:"]):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        pieces.append(chunk["choices"][0]["text"])
+
+    total = time.perf_counter() - start
+    text = "".join(pieces)
+    completion_tokens = len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+    decode_s = max(total - (ttft or total), 1e-9)
+
+    return {
+        "completion_tokens": completion_tokens,
+        "ttft_ms": round((ttft or total) * 1000, 1),
+        "decode_tok_s": round(max(completion_tokens - 1, 0) / decode_s, 2),
+        "text": text,
+    }
+
+
+def bench_mode(args, mode, prompts):
+    draft = build_draft_model(
+        mode,
+        num_pred_tokens=args.draft_tokens,
+        draft_model_path=args.draft_model,
+        draft_threads=args.draft_threads,
+        n_ctx=args.n_ctx,
+    )
+    counter = CountingDraftModel(draft) if draft is not None else None
+
+    llm = Llama(
+        model_path=args.model,
+        n_threads=args.threads,
+        n_ctx=args.n_ctx,
+        draft_model=counter,
+        verbose=False,
+    )
+
+    results = []
+    for stage, prompt in prompts:
+        if counter is not None:
+            counter.reset_counts()
+        row = run_prompt(llm, prompt, args.max_tokens)
+        row["stage"] = stage
+        if counter is not None:
+            row.update(counter.acceptance(row["completion_tokens"]))
+        results.append(row)
+
+    llm.close()
+    return results
+
+
+def summarize(mode, results, baseline=None):
+    lines = []
+    for stage in sorted({r["stage"] for r in results}):
+        rows = [r for r in results if r["stage"] == stage]
+        tok_s = sum(r["decode_tok_s"] for r in rows) / len(rows)
+        ttft = sum(r["ttft_ms"] for r in rows) / len(rows)
+        line = f"{mode:>14} | {stage:>9} | {tok_s:8.2f} tok/s | ttft {ttft:8.1f} ms"
+
+        rates = [r["acceptance_rate"] for r in rows if r.get("acceptance_rate") is not None]
+        if rates:
+            line += f" | acceptance {sum(rates) / len(rates):.2%}"
+        if baseline:
+            base = [r for r in baseline if r["stage"] == stage]
+            base_tok_s = sum(r["decode_tok_s"] for r in base) / len(base)
+            line += f" | speedup x{tok_s / base_tok_s:.2f}"
+            same = sum(r["text"] == b["text"] for r, b in zip(rows, base))
+            line += f" | identical output {same}/{len(rows)}"
+        lines.append(line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("LLAMA_MODEL_PATH", "models/gemma.gguf"))
+    parser.add_argument("--draft-model", default=os.environ.get("LLAMA_DRAFT_MODEL_PATH"))
+    parser.add_argument("--draft-tokens", type=int, default=10)
+    parser.add_argument("--draft-threads", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 6)
+    parser.add_argument("--n-ctx", type=int, default=4096)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--out", help="Optional JSON file for the raw results")
+    args = parser.parse_args()
+
+    prompts = benchmark_prompts()
+    modes = ["none", "prompt_lookup"] + (["draft"] if args.draft_model else [])
+
+    all_results = {}
+    for mode in modes:
+        print(f"Running {mode} ...")
+        all_results[mode] = bench_mode(args, mode, prompts)
+
+    print()
+    for mode in modes:
+        baseline = all_results["none"] if mode != "none" else None
+        for line in summarize(mode, all_results[mode], baseline):
+            print(line)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(all_results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
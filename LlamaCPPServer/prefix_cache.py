@@ -0,0 +1,241 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixStateCache:
+    """
+    LRU cache of evaluated llama.cpp states for known prompt prefixes.
+
+    Each entry maps the token ids of a prefix (e.g. the SQL system prompt) to
+    the LlamaState captured right after evaluating it. A request that starts
+    with a cached prefix restores that state, so llama.cpp only has to
+    evaluate the user-specific suffix.
+    """
+
+    def __init__(self, model_id, capacity_bytes=1 << 30, cache_dir=None, min_prefix_tokens=32):
+        self.model_id = model_id
+        self.capacity_bytes = capacity_bytes
+        self.cache_dir = cache_dir
+        self.min_prefix_tokens = min_prefix_tokens
+
+        self._entries = OrderedDict()   # tuple(tokens) -> LlamaState
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "ttft_hit_ms": [],
+            "ttft_miss_ms": [],
+        }
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_from_disk()
+
+    # -------------------------------------------------------------
+    #  STATE BOOKKEEPING
+    # -------------------------------------------------------------
+    def _state_bytes(self, state):
+        return int(state.llama_state_size) + state.input_ids.nbytes + state.scores.nbytes
+
+    def _put(self, key, state):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._state_bytes(self._entries.pop(key))
+
+            self._entries[key] = state
+            self._size += self._state_bytes(state)
+
+            # Evict least recently used prefixes until we fit
+            while self._size > self.capacity_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._size -= self._state_bytes(old)
+                self.stats["evictions"] += 1
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(
+            (self.model_id + ":" + ",".join(map(str, key))).encode("utf-8")
+        ).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"{digest}.state")
+
+    def _load_from_disk(self):
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".state"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name), "rb") as f:
+                    model_id, key, state = pickle.load(f)
+            except Exception:
+                continue  # skip truncated / incompatible files
+
+            if model_id == self.model_id:
+                self._put(tuple(key), state)
+
+    def _persist(self, key, state):
+        """
+        Best effort: the state is already cached in memory, so a failed
+        write only costs the next process a warm-up.
+        """
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            # A temp file of its own: workers sharing cache_dir may save the
+            # same prefix at the same time
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((self.model_id, list(key), state), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not persist prefix state to %s: %s: %s", path, type(e).__name__, e)
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # -------------------------------------------------------------
+    #  PUBLIC API
+    # -------------------------------------------------------------
+    def warm(self, llm, prefix):
+        """
+        Evaluate `prefix` once and cache the resulting state.
+        Skipped when the prefix is already cached (e.g. loaded from disk).
+        """
+        tokens = llm.tokenize(prefix.encode("utf-8"))
+        key = tuple(tokens)
+
+        with self._lock:
+            if key in self._entries:
+                return False
+
+        llm.reset()
+        llm.eval(tokens)
+        state = llm.save_state()
+
+        # Sampling happens inside llama.cpp's sampler, so the per-token logits
+        # copied by save_state are never read back; keep a single row so
+        # load_state can still broadcast it into the scores buffer.
+        state.scores = np.zeros((1, state.scores.shape[1]), dtype=np.single)
+
+        self._put(key, state)
+        self._persist(key, state)
+        return True
+
+    def restore(self, llm, prompt_tokens):
+        """
+        Load the cached state sharing the longest prefix with `prompt_tokens`.
+        Returns the number of prompt tokens that no longer need evaluation.
+        """
+        # Whatever is already in the KV cache may be a better match
+        current = llm.longest_token_prefix(llm._input_ids.tolist(), prompt_tokens[:-1])
+
+        best_key, best_len = None, current
+        with self._lock:
+            for key in self._entries:
+                common = llm.longest_token_prefix(key, prompt_tokens[:-1])
+                if common > best_len:
+                    best_key, best_len = key, common
+
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                state = self._entries[best_key]
+
+        if best_key is not None:
+            llm.load_state(state)
+
+        if best_len >= self.min_prefix_tokens:
+            self.stats["hits"] += 1
+            return best_len
+
+        self.stats["misses"] += 1
+        return 0
+
+    def record_ttft(self, cached_tokens, ttft_ms):
+        bucket = "ttft_hit_ms" if cached_tokens else "ttft_miss_ms"
+        samples = self.stats[bucket]
+        samples.append(ttft_ms)
+        del samples[:-500]  # keep a bounded window
+
+    def summary(self):
+        def mean(values):
+            return round(sum(values) / len(values), 2) if values else None
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "capacity_bytes": self.capacity_bytes,
+                "prefix_tokens": [len(k) for k in self._entries],
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "evictions": self.stats["evictions"],
+                "mean_ttft_hit_ms": mean(self.stats["ttft_hit_ms"]),
+                "mean_ttft_miss_ms": mean(self.stats["ttft_miss_ms"]),
+                "persisted": bool(self.cache_dir),
+            }
+
+
+def generate_with_prefix_cache(llm, cache, prompt, on_token=None, cancelled=None, **kwargs):
+    """
+    Run a completion, resuming from the best cached prefix state.
+
+    on_token(piece) is called for every decoded piece; generation stops early
+    once cancelled() returns True.
+
+    Returns (text, timings) where timings carries time-to-first-token,
+    total time and how many prompt tokens were served from the cache.
+    """
+    start = time.perf_counter()
+    prompt_tokens = llm.tokenize(prompt.encode("utf-8"))
+
+    cached_tokens = cache.restore(llm, prompt_tokens) if cache is not None else 0
+
+    ttft_ms = None
+    pieces = []
+    was_cancelled = False
+    stream = llm(prompt, stream=True, **kwargs)
+    for chunk in stream:
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - start) * 1000
+
+        piece = chunk["choices"][0]["text"]
+        pieces.append(piece)
+        if on_token is not None and piece:
+            on_token(piece)
+
+        if cancelled is not None and cancelled():
+            was_cancelled = True
+            stream.close()  # stops decoding; the KV cache stays reusable
+            break
+
+    total_ms = (time.perf_counter() - start) * 1000
+    if ttft_ms is None:
+        ttft_ms = total_ms
+
+    if cache is not None:
+        cache.record_ttft(cached_tokens, ttft_ms)
+
+    text = "".join(pieces)
+    timings = {
+        "model": os.path.basename(llm.model_path),
+        "prompt_tokens": len(prompt_tokens),
+        "completion_tokens": len(llm.tokenize(text.encode("utf-8"), add_bos=False)),
+        "cached_tokens": cached_tokens,
+        "cache_hit": cached_tokens > 0,
+        "ttft_ms": round(ttft_ms, 2),
+        "total_ms": round(total_ms, 2),
+        "completion_pieces": len(pieces),
+        "cancelled": was_cancelled,
+    }
+    return text, timings
@@ -0,0 +1,54 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Written by `python -m LlamaCPPServer.tuning`, read by server.py at startup
+DEFAULT_PROFILE_PATH = os.path.join("LlamaCPPServer", "llama_profile.json")
+
+# Model parameters a profile may set on Llama(...)
+MODEL_KEYS = ("n_threads", "n_threads_batch", "n_batch", "n_ubatch", "n_ctx", "use_mmap", "use_mlock")
+
+
+def load_profile(path=None):
+    """
+    Load a tuning profile, or return None when there is none. Whether it
+    was tuned for the model being served is checked by apply_profile.
+    """
+    path = path or os.environ.get("LLAMA_PROFILE", DEFAULT_PROFILE_PATH)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        profile = json.load(f)
+
+    profile["path"] = path
+    return profile
+
+
+def save_profile(profile, path=None):
+    path = path or DEFAULT_PROFILE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=4)
+    return path
+
+
+def apply_profile(profile, model_config, model_path):
+    """
+    Merge a profile into the server configuration.
+    Returns (model_config, workers, threads_total, affinity); values the
+    profile does not cover come back as None so callers keep their defaults.
+    """
+    if profile is None:
+        return model_config, None, None, None
+
+    if os.path.abspath(profile.get("model_path", "")) != os.path.abspath(model_path):
+        logger.warning("Ignoring tuning profile %s: tuned for %s", profile["path"], profile.get("model_path"))
+        return model_config, None, None, None
+
+    merged = dict(model_config)
+    merged.update({k: v for k, v in profile["model"].items() if k in MODEL_KEYS})
+
+    return merged, profile.get("workers"), profile.get("threads_total"), profile.get("affinity")
@@ -0,0 +1,562 @@
+import os
+import math
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+from LLMEngine.llm_metrics import percentile
+
+# How often the scheduler checks that its worker processes are alive
+WATCH_INTERVAL_S = float(os.environ.get("WORKER_WATCH_INTERVAL_S", 1.0))
+
+
+class QueueFullError(Exception):
+    """Raised by Scheduler.submit when admission control rejects a request."""
+
+    def __init__(self, depth, retry_after):
+        super().__init__(f"Request queue is full ({depth} pending)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def split_threads(total_threads, n_workers):
+    """Split a thread budget across workers so the shares add up to the total."""
+    base, extra = divmod(max(total_threads, n_workers), n_workers)
+    return [base + (1 if i < extra else 0) for i in range(n_workers)]
+
+
+def split_cpus(shares):
+    """Contiguous, disjoint CPU sets sized by each worker's thread share."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    sets, start = [], 0
+    for share in shares:
+        sets.append(cpus[start:start + share] or cpus)
+        start += share
+    return sets
+
+
+def pin_to_cpus(cpu_set):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_set)
+        return
+    try:
+        import psutil  # Windows / macOS
+        psutil.Process().cpu_affinity(cpu_set)
+    except Exception:
+        pass  # affinity is an optimisation, never a requirement
+
+
+# ---------------------------------------------------------
+#                   MODEL WORKER PROCESS
+# ---------------------------------------------------------
+
+class ResultPipe:
+    """
+    A worker's own channel back to the scheduler, with the put() of a
+    queue. Unlike a multiprocessing.Queue shared by all workers there is
+    no cross-process lock, so a worker killed mid-write can't block the
+    others.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def put(self, msg):
+        self.conn.send(msg)
+
+
+def worker_main(worker_id, model_config, prefixes, cache_config, job_queue, result_queue, cancel_queue):
+    """
+    Entry point of a model worker process.
+    Owns one Llama instance and its prefix cache; runs batches sequentially.
+    Streaming requests push every decoded piece back as a "token" message.
+    "idle" messages carry the process id, so the scheduler can ignore those
+    of a worker it has already replaced.
+    """
+    from llama_cpp import Llama
+    from LlamaCPPServer.prefix_cache import PrefixStateCache, generate_with_prefix_cache
+    from LlamaCPPServer.speculative import build_draft_model
+
+    model_config = dict(model_config)
+    speculative = dict(model_config.pop("speculative", None) or {})
+    cpu_set = model_config.pop("cpu_set", None)
+    if cpu_set:
+        pin_to_cpus(cpu_set)
+
+    try:
+        if speculative.get("mode") == "draft":
+            # The draft model's threads come out of this worker's budget
+            speculative["draft_threads"] = max(1, model_config["n_threads"] // 4)
+            model_config["n_threads"] = max(1, model_config["n_threads"] - speculative["draft_threads"])
+
+        llm = Llama(
+            **model_config,
+            draft_model=build_draft_model(n_ctx=model_config.get("n_ctx", 4096), **speculative),
+        )
+
+        prefix_cache = PrefixStateCache(model_id=os.path.abspath(model_config["model_path"]), **cache_config)
+        for prefix in prefixes:
+            prefix_cache.warm(llm, prefix)
+    except Exception as e:
+        result_queue.put((None, "fatal", {"worker": worker_id, "error": f"{type(e).__name__}: {e}"}))
+        return
+
+    cancelled_ids = set()
+
+    def drain_cancellations():
+        while True:
+            try:
+                cancelled_ids.add(cancel_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    result_queue.put((None, "idle", {"worker": worker_id, "pid": os.getpid(), "cache": prefix_cache.summary()}))
+
+    while True:
+        batch = job_queue.get()
+        if batch is None:
+            break
+
+        for req_id, req in batch:
+            drain_cancellations()
+            if req_id in cancelled_ids:
+                cancelled_ids.discard(req_id)
+                result_queue.put((req_id, "cancelled", None))
+                continue
+            # Queue time includes waiting behind earlier requests of the batch
+            queue_ms = (time.time() - req["enqueued_at"]) * 1000
+
+            def on_token(piece, req_id=req_id):
+                result_queue.put((req_id, "token", piece))
+
+            def cancelled(req_id=req_id):
+                drain_cancellations()
+                return req_id in cancelled_ids
+
+            try:
+                text, timings = generate_with_prefix_cache(
+                    llm,
+                    prefix_cache,
+                    req["prompt"],
+                    on_token=on_token if req.get("stream") else None,
+                    cancelled=cancelled,
+                    max_tokens=req["max_tokens"],
+                    temperature=req["temperature"],
+                    stop=req["stop"],
+                )
+                cancelled_ids.discard(req_id)
+                timings["worker"] = worker_id
+                timings["queue_ms"] = round(queue_ms, 2)
+                result_queue.put((req_id, "done", {"text": text, "timings": timings}))
+            except Exception as e:
+                result_queue.put((req_id, "error", f"{type(e).__name__}: {e}"))
+
+        result_queue.put((None, "idle", {"worker": worker_id, "pid": os.getpid(), "cache": prefix_cache.summary()}))
+
+
+# ---------------------------------------------------------
+#                      SCHEDULER
+# ---------------------------------------------------------
+
+class Scheduler:
+    """
+    Async request queue in front of a pool of model worker processes.
+
+    Requests with the same batch key (same cached prompt prefix and sampling
+    settings) are grouped and handed to one worker together, so every request
+    after the first resumes from the prefix state already in that worker's
+    KV cache. Requests in a batch run one after another, so batches are only
+    formed while every other worker is busy.
+
+    A worker process that dies (crash, OOM kill) fails the requests it
+    held and is respawned; one that fails to load its model is not.
+    """
+
+    def __init__(self, model_config, prefixes=(), cache_config=None,
+                 n_workers=1, total_threads=None, max_queue=32, max_batch=4, affinity=False,
+                 worker=worker_main):
+        self.model_config = model_config
+        self.worker = worker
+        self.prefixes = list(prefixes)
+        self.cache_config = cache_config or {}
+        self.n_workers = n_workers
+        self.total_threads = total_threads or os.cpu_count() or n_workers
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.affinity = affinity
+
+        self._pending = deque()     # (req_id, batch_key, req)
+        self._futures = {}          # req_id -> asyncio.Future
+        self._streams = {}          # req_id -> asyncio.Queue of stream events
+        self._assigned = {}         # req_id -> worker id
+        self._wakeup = None
+        self._idle = None
+        self._loop = None
+        self._ctx = None
+        self._worker_configs = []
+        self._procs = []
+        self._job_queues = []
+        self._cancel_queues = []
+        self._result_conns = {}     # read end of each live worker's ResultPipe -> worker id
+        self._conns_lock = threading.Lock()
+        self._wake_reader = None
+        self._dispatcher = None
+        self._watcher = None
+        self._reader = None
+        self._stopping = False
+
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "batches": 0,
+            "worker_restarts": 0,
+            "wait_ms": deque(maxlen=1000),
+            "service_ms": deque(maxlen=1000),
+        }
+        self.worker_caches = {}
+        self.worker_errors = {}
+
+    # -------------------------------------------------------------
+    #  LIFECYCLE
+    # -------------------------------------------------------------
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Queue()
+
+        self._ctx = multiprocessing.get_context("spawn")
+        wake_r, self._wake_reader = self._ctx.Pipe(duplex=False)
+
+        shares = split_threads(self.total_threads, self.n_workers)
+        cpu_sets = split_cpus(shares) if self.affinity else [None] * self.n_workers
+
+        for share, cpu_set in zip(shares, cpu_sets):
+            # A tuned profile may ask for fewer threads than the share (decoding
+            # saturates early). llama-cpp-python defaults n_threads_batch to
+            # every core, so cap it at the share as well.
+            config = dict(self.model_config, cpu_set=cpu_set)
+            config["n_threads"] = min(share, self.model_config.get("n_threads", share))
+            config["n_threads_batch"] = min(share, self.model_config.get("n_threads_batch", share))
+            self._worker_configs.append(config)
+            self._procs.append(None)
+            self._job_queues.append(None)
+            self._cancel_queues.append(None)
+
+        for worker_id in range(self.n_workers):
+            self._spawn(worker_id)
+
+        self._reader = threading.Thread(target=self._read_results, args=(wake_r,), daemon=True)
+        self._reader.start()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._watcher = asyncio.create_task(self._watch())
+
+    def _spawn(self, worker_id):
+        # Fresh queues: a process killed mid-read can leave a queue unusable
+        job_queue = self._ctx.Queue()
+        cancel_queue = self._ctx.Queue()
+        results, results_w = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=self.worker,
+            args=(worker_id, self._worker_configs[worker_id], self.prefixes, self.cache_config,
+                  job_queue, ResultPipe(results_w), cancel_queue),
+            daemon=True,
+        )
+        proc.start()
+        # Only the worker holds the write end, so its death closes the pipe
+        results_w.close()
+        with self._conns_lock:
+            self._result_conns[results] = worker_id
+        if self._reader is not None:
+            self._wake_reader.send(None)  # start reading the new pipe
+        self._procs[worker_id] = proc
+        self._job_queues[worker_id] = job_queue
+        self._cancel_queues[worker_id] = cancel_queue
+
+    async def stop(self):
+        self._stopping = True
+        if self._watcher:
+            self._watcher.cancel()
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for job_queue in self._job_queues:
+            job_queue.put(None)
+        for proc in self._procs:
+            proc.join(timeout=10)
+        self._wake_reader.send(None)
+        self._reader.join(timeout=5)
+
+        for fut in self._futures.values():
+            if not fut.done():
+                fut.set_exception(RuntimeError("Scheduler stopped"))
+        for events in self._streams.values():
+            events.put_nowait(("error", "Scheduler stopped"))
+
+    # -------------------------------------------------------------
+    #  SUBMISSION + ADMISSION CONTROL
+    # -------------------------------------------------------------
+    def batch_key(self, req):
+        prefix_idx = next(
+            (i for i, p in enumerate(self.prefixes) if req["prompt"].startswith(p)), -1
+        )
+        return (prefix_idx, req["temperature"], tuple(req["stop"]))
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained."""
+        service = self.metrics["service_ms"]
+        mean_s = (sum(service) / len(service) / 1000) if service else 5.0
+        return max(1, math.ceil(len(self._pending) * mean_s / self.n_workers))
+
+    def _enqueue(self, req):
+        if len(self.worker_errors) == self.n_workers:
+            raise RuntimeError(f"No model worker available: {self.worker_errors}")
+
+        if len(self._pending) >= self.max_queue:
+            self.metrics["rejected"] += 1
+            raise QueueFullError(len(self._pending), self.retry_after())
+
+        req_id = uuid.uuid4().hex
+        # Wall clock: the worker process measures the wait against it
+        req["enqueued_at"] = time.time()
+        self._pending.append((req_id, self.batch_key(req), req))
+        self.metrics["submitted"] += 1
+        self._wakeup.set()
+        return req_id
+
+    async def submit(self, req):
+        req_id = self._enqueue(dict(req, stream=False))
+        fut = self._loop.create_future()
+        self._futures[req_id] = fut
+
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            self.cancel(req_id)
+            raise
+        finally:
+            self._futures.pop(req_id, None)
+
+    def open_stream(self, req):
+        """
+        Admit a streaming request. Raises QueueFullError immediately so the
+        caller can answer 429 before any response bytes are sent.
+        """
+        req_id = self._enqueue(dict(req, stream=True))
+        self._streams[req_id] = asyncio.Queue()
+        return req_id
+
+    async def stream(self, req_id):
+        """
+        Yield ("token", piece) events, then a final ("done", result) or
+        ("error", message). Closing the generator early cancels the request.
+        """
+        events = self._streams[req_id]
+        finished = False
+        try:
+            while True:
+                kind, payload = await events.get()
+                yield kind, payload
+                if kind in ("done", "error"):
+                    finished = True
+                    return
+        finally:
+            self._streams.pop(req_id, None)
+            if not finished:
+                self.cancel(req_id)
+
+    def cancel(self, req_id):
+        """Drop a queued request, or tell its worker to stop decoding it."""
+        for item in self._pending:
+            if item[0] == req_id:
+                self._pending.remove(item)
+                self.metrics["cancelled"] += 1
+                return
+
+        worker_id = self._assigned.get(req_id)
+        if worker_id is not None:
+            self._cancel_queues[worker_id].put(req_id)
+            self.metrics["cancelled"] += 1
+
+    # -------------------------------------------------------------
+    #  DISPATCH
+    # -------------------------------------------------------------
+    def _take_batch(self, max_batch):
+        """Pop the oldest request plus up to max_batch-1 compatible ones."""
+        first = self._pending.popleft()
+        batch = [first]
+
+        for item in list(self._pending):
+            if len(batch) >= max_batch:
+                break
+            if item[1] == first[1]:
+                self._pending.remove(item)
+                batch.append(item)
+
+        return batch
+
+    async def _dispatch(self):
+        while True:
+            worker_id = await self._idle.get()
+
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # A batch runs its requests one after another on one worker:
+            # only worth it when no other worker is free to take them
+            batch = self._take_batch(self.max_batch if self._idle.empty() else 1)
+
+            self.metrics["batches"] += 1
+            for req_id, _, _ in batch:
+                self._assigned[req_id] = worker_id
+            self._job_queues[worker_id].put([(req_id, req) for req_id, _, req in batch])
+
+    # -------------------------------------------------------------
+    #  WORKER LIVENESS
+    # -------------------------------------------------------------
+    async def _watch(self):
+        while not self._stopping:
+            await asyncio.sleep(WATCH_INTERVAL_S)
+            for worker_id, proc in enumerate(self._procs):
+                # Workers that failed to load exit on purpose; respawning
+                # would fail the same way
+                if not self._stopping and not proc.is_alive() and worker_id not in self.worker_errors:
+                    self._on_worker_died(worker_id, proc.exitcode)
+
+    def _on_worker_died(self, worker_id, exitcode):
+        """Fail the dead worker's requests, forget its idle slot, start a new one."""
+        message = f"Model worker {worker_id} died (exit code {exitcode})"
+        for req_id, assigned_to in list(self._assigned.items()):
+            if assigned_to != worker_id:
+                continue
+            del self._assigned[req_id]
+            self.metrics["failed"] += 1
+            fut = self._futures.get(req_id)
+            if fut and not fut.done():
+                fut.set_exception(RuntimeError(message))
+            if req_id in self._streams:
+                self._streams[req_id].put_nowait(("error", message))
+
+        idle = []
+        while not self._idle.empty():
+            idle.append(self._idle.get_nowait())
+        for other in idle:
+            if other != worker_id:
+                self._idle.put_nowait(other)
+
+        self.metrics["worker_restarts"] += 1
+        self._spawn(worker_id)
+
+    # -------------------------------------------------------------
+    #  RESULTS (worker processes -> event loop)
+    # -------------------------------------------------------------
+    def _read_results(self, wake):
+        while True:
+            with self._conns_lock:
+                conns = list(self._result_conns)
+            for conn in wait(conns + [wake]):
+                if conn is wake:
+                    wake.recv()
+                    if self._stopping:
+                        return
+                    continue
+                try:
+                    msg = conn.recv()
+                except Exception:
+                    # Closed (or cut off mid-message) by a dead worker; the
+                    # watcher fails its requests and respawns it
+                    with self._conns_lock:
+                        self._result_conns.pop(conn, None)
+                    conn.close()
+                    continue
+                self._loop.call_soon_threadsafe(self._on_result, *msg)
+
+    def _on_result(self, req_id, kind, payload):
+        if kind == "fatal":
+            self.worker_errors[payload["worker"]] = payload["error"]
+            if len(self.worker_errors) == self.n_workers:
+                # No worker can ever serve the backlog; fail it instead of hanging
+                message = f"No model worker available: {payload['error']}"
+                while self._pending:
+                    req_id = self._pending.popleft()[0]
+                    fut = self._futures.get(req_id)
+                    if fut and not fut.done():
+                        fut.set_exception(RuntimeError(message))
+                    if req_id in self._streams:
+                        self._streams[req_id].put_nowait(("error", message))
+            return
+
+        if kind == "idle":
+            proc = self._procs[payload["worker"]]
+            if payload.get("pid") is not None and payload["pid"] != proc.pid:
+                return  # sent by a worker that has since died and been replaced
+            self.worker_caches[payload["worker"]] = payload["cache"]
+            self._idle.put_nowait(payload["worker"])
+            return
+
+        events = self._streams.get(req_id)
+        if kind == "token":
+            if events is not None:
+                events.put_nowait((kind, payload))
+            return
+
+        self._assigned.pop(req_id, None)
+        fut = self._futures.get(req_id)
+        if kind == "cancelled":
+            # Cancelled before its worker started it; the caller is gone
+            if fut and not fut.done():
+                fut.cancel()
+            if events is not None:
+                events.put_nowait(("error", "Request cancelled"))
+            return
+        if kind == "done":
+            self.metrics["completed"] += 1
+            self.metrics["service_ms"].append(payload["timings"]["total_ms"])
+            if "queue_ms" in payload["timings"]:
+                self.metrics["wait_ms"].append(payload["timings"]["queue_ms"])
+            if fut and not fut.done():
+                fut.set_result(payload)
+        elif kind == "error":
+            self.metrics["failed"] += 1
+            if fut and not fut.done():
+                fut.set_exception(RuntimeError(payload))
+
+        if events is not None:
+            events.put_nowait((kind, payload))
+
+    # -------------------------------------------------------------
+    #  METRICS
+    # -------------------------------------------------------------
+    def summary(self):
+        wait = list(self.metrics["wait_ms"])
+        service = list(self.metrics["service_ms"])
+        return {
+            "workers": self.n_workers,
+            "threads_per_worker": split_threads(self.total_threads, self.n_workers),
+            "affinity": self.affinity,
+            "speculative": (self.model_config.get("speculative") or {}).get("mode", "none"),
+            "alive_workers": sum(proc.is_alive() for proc in self._procs),
+            "worker_restarts": self.metrics["worker_restarts"],
+            "idle_workers": self._idle.qsize() if self._idle else 0,
+            "worker_errors": self.worker_errors,
+            "queue_depth": len(self._pending),
+            "max_queue": self.max_queue,
+            "in_flight": len(self._assigned),
+            "submitted": self.metrics["submitted"],
+            "completed": self.metrics["completed"],
+            "failed": self.metrics["failed"],
+            "rejected": self.metrics["rejected"],
+            "cancelled": self.metrics["cancelled"],
+            "batches": self.metrics["batches"],
+            "wait_ms_p50": percentile(wait, 50),
+            "wait_ms_p95": percentile(wait, 95),
+            "service_ms_p50": percentile(service, 50),
+            "service_ms_p95": percentile(service, 95),
+        }
@@ -1,29 +1,172 @@
-from fastapi import FastAPI
+import os
+import json
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from llama_cpp import Llama
 
-app = FastAPI()
+from LLMEngine.LlamaCPP_Handler import PROMPT_PREFIXES
+from LlamaCPPServer.scheduler import Scheduler, QueueFullError
+from LlamaCPPServer.runtime_profile import load_profile, apply_profile
+
+MODEL_PATH = os.environ.get("LLAMA_MODEL_PATH", "models/gemma.gguf")
+
+# Prefix KV-state cache: in-memory size limit, optional on-disk persistence
+PREFIX_CACHE_BYTES = int(os.environ.get("LLAMA_PREFIX_CACHE_BYTES", 1 << 30))
+PREFIX_CACHE_DIR = os.environ.get("LLAMA_PREFIX_CACHE_DIR")  # unset = memory only
+
+# Worker pool: each worker process loads its own model; threads are split
+# across workers so the total matches the host's cores
+LLAMA_WORKERS = os.environ.get("LLAMA_WORKERS")
+LLAMA_THREADS_TOTAL = os.environ.get("LLAMA_THREADS_TOTAL")
+LLAMA_MAX_QUEUE = int(os.environ.get("LLAMA_MAX_QUEUE", 32))
+LLAMA_MAX_BATCH = int(os.environ.get("LLAMA_MAX_BATCH", 4))
+
+# Speculative decoding: none | prompt_lookup | draft (small GGUF, same vocab).
+# Note: llama-cpp-python keeps logits for every position once a draft model
+# is attached, which costs n_ctx * n_vocab * 4 bytes per worker.
+LLAMA_SPECULATIVE = os.environ.get("LLAMA_SPECULATIVE", "none")
+LLAMA_DRAFT_MODEL_PATH = os.environ.get("LLAMA_DRAFT_MODEL_PATH")
+LLAMA_DRAFT_TOKENS = int(os.environ.get("LLAMA_DRAFT_TOKENS", 10))
 
 # Load llama.cpp CPU model (adjust path)
-llm = Llama(
-    model_path="models/gemma.gguf",
-    n_threads=6,          # adjust for your CPU
-    n_ctx=4096,
+MODEL_CONFIG = {
+    "model_path": MODEL_PATH,
+    "n_ctx": 4096,
+    "verbose": False,
+    "speculative": {
+        "mode": LLAMA_SPECULATIVE,
+        "draft_model_path": LLAMA_DRAFT_MODEL_PATH,
+        "num_pred_tokens": LLAMA_DRAFT_TOKENS,
+    },
+}
+
+# Host-specific optimum measured by `python -m LlamaCPPServer.tuning`.
+# Explicit environment variables still win over the profile.
+PROFILE = load_profile()
+MODEL_CONFIG, profile_workers, profile_threads, profile_affinity = apply_profile(
+    PROFILE, MODEL_CONFIG, MODEL_PATH
+)
+LLAMA_WORKERS = int(LLAMA_WORKERS or profile_workers or 1)
+LLAMA_THREADS_TOTAL = int(LLAMA_THREADS_TOTAL or profile_threads or os.cpu_count() or 6)
+LLAMA_AFFINITY = os.environ.get("LLAMA_AFFINITY", str(bool(profile_affinity))).lower() in ("1", "true", "yes")
+
+scheduler = Scheduler(
+    model_config=MODEL_CONFIG,
+    prefixes=PROMPT_PREFIXES,
+    cache_config={"capacity_bytes": PREFIX_CACHE_BYTES, "cache_dir": PREFIX_CACHE_DIR},
+    n_workers=LLAMA_WORKERS,
+    total_threads=LLAMA_THREADS_TOTAL,
+    max_queue=LLAMA_MAX_QUEUE,
+    max_batch=LLAMA_MAX_BATCH,
+    affinity=LLAMA_AFFINITY,
 )
 
+
+# Vocabulary-only copy of the model (no weights) so clients can measure
+# prompts in real tokens without occupying a worker
+tokenizer = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global tokenizer
+    tokenizer = Llama(model_path=MODEL_PATH, vocab_only=True, verbose=False)
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    tokenizer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
 class GenerateRequest(BaseModel):
     prompt: str
     max_tokens: int = 2000
     temperature: float = 0.15
+    stop: list[str] = []  # added to STOP_SEQUENCES
+
+class TokenizeRequest(BaseModel):
+    text: str
+
+STOP_SEQUENCES = ["</s>", "SQL ONLY:"]
+
+def queue_full(e):
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy: {e.depth} requests queued. Retry in {e.retry_after}s.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
 @app.post("/generate")
-def generate_text(req: GenerateRequest):
-    output = llm(
-        req.prompt,
-        max_tokens=req.max_tokens,
-        temperature=req.temperature,
-        stop=["</s>", "SQL ONLY:"],
+async def generate_text(req: GenerateRequest):
+    payload = dict(req.model_dump(), stop=STOP_SEQUENCES + req.stop)
+
+    try:
+        result = await scheduler.submit(payload)
+    except QueueFullError as e:
+        raise queue_full(e)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"text": result["text"], "timings": result["timings"]}
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest):
+    """
+    Server-sent events: one `data: {"token": ...}` event per decoded piece,
+    then a `done` event with timings (or an `error` event).
+    If the client disconnects, the request is cancelled on its worker.
+    """
+    payload = dict(req.model_dump(), stop=STOP_SEQUENCES + req.stop)
+
+    try:
+        req_id = scheduler.open_stream(payload)
+    except QueueFullError as e:
+        raise queue_full(e)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        async for kind, data in scheduler.stream(req_id):
+            if kind == "token":
+                yield f"data: {json.dumps({'token': data})}\n\n"
+            elif kind == "done":
+                yield f"event: done\ndata: {json.dumps({'timings': data['timings']})}\n\n"
+            else:
+                yield f"event: error\ndata: {json.dumps({'error': data})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    text = output["choices"][0]["text"]
-    return {"text": text}
+@app.post("/tokenize")
+def tokenize(req: TokenizeRequest):
+    """Token count of `text` under the served model's tokenizer."""
+    tokens = tokenizer.tokenize(req.text.encode("utf-8"), add_bos=False)
+    return {"tokens": len(tokens)}
+
+@app.get("/metrics")
+def metrics():
+    """Queue depth, wait/service time percentiles and worker pool state."""
+    return scheduler.summary()
+
+@app.get("/profile")
+def profile():
+    """The tuning profile in effect (with its reasoning), if any."""
+    if PROFILE is None:
+        return {"profile": None, "model_config": MODEL_CONFIG}
+    return {
+        "profile": PROFILE["path"],
+        "model_config": MODEL_CONFIG,
+        "reasoning": PROFILE.get("reasoning", []),
+    }
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Prefix cache occupancy, hit rate and mean TTFT with/without a hit, per worker."""
+    return scheduler.worker_caches
@@ -0,0 +1,98 @@
+import numpy as np
+
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+SPECULATIVE_MODES = ("none", "prompt_lookup", "draft")
+
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Small GGUF model proposing tokens for the main model to verify.
+    Must share the main model's vocabulary (same family/tokenizer).
+    """
+
+    def __init__(self, model_path, num_pred_tokens=8, n_threads=2, n_ctx=4096):
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(
+            model_path=model_path,
+            n_threads=n_threads,
+            n_ctx=n_ctx,
+            verbose=False,
+        )
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = []
+        # generate() reuses the draft model's own KV cache for the shared prefix
+        for token in self.llm.generate(input_ids.tolist(), temp=0.0, top_k=1):
+            if token == self.llm.token_eos():
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+
+class CountingDraftModel(LlamaDraftModel):
+    """
+    Wraps a draft model and counts proposals so acceptance can be estimated.
+
+    llama-cpp-python verifies one draft per decoding step and every step
+    emits its accepted draft tokens plus one token of its own, so
+    accepted ~= completion_tokens - steps.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.calls = 0
+        self.drafted = 0
+
+    def acceptance(self, completion_tokens):
+        accepted = max(completion_tokens - self.calls, 0)
+        return {
+            "draft_calls": self.calls,
+            "drafted_tokens": self.drafted,
+            "accepted_tokens": accepted,
+            "acceptance_rate": round(accepted / self.drafted, 3) if self.drafted else None,
+        }
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self.inner(input_ids, **kwargs)
+        self.calls += 1
+        self.drafted += len(draft)
+        return draft
+
+
+def build_draft_model(mode="none", num_pred_tokens=10, max_ngram_size=3,
+                      draft_model_path=None, draft_threads=2, n_ctx=4096):
+    """
+    Draft model for Llama(draft_model=...), or None for plain decoding.
+
+    prompt_lookup: copies n-gram continuations from the prompt; suits the
+    interpreter (values copied from result rows) and SQL (column names
+    repeated from the schema).
+    draft: a small GGUF model from the same family.
+    """
+    if mode in (None, "", "none"):
+        return None
+
+    if mode == "prompt_lookup":
+        return LlamaPromptLookupDecoding(
+            max_ngram_size=max_ngram_size,
+            num_pred_tokens=num_pred_tokens,
+        )
+
+    if mode == "draft":
+        if not draft_model_path:
+            raise ValueError("Speculative mode 'draft' needs a draft model path.")
+        return GGUFDraftModel(
+            draft_model_path,
+            num_pred_tokens=num_pred_tokens,
+            n_threads=draft_threads,
+            n_ctx=n_ctx,
+        )
+
+    raise ValueError(f"Unknown speculative mode '{mode}'. Use one of {SPECULATIVE_MODES}.")
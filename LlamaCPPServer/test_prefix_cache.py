@@ -0,0 +1,43 @@
+import os
+import pickle
+import threading
+
+from LlamaCPPServer.prefix_cache import PrefixStateCache
+
+
+class State:
+    """Stands in for a LlamaState; only pickled here."""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+def test_concurrent_persists_of_one_prefix(tmp_path):
+    caches = [PrefixStateCache("model", cache_dir=str(tmp_path)) for _ in range(4)]
+    key = tuple(range(64))
+    errors = []
+
+    def save(cache, worker):
+        try:
+            for i in range(50):
+                cache._persist(key, State(b"x" * 100000 + bytes([worker])))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(c, w)) for w, c in enumerate(caches)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert [name for name in os.listdir(tmp_path) if not name.endswith(".state")] == []
+    with open(caches[0]._disk_path(key), "rb") as f:
+        model_id, stored_key, state = pickle.load(f)
+    assert (model_id, tuple(stored_key), len(state.payload)) == ("model", key, 100001)
+
+
+def test_failed_persist_is_not_fatal(tmp_path):
+    cache = PrefixStateCache("model", cache_dir=str(tmp_path))
+    cache._persist((1, 2, 3), lambda: None)  # unpicklable
+    assert os.listdir(tmp_path) == []
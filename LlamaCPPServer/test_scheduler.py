@@ -0,0 +1,125 @@
+import os
+import time
+import queue
+import asyncio
+
+import pytest
+
+from LlamaCPPServer import scheduler as scheduler_module
+from LlamaCPPServer.scheduler import Scheduler
+
+
+def fake_worker(worker_id, model_config, prefixes, cache_config, job_queue, result_queue, cancel_queue):
+    """
+    Echoes prompts, following worker_main's protocol. "crash" kills the
+    process mid-request; "sleep:<s>" takes s seconds.
+    """
+    result_queue.put((None, "idle", {"worker": worker_id, "pid": os.getpid(), "cache": {}}))
+    cancelled = set()
+    while True:
+        batch = job_queue.get()
+        if batch is None:
+            break
+        for req_id, req in batch:
+            while True:
+                try:
+                    cancelled.add(cancel_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if req_id in cancelled:
+                result_queue.put((req_id, "cancelled", None))
+                continue
+            queue_ms = (time.time() - req["enqueued_at"]) * 1000
+
+            if req["prompt"] == "crash":
+                os._exit(1)
+            if req["prompt"].startswith("sleep:"):
+                time.sleep(float(req["prompt"].split(":")[1]))
+            if req.get("stream"):
+                result_queue.put((req_id, "token", req["prompt"]))
+            timings = {"total_ms": 1.0, "worker": worker_id, "queue_ms": queue_ms}
+            result_queue.put((req_id, "done", {"text": req["prompt"], "timings": timings}))
+        result_queue.put((None, "idle", {"worker": worker_id, "pid": os.getpid(), "cache": {}}))
+
+
+def request(prompt):
+    return {"prompt": prompt, "max_tokens": 8, "temperature": 0.0, "stop": []}
+
+
+async def run_crash_and_recover():
+    scheduler = Scheduler({"model_path": "fake.gguf"}, worker=fake_worker, max_batch=1)
+    await scheduler.start()
+    try:
+        assert (await asyncio.wait_for(scheduler.submit(request("a")), 30))["text"] == "a"
+
+        with pytest.raises(RuntimeError, match="died"):
+            await asyncio.wait_for(scheduler.submit(request("crash")), 30)
+
+        stream_id = scheduler.open_stream(request("crash"))
+        events = [event async for event in scheduler.stream(stream_id)]
+        assert events[-1][0] == "error" and "died" in events[-1][1]
+
+        # The respawned worker serves new requests
+        assert (await asyncio.wait_for(scheduler.submit(request("b")), 30))["text"] == "b"
+        summary = scheduler.summary()
+        assert summary["worker_restarts"] == 2
+        assert summary["alive_workers"] == 1
+        assert summary["in_flight"] == 0
+    finally:
+        await scheduler.stop()
+
+
+def test_dead_worker_fails_its_requests_and_is_respawned(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "WATCH_INTERVAL_S", 0.1)
+    asyncio.run(run_crash_and_recover())
+
+
+async def wait_idle(scheduler, n_workers):
+    # Every worker has loaded and reported idle
+    while len(scheduler.worker_caches) < n_workers:
+        await asyncio.sleep(0.05)
+
+
+async def run_spread_over_idle_workers():
+    scheduler = Scheduler({"model_path": "fake.gguf"}, worker=fake_worker, n_workers=2, max_batch=4)
+    await scheduler.start()
+    try:
+        await asyncio.wait_for(wait_idle(scheduler, 2), 30)
+        results = await asyncio.wait_for(asyncio.gather(
+            scheduler.submit(request("sleep:0.3")), scheduler.submit(request("sleep:0.3")),
+        ), 30)
+        assert {r["timings"]["worker"] for r in results} == {0, 1}
+    finally:
+        await scheduler.stop()
+
+
+def test_same_key_requests_go_to_different_idle_workers():
+    asyncio.run(run_spread_over_idle_workers())
+
+
+async def run_batch_wait_and_cancel():
+    scheduler = Scheduler({"model_path": "fake.gguf"}, worker=fake_worker, n_workers=1, max_batch=4)
+    await scheduler.start()
+    try:
+        await asyncio.wait_for(wait_idle(scheduler, 1), 30)
+        first = asyncio.ensure_future(scheduler.submit(request("sleep:0.5")))
+        second = asyncio.ensure_future(scheduler.submit(request("sleep:0.5")))
+        third = asyncio.ensure_future(scheduler.submit(request("x")))
+        await asyncio.sleep(0.2)
+        assert scheduler.summary()["in_flight"] == 3   # one batch on the only worker
+
+        third.cancel()
+        await asyncio.wait_for(asyncio.gather(first, second), 30)
+        while scheduler.summary()["in_flight"]:
+            await asyncio.sleep(0.05)
+
+        # Time spent behind the first request of the batch counts as waiting
+        assert (await second)["timings"]["queue_ms"] >= 400
+        assert scheduler.summary()["wait_ms_p95"] >= 400
+        assert scheduler.metrics["failed"] == 0
+    finally:
+        await scheduler.stop()
+
+
+def test_batch_wait_and_cancel_before_start():
+    asyncio.run(asyncio.wait_for(run_batch_wait_and_cancel(), 60))
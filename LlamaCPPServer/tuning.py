@@ -0,0 +1,312 @@
+"""
+Measure llama.cpp throughput on this host and write the runtime profile
+that LlamaCPPServer loads at startup.
+
+Usage (from the repo root):
+    python -m LlamaCPPServer.tuning --model models/gemma.gguf
+    python -m LlamaCPPServer.tuning --model models/gemma.gguf --full-grid
+
+By default the search is staged: thread counts first, then batch sizes at
+the best thread count, then context sizes. --full-grid measures every
+combination instead. Prompts are the real SQL/interpreter prompts.
+"""
+import os
+import time
+import socket
+import argparse
+import datetime
+import itertools
+
+from llama_cpp import Llama
+
+from LLMEngine.generation_config import STAGE_CONFIGS
+from LLMEngine.LlamaCPP_Handler import LlamaCPPHandler
+from LLMEngine.result_compactor import compact_result
+from LlamaCPPServer.bench_prompts import SAMPLE_RESULT, benchmark_prompts
+from LlamaCPPServer.runtime_profile import DEFAULT_PROFILE_PATH, save_profile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# ---------------------------------------------------------
+#                    HOST INSPECTION
+# ---------------------------------------------------------
+
+def host_info():
+    logical = os.cpu_count() or 1
+    physical = psutil.cpu_count(logical=False) if psutil else None
+    return {
+        "host": socket.gethostname(),
+        "logical_cores": logical,
+        "physical_cores": physical or logical,
+        "available_ram_bytes": psutil.virtual_memory().available if psutil else None,
+    }
+
+
+def thread_candidates(info):
+    logical, physical = info["logical_cores"], info["physical_cores"]
+    candidates = {2, 4, physical // 2, physical, logical}
+    return sorted(t for t in candidates if 1 <= t <= logical)
+
+
+# ---------------------------------------------------------
+#                     MEASUREMENT
+# ---------------------------------------------------------
+
+def measure(model_path, params, prompt_tokens, gen_tokens):
+    """
+    Load the model with `params` and time prompt evaluation and greedy
+    generation over the prompt set. Returns tokens/sec for both phases.
+    """
+    start = time.perf_counter()
+    llm = Llama(model_path=model_path, verbose=False, **params)
+    load_s = time.perf_counter() - start
+
+    pe_tokens, pe_s, gen_n, gen_s, skipped = 0, 0.0, 0, 0.0, 0
+    for tokens in prompt_tokens:
+        if len(tokens) + gen_tokens > params["n_ctx"]:
+            skipped += 1
+            continue
+
+        llm.reset()
+        t = time.perf_counter()
+        llm.eval(tokens)
+        pe_s += time.perf_counter() - t
+        pe_tokens += len(tokens)
+
+        # generate() prefix-matches the evaluated prompt, so this times decoding
+        t = time.perf_counter()
+        for token in itertools.islice(llm.generate(tokens, temp=0.0, top_k=1), gen_tokens):
+            gen_n += 1
+            if token == llm.token_eos():
+                break
+        gen_s += time.perf_counter() - t
+
+    llm.close()
+
+    return {
+        "params": params,
+        "load_s": round(load_s, 2),
+        "prompt_eval_tok_s": round(pe_tokens / pe_s, 2) if pe_s else 0.0,
+        "generation_tok_s": round(gen_n / gen_s, 2) if gen_s else 0.0,
+        "skipped_prompts": skipped,
+    }
+
+
+def context_floor(stage_prompts, tokenize):
+    """
+    Smallest n_ctx that fits every stage at run time: its longest prompt
+    plus the stage's max_tokens. Interpreter prompts are measured with
+    SAMPLE_RESULT and grown to a result that fills the handler's
+    result_token_budget, as large query results do.
+    """
+    handler = LlamaCPPHandler()
+    sample_result_tokens = compact_result(
+        SAMPLE_RESULT, count_tokens=lambda text: len(tokenize(text)),
+        token_budget=handler.result_token_budget,
+    )["tokens"]
+
+    floor = 0
+    for stage, prompt in stage_prompts:
+        needed = len(tokenize(prompt)) + STAGE_CONFIGS[stage].max_tokens
+        if stage == "interpret":
+            needed += max(0, handler.result_token_budget - sample_result_tokens)
+        floor = max(floor, needed)
+    return floor
+
+
+def expected_latency_s(row, mean_prompt_tokens, expected_completion):
+    if not row["prompt_eval_tok_s"] or not row["generation_tok_s"]:
+        return float("inf")
+    return mean_prompt_tokens / row["prompt_eval_tok_s"] + expected_completion / row["generation_tok_s"]
+
+
+# ---------------------------------------------------------
+#                       SEARCH
+# ---------------------------------------------------------
+
+def run_search(args, info, prompt_tokens, min_ctx=0):
+    threads = args.threads or thread_candidates(info)
+    batches = args.batch_sizes
+    longest = max(len(t) for t in prompt_tokens)
+    # Contexts smaller than the runtime floor would truncate real prompts,
+    # however fast they benchmark
+    needed = max(longest + max(args.gen_tokens, args.expected_completion), min_ctx)
+    contexts = [c for c in sorted(args.context_sizes) if c >= needed] or [max(args.context_sizes)]
+
+    def run(n_threads, n_batch, n_ctx):
+        params = {
+            "n_threads": n_threads,
+            "n_threads_batch": n_threads,
+            "n_batch": n_batch,
+            "n_ubatch": n_batch,
+            "n_ctx": n_ctx,
+            "use_mmap": True,
+        }
+        row = measure(args.model, params, prompt_tokens, args.gen_tokens)
+        print(
+            f"threads={n_threads:>3} batch={n_batch:>5} ctx={n_ctx:>6} | "
+            f"prompt {row['prompt_eval_tok_s']:>8.1f} tok/s | gen {row['generation_tok_s']:>6.2f} tok/s"
+        )
+        return row
+
+    if args.full_grid:
+        return [run(t, b, c) for t, b, c in itertools.product(threads, batches, contexts)]
+
+    # Staged search: threads -> batch size -> context size
+    default_batch = 512 if 512 in batches else batches[0]
+    rows = [run(t, default_batch, contexts[0]) for t in threads]
+    best_pe_threads = max(rows, key=lambda r: r["prompt_eval_tok_s"])["params"]["n_threads"]
+
+    rows += [run(best_pe_threads, b, contexts[0]) for b in batches if b != default_batch]
+    best_batch = max(
+        (r for r in rows if r["params"]["n_threads"] == best_pe_threads),
+        key=lambda r: r["prompt_eval_tok_s"],
+    )["params"]["n_batch"]
+
+    rows += [run(best_pe_threads, best_batch, c) for c in contexts[1:]]
+    return rows
+
+
+def build_profile(args, info, rows, prompt_tokens, min_ctx=0):
+    mean_prompt = sum(len(t) for t in prompt_tokens) / len(prompt_tokens)
+    reasoning = []
+
+    best_pe = max(rows, key=lambda r: r["prompt_eval_tok_s"])
+    best_gen = max(rows, key=lambda r: r["generation_tok_s"])
+    latency = lambda r: expected_latency_s(r, mean_prompt, args.expected_completion)
+    fastest = min(latency(r) for r in rows)
+    # Within measurement noise (3%), prefer the smaller context: less KV memory
+    best_overall = min(
+        (r for r in rows if latency(r) <= fastest * 1.03),
+        key=lambda r: (r["params"]["n_ctx"], latency(r)),
+    )
+
+    n_threads_batch = best_pe["params"]["n_threads"]
+    n_threads = best_gen["params"]["n_threads"]
+    n_batch = best_overall["params"]["n_batch"]
+    n_ctx = best_overall["params"]["n_ctx"]
+
+    reasoning.append(
+        f"Prompt evaluation peaked at {best_pe['prompt_eval_tok_s']} tok/s with "
+        f"{n_threads_batch} threads; it is compute-bound and uses n_threads_batch."
+    )
+    reasoning.append(
+        f"Generation peaked at {best_gen['generation_tok_s']} tok/s with {n_threads} threads; "
+        f"decoding is memory-bandwidth-bound, so more threads stop helping."
+    )
+    reasoning.append(
+        f"Batch size {n_batch} and context {n_ctx} minimise the expected latency of a "
+        f"{mean_prompt:.0f}-token prompt plus {args.expected_completion} generated tokens "
+        f"({latency(best_overall):.2f}s; smaller contexts preferred within 3% of the fastest)."
+    )
+    reasoning.append(
+        f"Contexts below {min_ctx} tokens were not considered: the longest runtime prompt "
+        f"(an interpreter prompt with a full result budget) plus its max_tokens needs that much."
+        + ("" if n_ctx >= min_ctx else f" None of --context-sizes fits; {n_ctx} will truncate such prompts.")
+    )
+
+    # Cores beyond what decoding can use serve concurrent users instead.
+    # Derived from the core count, not measured: every benchmark above ran
+    # one model at a time.
+    logical = info["logical_cores"]
+    workers = args.workers or max(1, logical // max(n_threads, 1))
+    workers_source = "forced" if args.workers else "derived"
+    if workers > 1:
+        threads_total = workers * n_threads
+        n_threads_batch = n_threads
+        reasoning.append(
+            f"{logical} cores fit {workers} workers of {n_threads} threads each; every worker "
+            f"uses its share for prompt evaluation too so the pool never oversubscribes."
+        )
+        if workers_source == "derived":
+            reasoning.append(
+                f"The worker count is derived from the core count, not measured. Concurrent "
+                f"workers share memory bandwidth, so each decodes slower than the single-model "
+                f"{best_gen['generation_tok_s']} tok/s above."
+            )
+    else:
+        threads_total = max(n_threads, n_threads_batch)
+        reasoning.append("A single worker gets the whole thread budget.")
+
+    model_size = os.path.getsize(args.model)
+    available = info["available_ram_bytes"]
+    use_mlock = bool(available and available > 2 * model_size)
+    reasoning.append(
+        "use_mmap=True: workers share one page-cached copy of the weights and restarts skip reloading."
+    )
+    reasoning.append(
+        f"use_mlock={use_mlock}: "
+        + ("enough free RAM to pin the weights and avoid page-outs under load."
+           if use_mlock else "not enough free RAM (or unknown) to pin the weights safely.")
+    )
+
+    affinity = workers > 1
+    reasoning.append(
+        f"affinity={affinity}: "
+        + ("each worker is pinned to its own cores so workers do not migrate onto each other."
+           if affinity else "one worker, so the OS scheduler is left alone.")
+    )
+
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        **info,
+        "model_path": os.path.abspath(args.model),
+        "model": {
+            "n_threads": n_threads,
+            "n_threads_batch": n_threads_batch,
+            "n_batch": n_batch,
+            "n_ubatch": n_batch,
+            "n_ctx": n_ctx,
+            "use_mmap": True,
+            "use_mlock": use_mlock,
+        },
+        "workers": workers,
+        "workers_source": workers_source,
+        "min_context": min_ctx,
+        "threads_total": threads_total,
+        "affinity": affinity,
+        "reasoning": reasoning,
+        "measurements": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("LLAMA_MODEL_PATH", "models/gemma.gguf"))
+    parser.add_argument("--out", default=DEFAULT_PROFILE_PATH)
+    parser.add_argument("--threads", type=int, nargs="+", help="Thread counts to try (default: derived from the host)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[128, 256, 512, 1024])
+    parser.add_argument("--context-sizes", type=int, nargs="+", default=[2048, 4096, 8192])
+    parser.add_argument("--gen-tokens", type=int, default=64, help="Tokens generated per prompt when timing decoding")
+    parser.add_argument("--expected-completion", type=int, default=200, help="Typical completion length to optimise for")
+    parser.add_argument("--workers", type=int, help="Force the worker count instead of deriving it")
+    parser.add_argument("--full-grid", action="store_true")
+    args = parser.parse_args()
+
+    info = host_info()
+    print(f"Tuning {args.model} on {info['host']} ({info['logical_cores']} logical / {info['physical_cores']} physical cores)")
+
+    # Tokenize once with a throwaway vocab-only load
+    vocab = Llama(model_path=args.model, vocab_only=True, verbose=False)
+    stage_prompts = benchmark_prompts()
+    tokenize = lambda text: vocab.tokenize(text.encode("utf-8"))
+    prompt_tokens = [tokenize(p) for _, p in stage_prompts]
+    min_ctx = context_floor(stage_prompts, tokenize)
+    vocab.close()
+
+    rows = run_search(args, info, prompt_tokens, min_ctx)
+    profile = build_profile(args, info, rows, prompt_tokens, min_ctx)
+    path = save_profile(profile, args.out)
+
+    print()
+    for line in profile["reasoning"]:
+        print(" -", line)
+    print(f"\nProfile written to {path}")
+
+
+if __name__ == "__main__":
+    main()
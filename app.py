@@ -12,7 +12,17 @@ import pandas as pd
 # Project module imports (assumes packages exist with __init__.py)
 from ExecutorEngine.executor import SQLExecutor
 from LLMEngine.Ollama_Handler import OllamaHandler
+from LLMEngine.local_summarizer import interpret_stream
+from LLMEngine.sql_repair import generate_verified_SQL
+from LLMEngine.sql_candidates import generate_best_SQL
+from LLMEngine.intent_router import route_question
+from LLMEngine.sql_grounding import ground_literals
+from LLMEngine.backend_router import load_router
+from LLMEngine.llm_metrics import load_metrics, metrics_path, stage_summary, bottleneck
 from InvoiceEngine.Invoicer import Invoicer
+from DatabaseEngine.embeddings import model_stats
+from DatabaseEngine.value_dictionary import build_session_dictionary
+from DatabaseEngine.DB_Handler import best_entity_value
 
 # Optional PDF conversion (docx -> pdf). If not present, app will continue.
 try:
@@ -59,21 +69,28 @@ def create_duckdb_from_csv(session_path, csv_path):
     # Create sample_table
     conn.execute(f"CREATE TABLE sample_table AS SELECT * FROM read_csv_auto('{csv_path}')")
     conn.close()
+    # Distinct values for fuzzy matching, built once per upload
+    build_session_dictionary(os.path.basename(session_path), os.path.dirname(session_path))
     return db_path
 
 
-def run_sql_and_interpret(session_id, sql_query, original_user_question=None):
+def run_sql_and_interpret(session_id, sql_query, original_user_question=None, params=None):
     executor = SQLExecutor()
-    executor_result = executor.execute(session_id, sql_query)
+    executor_result = executor.execute(session_id, sql_query, params)
     # Display result table if success
     if executor_result["success"]:
         df = pd.DataFrame(executor_result["rows"], columns=executor_result["columns"])
     else:
         df = None
 
-    # Interpret using Ollama
-    handler = OllamaHandler()
-    interpretation = handler.interpret_response(executor_result, original_user_question or sql_query)
+    # Interpret the result. Trivial results (scalars, empty sets, obvious
+    # errors) are summarized locally; the rest goes to the LLM. This is a
+    # lazy token stream: nothing is generated until the page renders it
+    # with st.write_stream.
+    # Multi-backend router when llm_backends.json exists, else the local backend
+    handler = load_router() or OllamaHandler()
+    interpretation = interpret_stream(handler, executor_result, original_user_question or sql_query,
+                                      session_id=session_id)
 
     return executor_result, df, interpretation
 
@@ -117,7 +134,7 @@ def safe_convert_to_pdf(input_docx, output_pdf):
 # UI: Navigation
 # -------------------------
 st.title("Invoice & Query Manager")
-page = st.sidebar.selectbox("Select Page", ["Home / Upload & Query", "Invoice Generator", "Sessions"])
+page = st.sidebar.selectbox("Select Page", ["Home / Upload & Query", "Invoice Generator", "Sessions", "Diagnostics"])
 
 # -------------------------
 # PAGE: Home / Upload & Query
@@ -173,10 +190,15 @@ if page == "Home / Upload & Query":
     # -------------------------
     st.markdown("---")
     st.header("Ask a question or enter SQL")
-    handler = OllamaHandler()  # local instance
+    handler = load_router() or OllamaHandler()  # router if configured, else local instance
 
     question = st.text_input("Enter natural language question (optional). If left empty, enter raw SQL below.")
     raw_sql = st.text_area("Enter raw SQL (optional). If you provided a question, the model will generate SQL.")
+    n_best = st.checkbox(
+        "Generate several SQL candidates and pick by agreement (for ambiguous questions)",
+        help="Asks the model at several temperatures in parallel, runs every candidate "
+             "read-only and keeps the answer most candidates agree on.",
+    )
 
     if st.button("Run Query"):
         sid = st.session_state.get("active_session")
@@ -184,15 +206,57 @@ if page == "Home / Upload & Query":
             st.error("No active session. Please upload a CSV first.")
         else:
             # decide SQL source
+            sql_params = None
+            # Common questions are answered from a SQL template, no LLM call
+            routed = route_question(question, sid) if question.strip() and not raw_sql.strip() else None
+
             if raw_sql.strip():
                 sql_to_run = raw_sql.strip()
                 original_question = raw_sql.strip()
+            elif routed:
+                original_question = question
+                sql_to_run = routed["sql"]
+                sql_params = routed["params"]
+                st.caption(f"Answered from the '{routed['intent']}' template "
+                           f"(similarity {routed['similarity']:.2f}), parameters: {sql_params}")
+            elif question.strip() and n_best:
+                original_question = question
+                try:
+                    best = generate_best_SQL(
+                        [(handler, 0.0), (handler, 0.4), (handler, 0.8)],
+                        question, sid, budget_s=30.0,
+                    )
+                    st.caption(
+                        f"{best['agreement']} of {len(best['candidates'])} finished candidates agree "
+                        f"({best['elapsed_ms'] / 1000:.1f}s"
+                        + (", latency budget reached)" if best["timed_out"] else ")")
+                    )
+                    sql_to_run = best["sql"]
+                    if not sql_to_run:
+                        st.error("None of the generated SQL candidates is valid.")
+                except Exception as e:
+                    st.error(f"LLM failed to generate SQL: {e}")
+                    sql_to_run = None
             elif question.strip():
                 # call LLM to generate SQL
                 try:
-                    # generate_SQL handles streaming; returns cleaned SQL
-                    sql_to_run = handler.generate_SQL(question)
+                    # Generate, dry-run (EXPLAIN) and repair a bounded number of times
+                    generation = generate_verified_SQL(handler, question, sid)
                     original_question = question
+
+                    with st.expander(f"SQL attempts ({len(generation['attempts'])})"):
+                        for a in generation["attempts"]:
+                            status = "ok" if a["success"] else a["error_type"]
+                            st.write(f"{a['kind']} #{a['attempt']}: {status} "
+                                     f"(LLM {a['llm_ms']:.0f} ms, dry-run {a['dry_run_ms']:.0f} ms)")
+
+                    if generation["verified"]:
+                        sql_to_run = generation["sql"]
+                    else:
+                        # Don't run (or interpret) SQL that can't even be planned
+                        st.code(generation["sql"])
+                        st.error(f"Generated SQL could not be repaired: {generation['error']}")
+                        sql_to_run = None
                 except Exception as e:
                     st.error(f"LLM failed to generate SQL: {e}")
                     sql_to_run = None
@@ -202,13 +266,21 @@ if page == "Home / Upload & Query":
                 sql_to_run = None
                 original_question = None
 
+            if sql_to_run and question.strip() and not raw_sql.strip() and not routed:
+                # Snap misspelled names in generated SQL to real values
+                grounded = ground_literals(sql_to_run, sid)
+                sql_to_run = grounded["sql"]
+                for sub in grounded["substitutions"]:
+                    st.info(f"{sub['column']}: '{sub['original']}' -> '{sub['replacement']}' "
+                            f"(match score {sub['score']:.0f})")
+
             if sql_to_run:
                 st.subheader("Generated SQL")
                 st.code(sql_to_run)
 
                 # Execute + interpret
                 with st.spinner("Executing query..."):
-                    exec_res, df_result, interp = run_sql_and_interpret(sid, sql_to_run, original_question)
+                    exec_res, df_result, interp = run_sql_and_interpret(sid, sql_to_run, original_question, sql_params)
 
                 if exec_res["success"]:
                     st.subheader("Query Result (first 1000 rows)")
@@ -217,7 +289,7 @@ if page == "Home / Upload & Query":
                     st.error(f"Query execution failed: {exec_res['error']}")
 
                 st.subheader("Interpretation")
-                st.markdown(interp)
+                st.write_stream(interp)
 
 # -------------------------
 # PAGE: Invoice Generator
@@ -440,12 +512,11 @@ elif page == "Invoice Generator":
     if resource_choice != "-- choose --":
         final_resource = resource_choice
     elif resource_fuzzy:
-        from rapidfuzz import process, fuzz
-
-        best = process.extractOne(resource_fuzzy, full_resources, scorer=fuzz.WRatio)
-        if best:
-            final_resource = best[0]
-            st.success(f"Fuzzy matched Resource → {final_resource} (score={best[1]})")
+        # Vector search once the session's index is built (started here in
+        # the background), fuzzy matching until then
+        final_resource, match_score = best_entity_value(sid, resource_fuzzy, "resource", "Resource Name")
+        if final_resource:
+            st.success(f"Matched Resource → {final_resource} ({match_score})")
 
     if not final_resource:
         st.stop()
@@ -485,12 +556,11 @@ elif page == "Invoice Generator":
     if project_choice != "-- choose --":
         final_project = project_choice
     elif project_fuzzy:
-        from rapidfuzz import process, fuzz
-
-        best = process.extractOne(project_fuzzy, filtered_projects, scorer=fuzz.WRatio)
-        if best:
-            final_project = best[0]
-            st.success(f"Fuzzy matched Project → {final_project} (score={best[1]})")
+        # Only the projects the chosen resource has rows in
+        final_project, match_score = best_entity_value(sid, project_fuzzy, "project", "Project Name",
+                                                       filters={"Resource Name": final_resource})
+        if final_project:
+            st.success(f"Matched Project → {final_project} ({match_score})")
 
     if not final_project:
         st.stop()
@@ -638,3 +708,64 @@ elif page == "Sessions":
                         st.error(f"Failed preview: {e}")
                 else:
                     st.info("No CSV in this session.")
+
+# -------------------------
+# PAGE: Diagnostics (LLM timings per session)
+# -------------------------
+elif page == "Diagnostics":
+    st.header("LLM Diagnostics")
+
+    sessions = sorted(
+        d for d in os.listdir(BASE_DATA_PATH)
+        if os.path.exists(metrics_path(d, BASE_DATA_PATH))
+    )
+    if not sessions:
+        st.info("No LLM calls recorded yet. Ask a question on the Home page first.")
+        st.stop()
+
+    active = st.session_state.get("active_session")
+    chosen = st.selectbox(
+        "Select session",
+        sessions,
+        index=sessions.index(active) if active in sessions else 0,
+        key="diagnostics_session"
+    )
+    records = load_metrics(chosen, BASE_DATA_PATH)
+
+    # -------------------------
+    # Per-stage percentiles
+    # -------------------------
+    st.subheader("Per-stage latency and tokens (p50 / p95)")
+    summary = stage_summary(records)
+    summary_df = pd.DataFrame(summary)
+    summary_df["bottleneck"] = [bottleneck(r) for r in summary]
+    st.dataframe(summary_df)
+    st.caption(
+        "bottleneck = prompt size when prompt evaluation takes longer than decoding "
+        "(shrink the prompt), decode speed otherwise (fewer output tokens or a faster backend)."
+    )
+
+    router = load_router()
+    if router is not None:
+        st.subheader("Backends")
+        st.dataframe(pd.DataFrame(router.summary()))
+
+    embedding_models = model_stats()
+    if embedding_models:
+        st.subheader("Embedding models (loaded once per process)")
+        st.dataframe(pd.DataFrame(embedding_models))
+
+    # -------------------------
+    # Raw calls + export
+    # -------------------------
+    st.subheader("Recent calls")
+    calls_df = pd.DataFrame(records)
+    st.dataframe(calls_df.tail(200))
+
+    with open(metrics_path(chosen, BASE_DATA_PATH), "rb") as f:
+        st.download_button("Export metrics (JSONL)", f.read(), file_name=f"llm_metrics_{chosen}.jsonl")
+    st.download_button(
+        "Export metrics (CSV)",
+        calls_df.to_csv(index=False),
+        file_name=f"llm_metrics_{chosen}.csv"
+    )
@@ -38,9 +38,11 @@ from jinja2 import Template
 
 # chromadb imports
 import chromadb
-from chromadb import Settings
 
-from sentence_transformers import SentenceTransformer
+from DatabaseEngine.embeddings import get_model
+from DatabaseEngine.entity_index import entity_documents, scope_entity_ids, scope_filter
+from DatabaseEngine.index_jobs import ensure_index, invalidate
+from rapidfuzz import process, fuzz
 
 # ------------------ Configuration ------------------
 BASE_FOLDER = os.path.abspath("Databases File")
@@ -48,6 +50,7 @@ DUCKDB_PATH = os.path.join(BASE_FOLDER, "data.duckdb")
 CHROMA_PERSIST_DIR = os.path.join(BASE_FOLDER, "chroma")
 INVOICE_FOLDER = os.path.join(BASE_FOLDER, "invoices")
 NAMES_COLLECTION = "resources"
+INDEX_KEY = "main:resources"
 
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/chat")
 MODEL_NAME = os.environ.get("OLLAMA_MODEL", "gpt-oss")
@@ -138,6 +141,7 @@ def reset_all_data():
         shutil.rmtree(BASE_FOLDER)
 
     ensure_folders()
+    invalidate(INDEX_KEY, CHROMA_PERSIST_DIR)
 
 
 def save_csv_to_duckdb(df: pd.DataFrame) -> None:
@@ -194,62 +198,42 @@ def save_csv_to_duckdb(df: pd.DataFrame) -> None:
 # ----------- Chroma setup & embeddings -----------
 
 class ChromaWrapper:
-    def __init__(self, persist_directory: str = CHROMA_PERSIST_DIR):
-        self.client = chromadb.Client(
-            Settings(persist_directory=persist_directory)
-        )
+    def __init__(self, persist_directory: str = CHROMA_PERSIST_DIR, reset: bool = False):
+        # chromadb.Client(Settings(persist_directory=...)) is in-memory on
+        # chromadb >= 0.4; the index has to survive restarts, since its
+        # persisted "ready" status does
+        self.client = chromadb.PersistentClient(path=persist_directory)
+
+        # Shared process-wide model; only the first wrapper pays the load
+        self.embedder = get_model(EMBED_MODEL_NAME)
 
-        self.embedder = SentenceTransformer(EMBED_MODEL_NAME)
+        if reset:
+            try:
+                self.client.delete_collection(name=NAMES_COLLECTION)
+            except Exception:
+                pass
 
         try:
             self.col = self.client.get_collection(name=NAMES_COLLECTION)
         except Exception:
             self.col = self.client.create_collection(name=NAMES_COLLECTION)
 
+    def count(self) -> int:
+        return self.col.count()
+
     def _embed(self, texts: List[str]):
-        vecs = self.embedder.encode(texts, convert_to_numpy=True).tolist()
+        # Resource documents repeat across uploads; reuse cached vectors
+        vecs = self.embedder.encode(texts, normalize=False, cache=True).tolist()
         return vecs
 
-    def ingest_resources_from_df(self, df: pd.DataFrame):
-        docs = []
-        metadatas = []
-        ids = []
-
-        seen = set()  
-
-        for idx, row in df.iterrows():
-            rid_raw = str(row.get("Resource ID", "")).strip()
-
-            # ✅ Make ID globally unique per row
-            unique_id = f"{rid_raw}__{idx}"
-
-            if unique_id in seen:
-                continue
-            seen.add(unique_id)
-
-            name = str(row.get("Resource Name", "")).strip()
-            project = str(row.get("Project Name", "")).strip()
-
-            doc_text = (
-                f"Resource:{name} | "
-                f"ResourceID:{rid_raw} | "
-                f"Project:{project} | "
-                f"Manager:{row.get('Project Manager','')}"
-            )
-
-            docs.append(doc_text)
-
-            metadatas.append({
-                "Resource ID": rid_raw,   # ✅ ORIGINAL ID preserved in metadata
-                "Resource Name": name,
-                "Project Name": project,
-                "Project ID": str(row.get("Project ID", ""))
-            })
-
-            ids.append(unique_id)  # ✅ UNIQUE VECTOR ID
+    def ingest_resources(self, con, table: str = TABLE_NAME) -> int:
+        # One vector per distinct resource (aggregated in DuckDB), not per
+        # timesheet row; metadata keeps Resource ID/Name and the resource's
+        # main project for the invoice flow
+        ids, docs, metadatas = entity_documents(con, table=table, kinds=("resource",))
 
         if not docs:
-            return
+            return 0
 
         embeddings = self._embed(docs)
 
@@ -259,22 +243,84 @@ class ChromaWrapper:
             ids=ids,
             embeddings=embeddings
         )
+        return len(ids)
+
+    def ingest_resources_from_df(self, df: pd.DataFrame) -> int:
+        con = duckdb.connect()
+        try:
+            con.register("df_view", df)
+            return self.ingest_resources(con, table="df_view")
+        finally:
+            con.close()
+
 
+    def query(self, text: str, n_results: int = 5, where: Optional[Dict[str, Any]] = None):
+        return self.query_many([text], n_results=n_results, where=where)[0]
 
-    def query(self, text: str, n_results: int = 5):
+    def query_many(self, texts: List[str], n_results: int = 5, where: Optional[Dict[str, Any]] = None):
+        """where: Chroma metadata filter, applied inside the index search."""
+        if not texts:
+            return []
+
+        # Embed with the same model as ingest (not the collection's default
+        # embedding function); repeated queries come from the LRU cache
+        query_embeddings = self.embedder.encode_queries(texts, normalize=False).tolist()
         results = self.col.query(
-            query_texts=[text],
-            n_results=n_results
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where or None
         )
 
-        hits = []
-        for i, _id in enumerate(results.get("ids", [[]])[0]):
-            meta = results.get("metadatas", [[]])[0][i]
-            dist = results.get("distances", [[]])[0][i] if "distances" in results else None
-            hits.append({"id": _id, "meta": meta, "distance": dist})
+        all_hits = []
+        for q in range(len(texts)):
+            hits = []
+            for i, _id in enumerate(results.get("ids", [])[q]):
+                meta = results.get("metadatas", [])[q][i]
+                dist = results["distances"][q][i] if results.get("distances") else None
+                hits.append({"id": _id, "meta": meta, "distance": dist})
+            all_hits.append(hits)
+
+        return all_hits
+
+
+
+def build_resource_index() -> int:
+    """Background job: rebuild the resource index from DuckDB."""
+    con = duckdb.connect(DUCKDB_PATH)
+    try:
+        return ChromaWrapper(reset=True).ingest_resources(con)
+    finally:
+        con.close()
+
+
+def resource_scope(filters: Dict[str, Any]) -> Optional[List[str]]:
+    """Ids of the resources with rows matching filters (None = no filters)."""
+    filters = {col: value for col, value in filters.items() if value}
+    if not filters:
+        return None
+    con = duckdb.connect(DUCKDB_PATH)
+    try:
+        return scope_entity_ids(con, filters, table=TABLE_NAME, kinds=("resource",))
+    finally:
+        con.close()
+
 
-        return hits
+def fuzzy_resource_hits(text: str, n_results: int = 5, scope: Optional[List[str]] = None):
+    """Resource lookup by rapidfuzz, used until the vector index is ready."""
+    con = duckdb.connect(DUCKDB_PATH)
+    try:
+        ids, _, metadatas = entity_documents(con, table=TABLE_NAME, kinds=("resource",))
+    finally:
+        con.close()
+
+    if scope is not None:
+        allowed = set(scope)
+        kept = [i for i, entity_id in enumerate(ids) if entity_id in allowed]
+        ids, metadatas = [ids[i] for i in kept], [metadatas[i] for i in kept]
 
+    choices = [f"{m['Resource Name']} {m['Resource ID']}" for m in metadatas]
+    matches = process.extract(text, choices, scorer=fuzz.WRatio, limit=n_results)
+    return [{"id": ids[i], "meta": metadatas[i], "score": score} for _, score, i in matches]
 
 
 # ------------------ Ollama interaction ------------------
@@ -354,12 +400,9 @@ st.set_page_config(page_title="Invoice Generator + NL→SQL", layout="wide")
 st.title("Invoice Generator + NL→SQL (Ollama + DuckDB + Chroma)")
 
 ensure_folders()
+# Created on the first lookup once the index is ready, so the embedding
+# model isn't loaded for sessions that never search
 chroma_wrapper: Optional[ChromaWrapper] = None
-if os.path.exists(CHROMA_PERSIST_DIR):
-    try:
-        chroma_wrapper = ChromaWrapper()
-    except Exception:
-        chroma_wrapper = None
 
 # Sidebar controls
 with st.sidebar:
@@ -404,15 +447,10 @@ if uploaded is not None:
     except Exception as e:
         st.error(f"Failed to write DuckDB: {e}")
         st.stop()
-    # Build chroma index
-    try:
-        cw = ChromaWrapper()
-        cw.ingest_resources_from_df(df)
-        chroma_wrapper = cw
-        log(f"Built/updated Chroma DB at {CHROMA_PERSIST_DIR} with {df.shape[0]} resources")
-    except Exception as e:
-        st.error(f"Failed to build Chroma index: {e}")
-        chroma_wrapper = None
+    # The Chroma index is rebuilt in the background on the next resource
+    # lookup; SQL queries don't wait for embeddings
+    invalidate(INDEX_KEY, CHROMA_PERSIST_DIR)
+    log(f"Chroma index at {CHROMA_PERSIST_DIR} marked for rebuild on next resource lookup")
 
 # Main columns
 col1, col2 = st.columns([1,2])
@@ -463,19 +501,47 @@ with col2:
     st.subheader("Invoice generation")
     st.markdown("Generate invoice for a resource by Resource ID or Resource Name. The system will try to fetch metadata from DB and will ask clarifying questions (human-in-loop).")
     resource_query = st.text_input("Enter Resource ID or Resource Name to find")
+    scope_project = st.text_input("Limit to Project ID(s) (optional, comma-separated)")
+    scope_period = st.text_input("Limit to Financial Period(s) (optional, comma-separated)")
     if st.button("Find resource"):
-        if chroma_wrapper is None:
-            st.warning("No Chroma index available. Upload CSV first.")
+        if not os.path.exists(DUCKDB_PATH):
+            st.warning("No data available. Upload CSV first.")
         elif not resource_query.strip():
             st.warning("Enter a Resource ID or name to search")
         else:
-            hits = chroma_wrapper.query(resource_query, n_results=5)
+            # Only resources with rows in the chosen projects/periods are searched
+            scope = resource_scope({
+                "Project ID": [p.strip() for p in scope_project.split(",") if p.strip()],
+                "Financial Period (Posted Date)": [p.strip() for p in scope_period.split(",") if p.strip()],
+            })
+            index = ensure_index(INDEX_KEY, build_resource_index, CHROMA_PERSIST_DIR)
+            if scope == []:
+                hits = []
+            elif index["state"] == "ready":
+                chroma_wrapper = chroma_wrapper or ChromaWrapper()
+                if chroma_wrapper.count() or not index.get("documents"):
+                    hits = chroma_wrapper.query(resource_query, n_results=5,
+                                                where=scope_filter(scope) if scope else None)
+                else:
+                    # Status says ready but the collection is empty (deleted,
+                    # or written by an in-memory client): rebuild it
+                    chroma_wrapper = None
+                    invalidate(INDEX_KEY, CHROMA_PERSIST_DIR)
+                    ensure_index(INDEX_KEY, build_resource_index, CHROMA_PERSIST_DIR)
+                    st.info("Vector index missing on disk; rebuilding, showing fuzzy matches meanwhile.")
+                    hits = fuzzy_resource_hits(resource_query, n_results=5, scope=scope)
+            else:
+                st.info(f"Vector index {index['state']}; showing fuzzy matches meanwhile.")
+                hits = fuzzy_resource_hits(resource_query, n_results=5, scope=scope)
             if not hits:
-                st.info("No matches found in vector DB.")
+                st.info("No matches found.")
             else:
                 st.write("Top matches:")
                 for i, h in enumerate(hits):
-                    st.write(i+1, h['meta'], f"score:{h.get('distance')}")
+                    if "score" in h:
+                        st.write(i+1, h['meta'], f"fuzzy score:{h['score']:.0f}")
+                    else:
+                        st.write(i+1, h['meta'], f"distance:{h.get('distance')}")
                 sel = st.number_input("Select rank to use (1..5)", min_value=1, max_value=len(hits), value=1)
                 chosen = hits[sel-1]
                 st.markdown("**Chosen resource metadata:**")